@@ -6,14 +6,21 @@ import os
 from datetime import timedelta
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from middleware import access_log
+
+# Configure logging before the routes' modules start logging
+access_log.configure_logging()
 logger = logging.getLogger(__name__)
 
 # Import routes
 from routes.auth import auth_bp
 from routes.queries import queries_bp
 from routes.schema import schema_bp
+from routes.jobs import jobs_bp
+from middleware.compression import compress_response
+from db.db import pool_stats
+from utils.redis_client import redis_client
+from utils import tiered_cache
 
 # Load environment variables
 load_dotenv()
@@ -42,6 +49,7 @@ CORS(app,
              "Accept", 
              "Origin", 
              "X-Requested-With",
+             "If-None-Match",
              "Access-Control-Allow-Origin",
              "Access-Control-Allow-Headers",
              "Access-Control-Allow-Methods",
@@ -50,6 +58,13 @@ CORS(app,
          "expose_headers": [
              "Content-Type", 
              "Authorization",
+             "X-Cache",
+             "X-Cache-Fingerprint",
+             "X-Query-Coalesced",
+             "X-Query-Run-Id",
+             "X-Query-Auto-Limit",
+             "ETag",
+             "Retry-After",
              "Access-Control-Allow-Origin",
              "Access-Control-Allow-Headers",
              "Access-Control-Allow-Methods",
@@ -59,13 +74,9 @@ CORS(app,
          "max_age": 3600
      }})
 
-# Add request logging middleware
-@app.before_request
-def log_request_info():
-    logger.debug('Headers: %s', request.headers)
-    logger.debug('Body: %s', request.get_data())
-    logger.debug('Origin: %s', request.headers.get('Origin'))
-    logger.debug('Method: %s', request.method)
+# Sampled, structured access logs; registered first so they run after every other after_request hook
+app.before_request(access_log.start_timer)
+app.after_request(access_log.log_access)
 
 @app.after_request
 def add_cors_headers(response):
@@ -77,6 +88,9 @@ def add_cors_headers(response):
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, Origin, X-Requested-With, Access-Control-Allow-Origin, Access-Control-Allow-Headers, Access-Control-Allow-Methods, Access-Control-Allow-Credentials'
     return response
 
+# Compress JSON, NDJSON and CSV bodies per Accept-Encoding (gzip, br, zstd)
+app.after_request(compress_response)
+
 # Configure Swagger
 swagger_config = {
     "headers": [],
@@ -107,6 +121,7 @@ swagger = Swagger(app, config=swagger_config, template=swagger_template)
 app.register_blueprint(auth_bp, url_prefix="/api/auth")
 app.register_blueprint(queries_bp, url_prefix="/api/queries")
 app.register_blueprint(schema_bp, url_prefix="/api/schema")
+app.register_blueprint(jobs_bp, url_prefix="/api/jobs")
 
 # Root health check
 @app.route("/", methods=["GET"])
@@ -121,7 +136,7 @@ def health_check():
 # API health check endpoint  
 @app.route('/api/health', methods=["GET"])
 def api_health_check():
-    return jsonify({"status": "healthy", "message": "API is running", "endpoints": ["/api/auth", "/api/queries", "/api/schema"]}), 200
+    return jsonify({"status": "healthy", "message": "API is running", "endpoints": ["/api/auth", "/api/queries", "/api/schema", "/api/jobs"], "databasePool": pool_stats(), "redis": redis_client.health(), "caches": tiered_cache.stats(), "logging": access_log.stats()}), 200
 
 # Debug endpoint to show all routes (useful for troubleshooting)
 @app.route('/api/routes', methods=["GET"])
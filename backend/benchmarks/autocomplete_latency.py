@@ -0,0 +1,99 @@
+"""Completion latency over a large synthetic schema
+
+Builds the completion index from a fake schema catalog of --tables tables
+with --columns columns each (100k identifiers by default), then times
+complete() for a mix of short, long, segment and unmatched prefixes and
+reports latency percentiles. The target is a p99 under 1 ms. The build and
+an incremental one-table update are timed too.
+
+    python benchmarks/autocomplete_latency.py --tables 5000 --columns 20
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import autocomplete, schema_catalog
+
+WORDS = (
+    'order', 'customer', 'invoice', 'payment', 'product', 'account', 'shipment', 'event', 'session', 'user',
+    'region', 'store', 'item', 'price', 'status', 'created', 'updated', 'total', 'amount', 'code',
+)
+
+FUNCTIONS = ('count', 'sum', 'avg', 'min', 'max', 'coalesce', 'date_trunc', 'to_char', 'lower', 'upper')
+
+def make_catalog(tables, columns, version='1'):
+    rng = random.Random(42)
+    catalog = {}
+    for t in range(tables):
+        name = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{t}"
+        catalog[name] = {
+            'name': name,
+            'estimatedRows': 0,
+            # Distinct column names, the worst case for the index size
+            'columns': [
+                {'column_name': f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{t * columns + c}"} for c in range(columns)
+            ],
+        }
+    return {'version': version, 'tables': catalog}
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tables', type=int, default=5000)
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--limit', type=int, default=autocomplete.COMPLETE_DEFAULT_LIMIT)
+    args = parser.parse_args()
+
+    current = make_catalog(args.tables, args.columns)
+    schema_catalog.get_catalog = lambda: current
+    schema_catalog.get_table = lambda name: current['tables'].get(name)
+    autocomplete.query = lambda sql: [{'name': name} for name in FUNCTIONS]
+
+    started = time.perf_counter()
+    index = autocomplete._sync()
+    print(f"Built index of {len(index.names)} names, {len(index.segments)} segments "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    # One table added by DDL, the common case after the first build
+    tables = dict(current['tables'])
+    tables['late_arrivals'] = {'name': 'late_arrivals', 'estimatedRows': 0, 'columns': [{'column_name': 'arrived_at'}]}
+    current = {'version': '2', 'tables': tables}
+    started = time.perf_counter()
+    autocomplete._sync()
+    print(f"Incremental one-table update in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    rng = random.Random(7)
+    table_names = list(tables)
+    prefixes = []
+    for _ in range(args.requests):
+        word = rng.choice(WORDS)
+        prefixes.append(rng.choice((
+            word[:1],
+            word[:3],
+            word,
+            f"{word}_{rng.choice(WORDS)[:2]}",
+            rng.choice(WORDS)[:4],  # matches a later segment too
+            'zzz',
+            f"{rng.choice(table_names)}.{rng.choice(WORDS)[:2]}",
+        )))
+
+    latencies = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        autocomplete.complete(prefix, args.limit)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    print(f"{args.requests} completions, limit {args.limit}: "
+          f"p50 {percentile(latencies, 0.5):.3f} ms  p95 {percentile(latencies, 0.95):.3f} ms  "
+          f"p99 {percentile(latencies, 0.99):.3f} ms  max {max(latencies):.3f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Login throughput versus query latency under mixed load
+
+Runs login clients and query clients side by side against a running backend
+and reports login throughput, how many logins were shed with 503, and query
+latency percentiles. Run it once with logins and once without (--logins 0)
+to see what password hashing costs the query path.
+
+    python benchmarks/login_mixed_load.py --url http://localhost:5000 \
+        --email user@example.com --password secret --logins 8 --queries 4
+"""
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+
+def post(url, body, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    request = urllib.request.Request(url, data=json.dumps(body).encode('utf-8'), headers=headers, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def run(args):
+    credentials = {'email': args.email, 'password': args.password}
+    status, body = post(f'{args.url}/api/auth/login', credentials)
+    if status != 200:
+        raise SystemExit(f'Login failed with {status}: {body[:200]!r}')
+    token = json.loads(body)['token']
+
+    deadline = time.monotonic() + args.duration
+    lock = threading.Lock()
+    logins = {'ok': 0, 'shed': 0, 'failed': 0}
+    login_latencies = []
+    query_latencies = []
+    query_errors = [0]
+
+    def login_client():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            status, _ = post(f'{args.url}/api/auth/login', credentials)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    logins['ok'] += 1
+                    login_latencies.append(elapsed)
+                elif status == 503:
+                    logins['shed'] += 1
+                else:
+                    logins['failed'] += 1
+            if status == 503:
+                time.sleep(0.05)
+
+    def query_client():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            status, _ = post(f'{args.url}/api/queries/execute', {'query': args.sql}, token)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    query_latencies.append(elapsed)
+                else:
+                    query_errors[0] += 1
+
+    threads = [threading.Thread(target=login_client) for _ in range(args.logins)]
+    threads += [threading.Thread(target=query_client) for _ in range(args.queries)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{args.logins} login clients, {args.queries} query clients, {args.duration:.0f} s")
+    print(f"logins: {logins['ok'] / args.duration:.1f}/s ok, {logins['shed']} shed (503), {logins['failed']} failed, "
+          f"p50 {percentile(login_latencies, 0.5) * 1000:.0f} ms, p99 {percentile(login_latencies, 0.99) * 1000:.0f} ms")
+    print(f"queries: {len(query_latencies) / args.duration:.1f}/s, {query_errors[0]} errors, "
+          f"p50 {percentile(query_latencies, 0.5) * 1000:.1f} ms, p95 {percentile(query_latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(query_latencies, 0.99) * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--logins', type=int, default=8, help='concurrent login clients')
+    parser.add_argument('--queries', type=int, default=4, help='concurrent query clients')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--sql', default='SELECT 1', help='query the query clients run')
+    run(parser.parse_args())
@@ -0,0 +1,101 @@
+"""Encode a synthetic wide result with each result encoder and compare throughput
+
+Rows mix the column types Postgres hands back most often: integers, numeric,
+text, timestamps, booleans, floats, UUIDs and NULLs. The baseline is what the
+routes used to do: build a dict per row and run Flask's json.dumps over them.
+The columnar layouts (format=columns, and Arrow IPC when pyarrow is installed)
+are timed too; compare their size with the row-oriented JSON.
+
+    python benchmarks/result_encoding.py --rows 1000000
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import datetime
+from decimal import Decimal
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from utils import result_encoder
+
+Column = namedtuple('Column', ['name', 'type_code', 'precision', 'scale'], defaults=(None, None))
+
+DESCRIPTION = [
+    Column('id', 23),
+    Column('customer_id', 20),
+    Column('amount', 1700, 12, 2),
+    Column('status', 1043),
+    Column('note', 25),
+    Column('created_at', 1184),
+    Column('paid', 16),
+    Column('score', 701),
+    Column('order_uuid', 2950),
+    Column('shipped_on', 1082),
+]
+
+def make_rows(count):
+    base = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    ids = [uuid.uuid4() for _ in range(1000)]
+    return [
+        (
+            i,
+            i * 7919,
+            Decimal(f"{i % 100000}.{i % 100:02d}"),
+            ('pending', 'paid', 'shipped', 'cancelled')[i % 4],
+            None if i % 5 else f"order note {i} with a \"quote\" and ünïcode",
+            base + datetime.timedelta(seconds=i),
+            i % 2 == 0,
+            i / 3.0,
+            ids[i % 1000],
+            None if i % 3 else (base + datetime.timedelta(days=i % 365)).date(),
+        )
+        for i in range(count)
+    ]
+
+def timed(label, fn, rows, baseline=None):
+    started = time.perf_counter()
+    body = fn()
+    elapsed = time.perf_counter() - started
+    speedup = f", {baseline / elapsed:.1f}x" if baseline else ''
+    print(f"{label:<28} {elapsed:7.2f} s  {rows / elapsed / 1000:8.0f}k rows/s  {len(body) / 1e6:7.1f} MB{speedup}")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    print(f"Building {args.rows} rows x {len(DESCRIPTION)} columns...")
+    rows = make_rows(args.rows)
+    names = [column.name for column in DESCRIPTION]
+    app = Flask(__name__)
+
+    def flask_dicts():
+        with app.app_context():
+            return app.json.dumps([dict(zip(names, row)) for row in rows])
+
+    baseline = timed('dicts + Flask json.dumps', flask_dicts, args.rows)
+
+    encoder = result_encoder.RowEncoder(DESCRIPTION)
+    result_encoder.RESULT_ENCODER = 'typed'
+    timed('typed column encoders', lambda: encoder.encode_rows(rows), args.rows, baseline)
+
+    if result_encoder.orjson is not None:
+        result_encoder.RESULT_ENCODER = 'orjson'
+        timed('orjson', lambda: encoder.encode_rows(rows), args.rows, baseline)
+    else:
+        print("orjson not installed, skipped")
+    result_encoder.RESULT_ENCODER = 'typed'
+
+    timed('typed columns', lambda: encoder.encode_columns(rows), args.rows, baseline)
+    if result_encoder.pa is not None:
+        timed('Arrow IPC', lambda: result_encoder.encode_arrow(DESCRIPTION, rows), args.rows, baseline)
+    else:
+        print("pyarrow not installed, skipped")
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,17 @@
 import os
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions
 from dotenv import load_dotenv
+from contextlib import contextmanager
+from collections import deque
 import logging
+import threading
 import time
 import re
+import uuid
+import queue
+from utils.sql_analyzer import strip_statement
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,13 +26,26 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 MAX_RETRIES = 5
 RETRY_DELAY = 2  # seconds
 
+# Connection pool settings
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # seconds before a connection is recycled
+POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))  # idle seconds before ping on checkout
+
+# Rows fetched per round trip by server-side cursors
+STREAM_BATCH_SIZE = int(os.getenv("DB_STREAM_BATCH_SIZE", "1000"))
+
+# COPY output is buffered into chunks of this many bytes before being handed over
+COPY_CHUNK_SIZE = int(os.getenv("DB_COPY_CHUNK_SIZE", str(64 * 1024)))
+COPY_QUEUE_DEPTH = 8  # chunks buffered between the COPY thread and the consumer
+
 def get_connection():
     """Create a database connection with retry logic"""
     for attempt in range(MAX_RETRIES):
         try:
             logger.info(f"Attempting to connect to database (attempt {attempt + 1}/{MAX_RETRIES})")
-            logger.info(f"Using DATABASE_URL: {DATABASE_URL}")
-            
+
             # Connect to the database
             conn = psycopg2.connect(DATABASE_URL)
             logger.info("Database connection successful")
@@ -45,42 +65,480 @@ def get_connection():
             else:
                 raise
 
-def query(sql, params=None):
-    """Execute a query and return results"""
-    conn = None
-    try:
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Connections are health checked on checkout when they have been idle for a
+    while, recycled once they exceed their max lifetime, and the pool resets
+    itself in a forked child so gunicorn workers never share sockets.
+    """
+
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 timeout=POOL_TIMEOUT, max_lifetime=POOL_MAX_LIFETIME,
+                 health_check_after=POOL_HEALTH_CHECK_AFTER):
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = deque()  # (conn, created_at, last_used_at)
+        self._in_use = {}  # id(conn) -> created_at
+        self._opening = 0
+        self._closed = False
+        self._stats = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'wait_count': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _check_fork(self):
+        """Drop connections inherited from a parent process"""
+        if self._pid != os.getpid():
+            # Never close inherited connections: that would terminate the
+            # parent's sessions on the shared sockets.
+            self._cond = threading.Condition()
+            self._reset_state()
+            logger.info(f"Connection pool reset after fork in pid {self._pid}")
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _open(self):
         conn = get_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(sql, params)
-            if cur.description:  # If the query returns results
-                result = cur.fetchall()
-            else:
-                result = None
-            conn.commit()
-            return result
-    except Exception as e:
-        logger.error(f"Database query error: {e}")
-        if conn:
-            conn.rollback()
-        raise
-    finally:
-        if conn:
+        with self._cond:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
             conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled connection: {e}")
+        with self._cond:
+            self._stats['connections_closed'] += 1
+
+    def _is_healthy(self, conn, last_used_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled connection failed health check: {e}")
+            return False
+
+    def _expired(self, created_at):
+        return self.max_lifetime > 0 and time.monotonic() - created_at >= self.max_lifetime
+
+    def warm(self):
+        """Open connections until the pool holds at least min_size"""
+        self._check_fork()
+        while True:
+            with self._cond:
+                if self._closed or self._size() >= self.min_size:
+                    return
+                self._opening += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                raise
+            now = time.monotonic()
+            with self._cond:
+                self._opening -= 1
+                self._idle.append((conn, now, now))
+                self._cond.notify()
+
+    def getconn(self):
+        """Check a connection out of the pool, waiting up to the pool timeout"""
+        self._check_fork()
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                while not self._idle and self._size() >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout} seconds")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, created_at, last_used_at = self._idle.pop()
+                    candidate = True
+                else:
+                    self._opening += 1
+                    candidate = False
+
+            if candidate:
+                expired = self._expired(created_at)
+                if expired or not self._is_healthy(conn, last_used_at):
+                    if not expired:
+                        with self._cond:
+                            self._stats['health_check_failures'] += 1
+                    self._close(conn)
+                    with self._cond:
+                        self._cond.notify()
+                    continue
+            else:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+
+            with self._cond:
+                if not candidate:
+                    self._opening -= 1
+                self._in_use[id(conn)] = created_at
+                self._stats['checkouts'] += 1
+                if waited:
+                    wait_time = time.monotonic() - started
+                    self._stats['wait_count'] += 1
+                    self._stats['wait_time_total'] += wait_time
+                    self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, discarding it if it is unusable"""
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+        if created_at is None:
+            # Checked out before a fork or from another pool
+            return
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception as e:
+                logger.warning(f"Discarding connection that failed to reset: {e}")
+                discard = True
+
+        with self._cond:
+            keep = (not discard and not conn.closed and not self._closed
+                    and not self._expired(created_at))
+            if keep:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+        if not keep:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            # Also runs on GeneratorExit when a streaming consumer goes away
+            self.putconn(conn)
+
+    def closeall(self):
+        """Close idle connections and refuse further checkouts"""
+        self._check_fork()
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Snapshot of pool usage counters"""
+        self._check_fork()
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pid': self._pid,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'opening': self._opening,
+            })
+        stats['wait_time_avg'] = (stats['wait_time_total'] / stats['wait_count']) if stats['wait_count'] else 0.0
+        return stats
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool()
+                try:
+                    pool.warm()
+                except Exception as e:
+                    logger.error(f"Could not pre-open database connections: {e}")
+                _pool = pool
+    return _pool
+
+def pool_stats():
+    """Pool stats for health checks; never opens a connection"""
+    if _pool is None:
+        return {'in_use': 0, 'idle': 0, 'initialized': False}
+    stats = _pool.stats()
+    stats['initialized'] = True
+    return stats
+
+def _reset_pool_after_fork():
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    if _pool is not None:
+        _pool._check_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+def begin_run(cur, run):
+    """Apply a tracked run's settings to the current transaction and report its backend PID
+
+    run is any object with application_name, timeout_ms and started(pid), such as
+    utils.query_tracker.QueryRun. Settings are transaction-local, so they are gone
+    by the time the connection returns to the pool. The transaction is made read
+    only as a backstop for anything the SQL analyzer lets through.
+    """
+    if run is None:
+        return
+    cur.execute("SET TRANSACTION READ ONLY")
+    cur.execute(
+        "SELECT pg_backend_pid(), set_config('statement_timeout', %s, true), set_config('application_name', %s, true)",
+        (str(int(run.timeout_ms or 0)), run.application_name)
+    )
+    row = cur.fetchone()
+    run.started(row['pg_backend_pid'] if isinstance(row, dict) else row[0])
+
+def end_run(run):
+    if run is not None:
+        run.finished()
+
+def query(sql, params=None, run=None):
+    """Execute a query and return results"""
+    with get_pool().connection() as conn:
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                begin_run(cur, run)
+                cur.execute(sql, params)
+                if cur.description:  # If the query returns results
+                    result = cur.fetchall()
+                else:
+                    result = None
+                conn.commit()
+                return result
+        except Exception as e:
+            logger.error(f"Database query error: {e}")
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            end_run(run)
+
+def query_rows(sql, params=None, run=None):
+    """Execute a query and return (cursor.description, rows) with rows as plain tuples
+
+    Cheaper than query() for large results that are encoded column-wise.
+    """
+    with get_pool().connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                begin_run(cur, run)
+                cur.execute(sql, params)
+                description = cur.description
+                rows = cur.fetchall() if description else None
+                conn.commit()
+                return description, rows
+        except Exception as e:
+            logger.error(f"Database query error: {e}")
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            end_run(run)
 
 def execute_transaction(queries_and_params):
     """Execute multiple queries in a transaction"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            for sql, params in queries_and_params:
-                cursor.execute(sql, params)
+    with get_pool().connection() as conn:
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                for sql, params in queries_and_params:
+                    cursor.execute(sql, params)
+                conn.commit()
+        except Exception as e:
+            if not conn.closed:
+                conn.rollback()
+            logger.error(f"Transaction error: {e}")
+            raise
+
+def stream_query(sql, params=None, batch_size=STREAM_BATCH_SIZE, run=None):
+    """Execute a query through a server-side cursor and yield rows in batches
+
+    The pooled connection is held until the generator is exhausted or closed,
+    so only one batch is ever held in memory.
+    """
+    for _, rows in _stream(sql, params, batch_size, run, RealDictCursor):
+        yield rows
+
+def stream_rows(sql, params=None, batch_size=STREAM_BATCH_SIZE, run=None):
+    """Like stream_query, but yields (cursor.description, tuple rows) batches"""
+    return _stream(sql, params, batch_size, run, None)
+
+def _stream(sql, params, batch_size, run, cursor_factory):
+    with get_pool().connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                begin_run(cur, run)
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=cursor_factory) as cur:
+                cur.itersize = batch_size
+                cur.execute(sql, params)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield cur.description, rows
             conn.commit()
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        logger.error(f"Transaction error: {e}")
-        raise
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+        except Exception as e:
+            logger.error(f"Database stream error: {e}")
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            end_run(run)
+
+class _CopyCancelled(Exception):
+    """Raised inside the COPY thread when the consumer stops reading"""
+
+class _CopyPipe:
+    """File-like sink for copy_expert that hands fixed-size chunks to a bounded queue"""
+
+    def __init__(self, chunk_size, depth):
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(depth)
+        self.cancelled = threading.Event()
+        self._buffer = bytearray()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush_buffer(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, item):
+        while True:
+            if self.cancelled.is_set():
+                raise _CopyCancelled()
+            try:
+                self.chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+def copy_query(sql, params=None, options='CSV HEADER', chunk_size=COPY_CHUNK_SIZE, run=None):
+    """Run COPY (<sql>) TO STDOUT and yield the output in byte chunks
+
+    COPY runs on a helper thread that writes into a bounded queue, so memory
+    stays constant however large the result is. Closing the generator early
+    cancels the COPY on the server. SHOW and EXPLAIN cannot run inside COPY.
+    """
+    statement = strip_statement(sql)
+    pipe = _CopyPipe(chunk_size, COPY_QUEUE_DEPTH)
+    done = object()
+    errors = []
+
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            if params is not None:
+                statement = cur.mogrify(statement, params).decode(extensions.encodings[conn.encoding])
+            begin_run(cur, run)
+
+        def run_copy():
+            try:
+                with conn.cursor() as cur:
+                    cur.copy_expert(f"COPY ({statement}\n) TO STDOUT WITH {options}", pipe)
+                pipe.flush_buffer()
+                conn.commit()
+            except _CopyCancelled:
+                pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                if errors or pipe.cancelled.is_set():
+                    try:
+                        if not conn.closed:
+                            conn.rollback()
+                    except Exception as e:
+                        logger.warning(f"Rollback after COPY failed: {e}")
+                # The consumer is waiting on the queue, not on the join
+                while True:
+                    try:
+                        pipe.chunks.put(done, timeout=0.5)
+                        break
+                    except queue.Full:
+                        if pipe.cancelled.is_set():
+                            break
+
+        worker = threading.Thread(target=run_copy, name='copy-to-stdout', daemon=True)
+        worker.start()
+        try:
+            while True:
+                chunk = pipe.chunks.get()
+                if chunk is done:
+                    break
+                yield chunk
+            if errors:
+                logger.error(f"Database COPY error: {errors[0]}")
+                raise errors[0]
+        finally:
+            if worker.is_alive():
+                pipe.cancelled.set()
+                try:
+                    conn.cancel()
+                except Exception as e:
+                    logger.warning(f"Could not cancel COPY: {e}")
+                # Drain so the COPY thread is never blocked on a full queue
+                while worker.is_alive():
+                    try:
+                        pipe.chunks.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                worker.join()
+                # A late cancel request could hit the next statement, so never reuse it
+                conn.close()
+            end_run(run)
@@ -17,9 +17,17 @@ CREATE TABLE IF NOT EXISTS queries (
     result_count INTEGER,
     execution_time FLOAT,
     is_favorite BOOLEAN DEFAULT FALSE,
+    statement_type VARCHAR(20),
+    fingerprint CHAR(64),
+    tables TEXT[],
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- SQL analysis stored with each history entry; NULL for entries saved before it was
+ALTER TABLE queries ADD COLUMN IF NOT EXISTS statement_type VARCHAR(20);
+ALTER TABLE queries ADD COLUMN IF NOT EXISTS fingerprint CHAR(64);
+ALTER TABLE queries ADD COLUMN IF NOT EXISTS tables TEXT[];
+
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
@@ -35,6 +43,53 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+-- Tell the backend a user's cached identity changed, however the row was modified (see utils/user_cache.py)
+CREATE OR REPLACE FUNCTION notify_user_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('user_changed', OLD.id::text);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS users_notify_changed ON users;
+CREATE TRIGGER users_notify_changed
+    AFTER UPDATE OF username, email, user_type OR DELETE ON users
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_user_changed();
+
+-- Schema catalog version, bumped on every DDL so cached schema can be invalidated cheaply
+CREATE TABLE IF NOT EXISTS schema_catalog_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_catalog_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+-- Runs as its owner with a fixed search_path, so DDL by any role can bump the version
+-- and a role's search_path cannot redirect the UPDATE
+CREATE OR REPLACE FUNCTION bump_schema_catalog_version()
+RETURNS event_trigger
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    UPDATE schema_catalog_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP;
+END;
+$$ language 'plpgsql';
+
+-- Event triggers need superuser; without one the backend falls back to a catalog xmin check
+DO $$
+BEGIN
+    DROP EVENT TRIGGER IF EXISTS schema_catalog_version_bump;
+    CREATE EVENT TRIGGER schema_catalog_version_bump ON ddl_command_end
+        EXECUTE FUNCTION bump_schema_catalog_version();
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'Skipping schema_catalog_version_bump event trigger: superuser required';
+END;
+$$;
+
 -- Insert a default admin user (password: 123123)
 INSERT INTO users (username, email, password_hash, user_type)
 VALUES (
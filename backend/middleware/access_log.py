@@ -0,0 +1,172 @@
+import os
+import json
+import atexit
+import time
+import queue
+import random
+import logging
+import threading
+import logging.handlers
+from flask import request, g
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records waiting for the writer thread; more are dropped
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'
+
+ACCESS_LOG_ENABLED = os.getenv("ACCESS_LOG_ENABLED", "true").lower() == "true"
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.1"))  # share of ordinary requests logged
+# Per-endpoint overrides as endpoint=rate pairs, e.g. queries.execute_query=1
+ACCESS_LOG_ROUTE_RATES = os.getenv("ACCESS_LOG_ROUTE_RATES", "health_check=0,root_health_check=0,api_health_check=0")
+ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "1000"))  # slower requests and 5xx are always logged
+ACCESS_LOG_BODY = os.getenv("ACCESS_LOG_BODY", "false").lower() == "true"
+ACCESS_LOG_BODY_MAX_BYTES = int(os.getenv("ACCESS_LOG_BODY_MAX_BYTES", "1024"))
+
+# Never log bodies that carry credentials
+BODY_EXCLUDED_ENDPOINTS = {'auth.login', 'auth.register'}
+
+ACCESS_LOGGER = 'access'
+
+access_logger = logging.getLogger(ACCESS_LOGGER)
+
+_route_rates = {
+    endpoint.strip(): float(rate)
+    for endpoint, _, rate in (pair.partition('=') for pair in ACCESS_LOG_ROUTE_RATES.split(',') if '=' in pair)
+}
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking or raising when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class _AccessFilter(logging.Filter):
+    def __init__(self, access):
+        super().__init__()
+        self.access = access
+
+    def filter(self, record):
+        return (record.name == ACCESS_LOGGER) == self.access
+
+_lock = threading.Lock()
+_queue = None
+_handler = None
+_listener = None
+_listener_pid = None
+
+def configure_logging():
+    """Send all logging through a queue to one writer thread per process
+
+    Request threads only enqueue records, so they never block on log I/O.
+    Application logs are written as text; access logs as one JSON object per line.
+    """
+    global _queue, _handler
+    with _lock:
+        if _handler is not None:
+            return
+        _queue = queue.Queue(LOG_QUEUE_SIZE)
+        _handler = _DroppingQueueHandler(_queue)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_handler)
+        root.setLevel(LOG_LEVEL)
+        access_logger.setLevel(logging.INFO)
+    _ensure_listener()
+
+def _ensure_listener():
+    """Start the writer thread, again in a worker forked after configure_logging"""
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        app_handler = logging.StreamHandler()
+        app_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        app_handler.addFilter(_AccessFilter(False))
+        access_handler = logging.StreamHandler()
+        access_handler.setFormatter(logging.Formatter('%(message)s'))
+        access_handler.addFilter(_AccessFilter(True))
+        _listener = logging.handlers.QueueListener(_queue, app_handler, access_handler, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+    # Flush what is still queued on a clean shutdown
+    atexit.register(_stop_listener)
+
+def _stop_listener():
+    if _listener_pid == os.getpid():
+        _listener.stop()
+
+def stats():
+    """Queue depth and records dropped because the writer fell behind"""
+    if _handler is None:
+        return None
+    return {'queued': _queue.qsize(), 'maxQueued': LOG_QUEUE_SIZE, 'dropped': _handler.dropped}
+
+def start_timer():
+    """before_request hook"""
+    if _handler is not None:
+        _ensure_listener()
+    g.access_log_started = time.perf_counter()
+
+def log_access(response):
+    """after_request hook writing a sampled, structured access log line
+
+    Streamed responses are logged when the stream closes, so their duration
+    covers the whole transfer.
+    """
+    started = g.pop('access_log_started', None)
+    if not ACCESS_LOG_ENABLED or started is None:
+        return response
+
+    endpoint = request.endpoint
+    rate = _route_rates.get(endpoint, ACCESS_LOG_SAMPLE_RATE)
+    sampled = rate >= 1 or (rate > 0 and random.random() < rate)
+    if not sampled and response.status_code < 500 and not response.is_streamed:
+        # Unsampled requests are only kept when slow; skip building the entry otherwise
+        if not 0 < ACCESS_LOG_SLOW_MS <= (time.perf_counter() - started) * 1000:
+            return response
+
+    user = getattr(request, 'user', None)
+    entry = {
+        'ts': round(time.time(), 3),
+        'method': request.method,
+        'path': request.path,
+        'endpoint': endpoint,
+        'status': response.status_code,
+        'userId': user.get('id') if isinstance(user, dict) else None,
+        'remoteAddr': request.headers.get('X-Forwarded-For', request.remote_addr),
+        'requestBytes': request.content_length,
+        'sampleRate': rate,
+    }
+    for header, field in (('X-Query-Run-Id', 'runId'), ('X-Cache', 'cache'), ('Content-Encoding', 'encoding')):
+        if header in response.headers:
+            entry[field] = response.headers[header]
+    if ACCESS_LOG_BODY and endpoint not in BODY_EXCLUDED_ENDPOINTS and request.content_length:
+        entry['body'] = request.get_data()[:ACCESS_LOG_BODY_MAX_BYTES].decode('utf-8', 'replace')
+
+    def emit(streamed):
+        entry['durationMs'] = round((time.perf_counter() - started) * 1000, 2)
+        if streamed:
+            entry['streamed'] = True
+        else:
+            entry['responseBytes'] = response.content_length
+        # Errors and slow requests are always kept; the rest only when sampled
+        if sampled or entry['status'] >= 500 or entry['durationMs'] >= ACCESS_LOG_SLOW_MS > 0:
+            access_logger.info(json.dumps(entry, separators=(',', ':')))
+
+    if response.is_streamed:
+        response.call_on_close(lambda: emit(True))
+    else:
+        emit(False)
+    return response
@@ -1,8 +1,12 @@
 import os
 import jwt
+import logging
 from functools import wraps
 from flask import request, jsonify, make_response
 from dotenv import load_dotenv
+from utils import user_cache, rate_limit
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -28,12 +32,32 @@ def token_required(f):
         try:
             # Decode token
             payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            # Add user info to request
-            request.user = payload
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token expired.'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'message': 'Invalid token.'}), 401
+
+        try:
+            # Refresh claims from the user cache if the user changed since the token was issued
+            user = user_cache.resolve(payload)
+        except Exception as e:
+            logger.error(f"User lookup failed, trusting token claims: {str(e)}")
+            user = None
+        else:
+            if user is None:
+                return jsonify({'message': 'Invalid token.'}), 401
+        if user is not None:
+            payload = dict(payload, username=user['username'], email=user['email'], userType=user['user_type'])
+        # Add user info to request
+        request.user = payload
+
+        try:
+            # Per-user token bucket for this endpoint
+            rate_limit.check_rate(payload['id'], request.endpoint)
+        except rate_limit.RateLimited as e:
+            response = jsonify({'message': str(e), 'retryAfter': e.retry_after})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 429
         
         return f(*args, **kwargs)
     
@@ -0,0 +1,75 @@
+import os
+import logging
+from flask import request
+from dotenv import load_dotenv
+from utils.compression import available_encodings, compress, compress_stream
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # bytes; smaller bodies are sent as-is
+COMPRESSION_ENCODINGS = os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip")  # server preference when the client accepts several
+
+# Text-like bodies worth compressing; archives, Parquet and images already are
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/vnd.apache.arrow.stream',
+    'text/csv',
+    'text/css',
+    'text/html',
+    'text/plain',
+}
+
+_encodings = [
+    encoding.strip() for encoding in COMPRESSION_ENCODINGS.split(',')
+    if encoding.strip() in available_encodings()
+]
+
+def negotiate_encoding(accept_encodings):
+    """Pick the content coding the client weighs highest, breaking ties by server preference"""
+    best, best_quality = None, 0
+    for encoding in _encodings:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress_response(response):
+    """after_request hook compressing responses for clients that accept it
+
+    Buffered bodies are compressed whole once they reach COMPRESSION_MIN_SIZE.
+    Streamed bodies are compressed chunk by chunk, flushing after every chunk
+    so clients still see rows as they are produced.
+    """
+    if not COMPRESSION_ENABLED or request.method == 'HEAD':
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, flush=True)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESSION_MIN_SIZE:
+            return response
+        response.set_data(compress(body, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ, but conditional requests compare weakly
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
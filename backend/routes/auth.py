@@ -1,9 +1,9 @@
 from flask import Blueprint, request, jsonify, make_response
-import bcrypt
 import jwt
 import os
 import datetime
 from db.db import query
+from utils import user_cache, passwords
 import logging
 from functools import wraps
 
@@ -31,7 +31,10 @@ def token_required(f):
 
         try:
             data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            current_user = query('SELECT * FROM users WHERE id = %s', (data['id'],))[0]
+            # Claims answer while the user is unchanged; no database round trip
+            current_user = user_cache.resolve(data)
+            if current_user is None:
+                return jsonify({'message': 'Invalid token'}), 401
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token has expired'}), 401
         except jwt.InvalidTokenError:
@@ -109,19 +112,22 @@ def register():
             response = jsonify({'message': 'User already exists'}), 400
             return add_cors_headers(response)
         
-        # Hash password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        # Hash password (on the bounded hashing pool)
+        hashed_password = passwords.hash_password(password)
         
         # Create user
         result = query(
-            'INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING id, username, email',
-            (username, email, hashed_password.decode('utf-8'))
+            'INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING id, username, email, user_type',
+            (username, email, hashed_password)
         )
         
         # Generate token
         token = jwt.encode({
             'id': result[0]['id'],
             'username': result[0]['username'],
+            'email': result[0]['email'],
+            'userType': result[0]['user_type'],
+            'ver': user_cache.get_version(result[0]['id']),
             'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
         }, JWT_SECRET, algorithm='HS256')
         
@@ -132,6 +138,12 @@ def register():
         })
         return add_cors_headers(response), 201
     
+    except passwords.PasswordHashingBusy as e:
+        logger.warning(f"Registration rejected by password hashing backpressure: {str(e)}")
+        response = jsonify({'message': str(e)}), 503
+        response[0].headers['Retry-After'] = '1'
+        return add_cors_headers(response)
+    
     except Exception as e:
         logger.error(f"Registration error: {str(e)}")
         response = jsonify({'message': 'An error occurred during registration'}), 500
@@ -160,7 +172,6 @@ def login():
         
         # Get user
         users = query('SELECT * FROM users WHERE email = %s', (email,))
-        logger.info(f"DB query result for email {email}: {users}")
         
         if not users:
             logger.warning(f"Login failed: Invalid email {email}")
@@ -168,11 +179,9 @@ def login():
             return add_cors_headers(response)
         
         user = users[0]
-        logger.info(f"User from DB: {user}")
         
-        # Check password
-        password_check = bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8'))
-        logger.info(f"Password check result: {password_check}")
+        # Check password; hashes at an outdated cost are upgraded in the background
+        password_check = passwords.verify_password(password, user['password_hash'], user['id'])
         
         if not password_check:
             logger.warning(f"Login failed: Invalid password for email {email}")
@@ -185,6 +194,7 @@ def login():
             'username': user['username'],
             'email': user['email'],
             'userType': user['user_type'],
+            'ver': user_cache.get_version(user['id']),
             'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
         }, JWT_SECRET, algorithm='HS256')
         
@@ -200,6 +210,12 @@ def login():
         })
         return add_cors_headers(response), 200
     
+    except passwords.PasswordHashingBusy as e:
+        logger.warning(f"Login rejected by password hashing backpressure: {str(e)}")
+        response = jsonify({'message': str(e)}), 503
+        response[0].headers['Retry-After'] = '1'
+        return add_cors_headers(response)
+    
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         response = jsonify({'message': 'An error occurred during login'}), 500
@@ -0,0 +1,302 @@
+from flask import Blueprint, request, jsonify, make_response, current_app
+from middleware.auth_middleware import token_required
+from routes.queries import add_cors_headers, rate_limited_response, save_history
+from utils import jobs, rate_limit
+from utils.sql_analyzer import analyze, runs_in_cursor
+import logging
+
+jobs_bp = Blueprint('jobs', __name__)
+logger = logging.getLogger(__name__)
+
+def job_summary(job):
+    """Public view of a job's metadata"""
+    return {
+        'jobId': job['id'],
+        'status': job['status'],
+        'query': job['query'],
+        'pageSize': job['pageSize'],
+        'pages': job['pages'],
+        'rowCount': job['rowCount'],
+        'truncated': job.get('truncated', False),
+        'columns': job['columns'],
+        'error': job['error'],
+        'createdAt': job['createdAt'],
+        'startedAt': job['startedAt'],
+        'finishedAt': job['finishedAt'],
+    }
+
+def get_owned_job(job_id):
+    """Return the job if it exists and belongs to the current user"""
+    job = jobs.get_job(job_id)
+    if job is None or job.get('userId') != request.user['id']:
+        return None
+    return job
+
+@jobs_bp.route('', methods=['POST', 'OPTIONS'])
+def submit_job():
+    """
+    Submit a SQL query for asynchronous execution
+    ---
+    tags:
+      - Jobs
+    security:
+      - Bearer: []
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - query
+          properties:
+            query:
+              type: string
+            pageSize:
+              type: integer
+    responses:
+      202:
+        description: Job accepted
+      400:
+        description: Invalid query
+      401:
+        description: Unauthorized
+      429:
+        description: Over the per-user rate or concurrent query limit; see Retry-After
+      503:
+        description: Job queue is full
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        return add_cors_headers(response)
+
+    # Apply token validation only for non-OPTIONS requests
+    @token_required
+    def submit_job_with_auth():
+        try:
+            data = request.get_json() or {}
+            sql_query = data.get('query')
+            user_id = request.user['id']
+
+            if not sql_query:
+                response = jsonify({'message': 'Query is required'}), 400
+                return add_cors_headers(response)
+
+            analysis = analyze(sql_query)
+            if not analysis.read_only:
+                response = jsonify({'message': analysis.reason}), 400
+                return add_cors_headers(response)
+            if not runs_in_cursor(analysis):
+                response = jsonify({'message': 'SHOW and EXPLAIN cannot run as jobs'}), 400
+                return add_cors_headers(response)
+
+            try:
+                page_size = int(data.get('pageSize', jobs.JOB_PAGE_SIZE))
+            except (TypeError, ValueError):
+                response = jsonify({'message': 'pageSize must be an integer'}), 400
+                return add_cors_headers(response)
+
+            try:
+                job_id = jobs.submit_job(request.user, sql_query, page_size)
+            except jobs.JobQueueFull as e:
+                response = jsonify({'message': str(e)}), 503
+                response[0].headers['Retry-After'] = '5'
+                return add_cors_headers(response)
+
+            # Save to history
+            save_history(user_id, sql_query, analysis)
+
+            response = jsonify({
+                'message': 'Job submitted successfully',
+                'jobId': job_id,
+                'status': 'queued'
+            }), 202
+            return add_cors_headers(response)
+
+        except rate_limit.RateLimited as e:
+            return rate_limited_response(e)
+
+        except Exception as e:
+            logger.error(f"Job submission error: {str(e)}")
+            response = jsonify({'message': str(e)}), 500
+            return add_cors_headers(response)
+
+    return submit_job_with_auth()
+
+@jobs_bp.route('/<job_id>', methods=['GET', 'OPTIONS'])
+def get_job_status(job_id):
+    """
+    Get status and progress of a query job
+    ---
+    tags:
+      - Jobs
+    security:
+      - Bearer: []
+    parameters:
+      - in: path
+        name: job_id
+        required: true
+        type: string
+    responses:
+      200:
+        description: Job status
+      401:
+        description: Unauthorized
+      404:
+        description: Job not found
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        return add_cors_headers(response)
+
+    # Apply token validation only for non-OPTIONS requests
+    @token_required
+    def get_job_status_with_auth():
+        try:
+            job = get_owned_job(job_id)
+            if job is None:
+                response = jsonify({'message': 'Job not found'}), 404
+                return add_cors_headers(response)
+
+            response = jsonify(job_summary(job)), 200
+            return add_cors_headers(response)
+
+        except Exception as e:
+            logger.error(f"Job status error: {str(e)}")
+            response = jsonify({'message': str(e)}), 500
+            return add_cors_headers(response)
+
+    return get_job_status_with_auth()
+
+@jobs_bp.route('/<job_id>/results', methods=['GET', 'OPTIONS'])
+def get_job_results(job_id):
+    """
+    Fetch one page of a job's results
+    ---
+    tags:
+      - Jobs
+    security:
+      - Bearer: []
+    parameters:
+      - in: path
+        name: job_id
+        required: true
+        type: string
+      - in: query
+        name: page
+        required: false
+        type: integer
+    responses:
+      200:
+        description: Result page
+      401:
+        description: Unauthorized
+      404:
+        description: Job or page not found
+      409:
+        description: Page not available yet
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        return add_cors_headers(response)
+
+    # Apply token validation only for non-OPTIONS requests
+    @token_required
+    def get_job_results_with_auth():
+        try:
+            job = get_owned_job(job_id)
+            if job is None:
+                response = jsonify({'message': 'Job not found'}), 404
+                return add_cors_headers(response)
+
+            page = request.args.get('page', 0, type=int)
+            if page < 0:
+                response = jsonify({'message': 'page must not be negative'}), 400
+                return add_cors_headers(response)
+
+            if page >= job['pages']:
+                if job['status'] in jobs.ACTIVE_STATUSES:
+                    response = jsonify({'message': 'Page not available yet', 'status': job['status']}), 409
+                else:
+                    response = jsonify({'message': 'Page not found', 'status': job['status']}), 404
+                return add_cors_headers(response)
+
+            rows_json = jobs.get_job_page(job_id, page)
+            if rows_json is None:
+                response = jsonify({'message': 'Results have expired'}), 404
+                return add_cors_headers(response)
+
+            done = job['status'] not in jobs.ACTIVE_STATUSES
+            next_page = page + 1 if (page + 1 < job['pages'] or not done) else None
+            envelope = current_app.json.dumps({
+                'jobId': job_id,
+                'status': job['status'],
+                'page': page,
+                'pages': job['pages'],
+                'nextPage': next_page,
+            })
+            # Splice the stored page in without decoding it
+            response = current_app.response_class(
+                envelope[:-1] + ', "result": ' + rows_json + '}',
+                mimetype='application/json'
+            )
+            return add_cors_headers(response)
+
+        except Exception as e:
+            logger.error(f"Job results error: {str(e)}")
+            response = jsonify({'message': str(e)}), 500
+            return add_cors_headers(response)
+
+    return get_job_results_with_auth()
+
+@jobs_bp.route('/<job_id>/cancel', methods=['POST', 'OPTIONS'])
+def cancel_job(job_id):
+    """
+    Cancel a queued or running query job
+    ---
+    tags:
+      - Jobs
+    security:
+      - Bearer: []
+    parameters:
+      - in: path
+        name: job_id
+        required: true
+        type: string
+    responses:
+      200:
+        description: Cancellation requested
+      401:
+        description: Unauthorized
+      404:
+        description: Job not found
+      409:
+        description: Job already finished
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        return add_cors_headers(response)
+
+    # Apply token validation only for non-OPTIONS requests
+    @token_required
+    def cancel_job_with_auth():
+        try:
+            job = get_owned_job(job_id)
+            if job is None:
+                response = jsonify({'message': 'Job not found'}), 404
+                return add_cors_headers(response)
+
+            if job['status'] not in jobs.ACTIVE_STATUSES:
+                response = jsonify({'message': f"Job already {job['status']}", 'status': job['status']}), 409
+                return add_cors_headers(response)
+
+            jobs.cancel_job(job_id, request.user['id'])
+            response = jsonify({'message': 'Cancellation requested', 'jobId': job_id}), 200
+            return add_cors_headers(response)
+
+        except Exception as e:
+            logger.error(f"Job cancel error: {str(e)}")
+            response = jsonify({'message': str(e)}), 500
+            return add_cors_headers(response)
+
+    return cancel_job_with_auth()
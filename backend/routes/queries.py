@@ -1,13 +1,194 @@
-from flask import Blueprint, request, jsonify, make_response
-import csv
-from io import StringIO
+from flask import Blueprint, request, jsonify, make_response, Response, stream_with_context, current_app
+import json
+import time
+import base64
 from middleware.auth_middleware import token_required
-from db.db import query
+from db.db import query, query_rows, stream_rows, copy_query
+from utils.query_cache import QUERY_CACHE_ENABLED, get_cached_result, cache_result
+from utils.sql_analyzer import analyze, runs_in_cursor
+from utils import single_flight, jobs, admission, rate_limit, result_encoder, exports
+from utils.compression import available_encodings, compress_stream
+from utils.query_tracker import QueryRun, is_valid_run_id, get_run, cancel_run
+from psycopg2 import errors as pg_errors
 import logging
 
 queries_bp = Blueprint('queries', __name__)
 logger = logging.getLogger(__name__)
 
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+RESULT_FORMATS = {
+    'rows': 'application/json',
+    'columns': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+RESULT_ENCODERS = {
+    'rows': result_encoder.encode_rows,
+    'columns': result_encoder.encode_columns,
+    'arrow': result_encoder.encode_arrow,
+}
+
+def query_canceled_response(query_run):
+    """Map a QueryCanceled error to a user cancel (409) or a statement timeout (408)"""
+    if query_run.was_cancelled():
+        response = jsonify({'message': 'Query was cancelled', 'runId': query_run.run_id}), 409
+    else:
+        response = jsonify({
+            'message': f"Query exceeded the statement timeout of {query_run.timeout_ms / 1000:g} seconds",
+            'runId': query_run.run_id
+        }), 408
+    return add_cors_headers(response)
+
+def rate_limited_response(error):
+    """429 with Retry-After for a rate_limit.RateLimited error"""
+    response = jsonify({'message': str(error), 'retryAfter': error.retry_after}), 429
+    response[0].headers['Retry-After'] = str(error.retry_after)
+    return add_cors_headers(response)
+
+def save_history(user_id, sql_query, analysis, result_count=None, execution_time=None):
+    """Record a query in the user's history along with its analysis"""
+    query(
+        'INSERT INTO queries (user_id, query_text, result_count, execution_time, statement_type, fingerprint, tables) '
+        'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+        (user_id, sql_query, result_count, execution_time, analysis.statement_type, analysis.fingerprint,
+         list(analysis.tables))
+    )
+
+def encode_continuation_token(snapshot_id, page):
+    payload = json.dumps({'s': snapshot_id, 'p': page}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_continuation_token(token):
+    """Return (snapshot_id, page) or None for a malformed token"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        snapshot_id, page = payload['s'], int(payload['p'])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+    if not isinstance(snapshot_id, str) or page < 0:
+        return None
+    return snapshot_id, page
+
+def result_window_response(snapshot_id, page):
+    """Return one page of a result snapshot, waiting briefly for it to be fetched"""
+    job = jobs.wait_for_page(snapshot_id, page, jobs.SNAPSHOT_WAIT_TIMEOUT)
+    if job is None or job.get('userId') != request.user['id']:
+        response = jsonify({'message': 'Result window has expired'}), 410
+        return add_cors_headers(response)
+    if job['status'] == 'failed':
+        response = jsonify({'message': job['error']}), 500
+        return add_cors_headers(response)
+    if job['status'] == 'cancelled':
+        response = jsonify({'message': 'Query was cancelled', 'runId': snapshot_id}), 409
+        return add_cors_headers(response)
+
+    done = job['status'] not in jobs.ACTIVE_STATUSES
+    if page < job['pages']:
+        rows_json = jobs.get_job_page(snapshot_id, page)
+        if rows_json is None:
+            response = jsonify({'message': 'Result window has expired'}), 410
+            return add_cors_headers(response)
+        next_page = page + 1
+    elif done:
+        rows_json = '[]'
+        next_page = None
+    else:
+        # Still fetching; hand the same page back so the client can retry
+        rows_json = '[]'
+        next_page = page
+
+    complete = done and (next_page is None or next_page >= job['pages'])
+    envelope = current_app.json.dumps({
+        'message': 'Query executed successfully',
+        'page': page,
+        'pageSize': job['pageSize'],
+        'rowCount': job['rowCount'],
+        'truncated': job.get('truncated', False),
+        'complete': complete,
+        'nextToken': None if complete else encode_continuation_token(snapshot_id, next_page),
+    })
+    response = current_app.response_class(
+        envelope[:-1] + ', "result": ' + rows_json + '}',
+        mimetype='application/json'
+    )
+    response.headers['X-Query-Run-Id'] = snapshot_id
+    return add_cors_headers(response)
+
+def get_stream_format(data):
+    """Resolve the requested streaming format from the body or Accept header"""
+    stream = data.get('stream')
+    if stream is True:
+        return 'json'
+    if isinstance(stream, str) and stream.lower() in STREAM_FORMATS:
+        return stream.lower()
+    if request.accept_mimetypes.best == STREAM_FORMATS['ndjson']:
+        return 'ndjson'
+    return None
+
+def get_result_format(data):
+    """Resolve the requested result layout from the body or Accept header; None if it is unknown"""
+    result_format = data.get('format')
+    if result_format is None:
+        return 'arrow' if request.accept_mimetypes.best == RESULT_FORMATS['arrow'] else 'rows'
+    if isinstance(result_format, str) and result_format.lower() in RESULT_FORMATS:
+        return result_format.lower()
+    return None
+
+def get_download_format():
+    """Resolve the export format from ?format= or the Accept header; None if it is unknown"""
+    download_format = request.args.get('format')
+    if download_format:
+        download_format = download_format.lower()
+        return download_format if download_format in exports.DOWNLOAD_FORMATS else None
+    mimetypes = {mimetype: name for name, (mimetype, _) in exports.DOWNLOAD_FORMATS.items()}
+    return mimetypes[request.accept_mimetypes.best_match(mimetypes, default='text/csv')]
+
+def encode_stream(first_batch, batches, stream_format):
+    """Incrementally encode (description, rows) batches as a JSON document or NDJSON lines"""
+    dumps = result_encoder.dumps
+    if stream_format == 'ndjson':
+        try:
+            if first_batch:
+                yield result_encoder.encoder_for(first_batch[0]).encode_lines(first_batch[1])
+            for description, rows in batches:
+                yield result_encoder.encoder_for(description).encode_lines(rows)
+        except Exception as e:
+            logger.error(f"Query stream error: {str(e)}")
+            yield dumps({'error': str(e)}) + '\n'
+        return
+
+    yield '{"message": "Query executed successfully", "result": ['
+    first = True
+    try:
+        if first_batch:
+            # Every batch comes from the same cursor, so one encoder serves the whole stream
+            encoder = result_encoder.encoder_for(first_batch[0])
+            yield ','.join([encoder.encode_row(row) for row in first_batch[1]])
+            first = False
+            for _, rows in batches:
+                yield ('' if first else ',') + ','.join([encoder.encode_row(row) for row in rows])
+        yield ']}'
+    except Exception as e:
+        # Headers are already sent, so report the failure inside the document
+        logger.error(f"Query stream error: {str(e)}")
+        yield '], "error": ' + dumps(str(e)) + '}'
+
+def chain_closing(first_chunks, chunks):
+    """Yield the chunks already read, then the rest, closing the source however the stream ends
+
+    Closing an unfinished copy_query generator cancels its COPY and returns the connection.
+    """
+    try:
+        yield from first_chunks
+        yield from chunks
+    finally:
+        chunks.close()
+
 def add_cors_headers(response):
     """Add CORS headers to response"""
     if isinstance(response, tuple):
@@ -46,13 +227,49 @@ def execute_query():
           properties:
             query:
               type: string
+            runId:
+              type: string
+              description: Client-chosen id used to cancel the query while it runs
+            pageSize:
+              type: integer
+              description: Return the result in windows of this many rows, with a continuationToken for the next one
+            continuationToken:
+              type: string
+              description: nextToken from a previous paginated response; query may be omitted
+            stream:
+              type: string
+              enum: [json, ndjson]
+              description: Stream rows from a server-side cursor instead of buffering the whole result
+            cache:
+              type: boolean
+              description: Serve and store the result through the Redis result cache (defaults to QUERY_CACHE_ENABLED)
+            format:
+              type: string
+              enum: [rows, columns, arrow]
+              description: Row objects (default), column names and types once with one value array per column, or an Arrow IPC stream
     responses:
       200:
         description: Query executed successfully
+      202:
+        description: Query was over the admission cost limits and queued as a job
       400:
         description: Invalid query
       401:
         description: Unauthorized
+      406:
+        description: Arrow output requested but pyarrow is not installed on the server
+      408:
+        description: Query exceeded the statement timeout
+      409:
+        description: Query was cancelled
+      410:
+        description: Paginated result window has expired
+      422:
+        description: Query was over the admission cost limits and rejected
+      429:
+        description: Over the per-user rate or concurrent query limit; see Retry-After
+      503:
+        description: Too many paginated queries in flight
     """
     if request.method == 'OPTIONS':
         response = make_response()
@@ -65,31 +282,180 @@ def execute_query():
             data = request.get_json()
             sql_query = data.get('query')
             user_id = request.user['id']
+
+            # Later pages come from the snapshot, not a new execution
+            continuation_token = data.get('continuationToken')
+            if continuation_token:
+                window = decode_continuation_token(continuation_token) if isinstance(continuation_token, str) else None
+                if window is None:
+                    response = jsonify({'message': 'Invalid continuationToken'}), 400
+                    return add_cors_headers(response)
+                return result_window_response(*window)
             
             if not sql_query:
                 response = jsonify({'message': 'Query is required'}), 400
                 return add_cors_headers(response)
             
             # Check if query is read-only (for security)
-            sql_lower = sql_query.lower().strip()
-            if any(keyword in sql_lower for keyword in ['insert', 'update', 'delete', 'drop', 'alter', 'create']):
-                response = jsonify({'message': 'Only SELECT queries are allowed'}), 400
+            analysis = analyze(sql_query)
+            if not analysis.read_only:
+                response = jsonify({'message': analysis.reason}), 400
                 return add_cors_headers(response)
+
+            # Clients may pick the run id so they can cancel while waiting
+            run_id = data.get('runId')
+            if run_id is not None and not is_valid_run_id(run_id):
+                response = jsonify({'message': 'Invalid runId'}), 400
+                return add_cors_headers(response)
+            query_run = QueryRun(request.user, run_id)
+
+            page_size = data.get('pageSize')
+            if page_size is not None and (not isinstance(page_size, int) or isinstance(page_size, bool) or page_size < 1):
+                response = jsonify({'message': 'pageSize must be a positive integer'}), 400
+                return add_cors_headers(response)
+
+            result_format = get_result_format(data)
+            if result_format is None:
+                response = jsonify({'message': f"format must be one of {', '.join(RESULT_FORMATS)}"}), 400
+                return add_cors_headers(response)
+            if result_format != 'rows' and (page_size is not None or get_stream_format(data)):
+                response = jsonify({'message': f"format '{result_format}' cannot be combined with pageSize or stream"}), 400
+                return add_cors_headers(response)
+            if (page_size is not None or get_stream_format(data)) and not runs_in_cursor(analysis):
+                response = jsonify({'message': 'SHOW and EXPLAIN results cannot be streamed or paginated'}), 400
+                return add_cors_headers(response)
+            if result_format == 'arrow' and result_encoder.pa is None:
+                response = jsonify({'message': 'Arrow output is not available on this server'}), 406
+                return add_cors_headers(response)
+
+            # Planner estimates keep accidental full scans off the shared database
+            decision = admission.admit(sql_query, analysis, query_run)
+            if decision.action == 'reject':
+                response = jsonify({
+                    'message': 'Query is too expensive to run interactively',
+                    'estimatedCost': decision.cost,
+                    'estimatedRows': decision.rows
+                }), 422
+                return add_cors_headers(response)
+            if decision.action == 'queue' and page_size is None:
+                try:
+                    job_id = jobs.submit_job(request.user, sql_query)
+                except jobs.JobQueueFull as e:
+                    response = jsonify({'message': str(e)}), 503
+                    response[0].headers['Retry-After'] = '5'
+                    return add_cors_headers(response)
+
+                save_history(user_id, sql_query, analysis)
+                response = jsonify({
+                    'message': 'Query is too expensive to run interactively and was queued as a job',
+                    'jobId': job_id,
+                    'status': 'queued',
+                    'estimatedCost': decision.cost,
+                    'estimatedRows': decision.rows
+                }), 202
+                return add_cors_headers(response)
+            sql_to_run = decision.sql
+
+            if page_size is not None:
+                # Materialize into a snapshot in the background and return the first window
+                try:
+                    snapshot_id = jobs.submit_job(
+                        request.user, sql_to_run, page_size,
+                        ttl=jobs.SNAPSHOT_TTL, max_rows=jobs.SNAPSHOT_MAX_ROWS, long_running=False
+                    )
+                except jobs.JobQueueFull as e:
+                    response = jsonify({'message': str(e)}), 503
+                    response[0].headers['Retry-After'] = '5'
+                    return add_cors_headers(response)
+
+                save_history(user_id, sql_query, analysis)
+                return result_window_response(snapshot_id, 0)
             
-            # Execute query directly (Redis caching removed for production stability)
-            result = query(sql_query)
-            
-            # Save to history
-            query(
-                'INSERT INTO queries (user_id, query_text) VALUES (%s, %s)',
-                (user_id, sql_query)
-            )
-            
-            response = jsonify({
-                'message': 'Query executed successfully',
-                'result': result
-            }), 200
+            stream_format = get_stream_format(data)
+            if stream_format:
+                # The slot is held until the stream is closed
+                slot = rate_limit.acquire_query_slot(request.user)
+                try:
+                    # Fetch the first batch up front so SQL errors still get a 500
+                    batches = stream_rows(sql_to_run, run=query_run)
+                    first_batch = next(batches, None)
+
+                    save_history(user_id, sql_query, analysis)
+                except Exception:
+                    slot.release()
+                    raise
+
+                response = Response(
+                    stream_with_context(encode_stream(first_batch, batches, stream_format)),
+                    mimetype=STREAM_FORMATS[stream_format]
+                )
+                response.call_on_close(slot.release)
+                response.headers['X-Accel-Buffering'] = 'no'
+                response.headers['X-Query-Run-Id'] = query_run.run_id
+                if decision.limit is not None:
+                    response.headers['X-Query-Auto-Limit'] = str(decision.limit)
+                return add_cors_headers(response)
+
+            fingerprint = decision.result_key if result_format == 'rows' else f"{decision.result_key}:{result_format}"
+            # Arrow bodies are binary; the cache and cross-worker coalescing only carry text
+            deterministic = analysis.deterministic and result_format != 'arrow'
+
+            # Opt-in Redis result cache; any Redis failure is treated as a miss
+            use_cache = deterministic and data.get('cache', QUERY_CACHE_ENABLED)
+            cache_status = 'BYPASS'
+            result_json = None
+            if use_cache:
+                result_json = get_cached_result(fingerprint)
+                cache_status = 'HIT' if result_json is not None else 'MISS'
+
+            coalesced = False
+            result_count = execution_time = None
+            if result_json is None:
+                def execute():
+                    nonlocal result_count, execution_time
+                    started = time.perf_counter()
+                    description, rows = query_rows(sql_to_run, run=query_run)
+                    execution_time = time.perf_counter() - started
+                    result_count = len(rows) if rows is not None else None
+                    return RESULT_ENCODERS[result_format](description, rows)
+
+                # Counts against the user's concurrent query quota, also while waiting on a shared execution
+                slot = rate_limit.acquire_query_slot(request.user)
+                try:
+                    if deterministic:
+                        # Identical concurrent queries share one execution
+                        result_json, coalesced = single_flight.do(fingerprint, execute)
+                    else:
+                        result_json = execute()
+                finally:
+                    slot.release()
+                if use_cache and not coalesced:
+                    cache_result(fingerprint, result_json)
+
+            # Save to history; count and timing are only known when this request ran the query
+            save_history(user_id, sql_query, analysis, result_count, execution_time)
+
+            if result_format == 'arrow':
+                response = current_app.response_class(result_json, mimetype=RESULT_FORMATS['arrow'])
+            else:
+                response = current_app.response_class(
+                    '{"message": "Query executed successfully", "result": ' + result_json + '}',
+                    mimetype='application/json'
+                )
+            response.headers['X-Cache'] = cache_status
+            response.headers['X-Cache-Fingerprint'] = fingerprint
+            response.headers['X-Query-Coalesced'] = 'true' if coalesced else 'false'
+            response.headers['X-Query-Run-Id'] = query_run.run_id
+            if decision.limit is not None:
+                response.headers['X-Query-Auto-Limit'] = str(decision.limit)
             return add_cors_headers(response)
+
+        except rate_limit.RateLimited as e:
+            return rate_limited_response(e)
+        
+        except pg_errors.QueryCanceled as e:
+            logger.info(f"Query run {query_run.run_id} cancelled: {str(e)}")
+            return query_canceled_response(query_run)
         
         except Exception as e:
             logger.error(f"Query execution error: {str(e)}")
@@ -98,6 +464,56 @@ def execute_query():
     
     return execute_with_auth()
 
+@queries_bp.route('/runs/<run_id>/cancel', methods=['POST', 'OPTIONS'])
+def cancel_query_run(run_id):
+    """
+    Cancel a running query
+    ---
+    tags:
+      - Queries
+    security:
+      - Bearer: []
+    parameters:
+      - in: path
+        name: run_id
+        required: true
+        type: string
+    responses:
+      200:
+        description: Cancellation sent
+      401:
+        description: Unauthorized
+      404:
+        description: Run not found
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        return add_cors_headers(response)
+
+    # Apply token validation only for non-OPTIONS requests
+    @token_required
+    def cancel_query_run_with_auth():
+        try:
+            run = get_run(request.user['id'], run_id) if is_valid_run_id(run_id) else None
+            if not run:
+                response = jsonify({'message': 'Run not found'}), 404
+                return add_cors_headers(response)
+
+            cancelled = cancel_run(request.user['id'], run_id)
+            response = jsonify({
+                'message': 'Query cancelled' if cancelled else 'Query is not running',
+                'runId': run_id,
+                'cancelled': cancelled
+            }), 200
+            return add_cors_headers(response)
+
+        except Exception as e:
+            logger.error(f"Query cancel error: {str(e)}")
+            response = jsonify({'message': str(e)}), 500
+            return add_cors_headers(response)
+
+    return cancel_query_run_with_auth()
+
 @queries_bp.route('/history', methods=['GET', 'OPTIONS'])
 def get_query_history():
     """
@@ -122,9 +538,13 @@ def get_query_history():
     def get_history_with_auth():
         try:
             current_user_id = request.user['id']
-            logger.info(f"Fetching query history for user_id: {current_user_id}")
-            history = query('SELECT id, user_id, query_text, created_at::text as created_at FROM queries WHERE user_id = %s ORDER BY created_at DESC', (current_user_id,))
-            logger.info(f"Query history: {history}")
+            history = query('SELECT id, user_id, query_text, result_count, execution_time, statement_type, fingerprint, tables, created_at::text as created_at FROM queries WHERE user_id = %s ORDER BY created_at DESC', (current_user_id,))
+            for item in history:
+                if item['fingerprint'] is None:
+                    # Saved before analysis was stored with the entry
+                    analysis = analyze(item['query_text'])
+                    item.update(statement_type=analysis.statement_type, fingerprint=analysis.fingerprint,
+                                tables=list(analysis.tables))
             
             response = jsonify({
                 'message': 'Query history retrieved successfully',
@@ -258,7 +678,7 @@ def delete_query(query_id):
 @queries_bp.route('/<int:query_id>/download', methods=['GET', 'OPTIONS'])
 def download_results(query_id):
     """
-    Download query results as CSV
+    Download query results as CSV, NDJSON or Parquet
     ---
     tags:
       - Queries
@@ -269,13 +689,31 @@ def download_results(query_id):
         name: query_id
         required: true
         type: integer
+      - in: query
+        name: format
+        required: false
+        type: string
+        enum: [csv, ndjson, parquet]
+        description: Defaults to the Accept header, then csv
+      - in: query
+        name: compression
+        required: false
+        type: string
+        enum: [gzip, zstd]
+        description: Compress a CSV or NDJSON export; Parquet is compressed internally
     responses:
       200:
-        description: CSV file
+        description: CSV, NDJSON or Parquet file
+      400:
+        description: Unsupported format or compression, or a SHOW or EXPLAIN query
       401:
         description: Unauthorized
       404:
         description: Query not found
+      406:
+        description: Parquet requested but pyarrow is not installed on the server
+      429:
+        description: Over the per-user rate or concurrent query limit; see Retry-After
     """
     if request.method == 'OPTIONS':
         response = make_response()
@@ -298,27 +736,77 @@ def download_results(query_id):
                 return add_cors_headers(response)
             
             sql_query = result[0]['query_text']
-            
-            # Execute query
-            result = query(sql_query)
-            
-            if not result:
-                response = jsonify({'message': 'No results to download'}), 404
+            download_format = get_download_format()
+            if download_format is None:
+                response = jsonify({'message': f"Unsupported format, use {', '.join(exports.DOWNLOAD_FORMATS)}"}), 400
                 return add_cors_headers(response)
-            
-            # Create CSV
-            output = StringIO()
-            writer = csv.DictWriter(output, fieldnames=result[0].keys())
-            writer.writeheader()
-            writer.writerows(result)
-            
-            # Create response
-            response = make_response(output.getvalue())
-            response.headers["Content-Disposition"] = f"attachment; filename=query-{query_id}.csv"
-            response.headers["Content-type"] = "text/csv"
-            
+            compression = request.args.get('compression') or None
+            if compression is not None and download_format == 'parquet':
+                response = jsonify({'message': 'Parquet files are compressed internally, omit compression'}), 400
+                return add_cors_headers(response)
+            compressions = [name for name in exports.DOWNLOAD_COMPRESSIONS if name in available_encodings()]
+            if compression is not None and compression not in compressions:
+                response = jsonify({'message': f"Unsupported compression, use {' or '.join(compressions)}"}), 400
+                return add_cors_headers(response)
+            if not runs_in_cursor(analyze(sql_query)):
+                response = jsonify({'message': 'SHOW and EXPLAIN results cannot be downloaded'}), 400
+                return add_cors_headers(response)
+            if download_format == 'parquet' and exports.pq is None:
+                response = jsonify({'message': 'Parquet export is not available on this server'}), 406
+                return add_cors_headers(response)
+
+            # Stream the export so memory stays constant: CSV straight out of COPY,
+            # the other formats batch by batch from a server-side cursor
+            slot = rate_limit.acquire_query_slot(request.user, long_running=True)
+            run = QueryRun(request.user, long_running=True)
+            try:
+                if download_format == 'csv':
+                    chunks = copy_query(sql_query, run=run)
+                    first_chunks = [next(chunks, b'')]
+                    if first_chunks[0].count(b'\n') <= 1:
+                        next_chunk = next(chunks, None)
+                        if next_chunk is None:
+                            # Only the header line came back
+                            slot.release()
+                            response = jsonify({'message': 'No results to download'}), 404
+                            return add_cors_headers(response)
+                        first_chunks.append(next_chunk)
+                    body = chain_closing(first_chunks, chunks)
+                else:
+                    if download_format == 'parquet':
+                        batches = stream_rows(sql_query, batch_size=exports.PARQUET_ROW_GROUP_SIZE, run=run)
+                    else:
+                        batches = stream_rows(sql_query, run=run)
+                    first_batch = next(batches, None)
+                    if first_batch is None:
+                        slot.release()
+                        response = jsonify({'message': 'No results to download'}), 404
+                        return add_cors_headers(response)
+                    if download_format == 'parquet':
+                        body = exports.parquet_chunks(first_batch, batches)
+                    else:
+                        body = exports.ndjson_chunks(first_batch, batches)
+            except Exception:
+                slot.release()
+                raise
+
+            mimetype, extension = exports.DOWNLOAD_FORMATS[download_format]
+            filename = f"query-{query_id}.{extension}"
+            if compression is not None:
+                body = compress_stream(body, compression)
+                mimetype, suffix = exports.DOWNLOAD_COMPRESSIONS[compression]
+                filename += f".{suffix}"
+
+            response = Response(stream_with_context(body), mimetype=mimetype)
+            response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+            response.headers['X-Accel-Buffering'] = 'no'
+            response.call_on_close(slot.release)
+
             return add_cors_headers(response)
         
+        except rate_limit.RateLimited as e:
+            return rate_limited_response(e)
+        
         except Exception as e:
             response = jsonify({'message': str(e)}), 500
             return add_cors_headers(response)
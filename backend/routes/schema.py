@@ -1,6 +1,6 @@
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, request, jsonify, make_response, current_app
 from middleware.auth_middleware import token_required
-from db.db import query
+from utils import schema_catalog, table_preview, autocomplete, column_profile, result_encoder
 
 schema_bp = Blueprint('schema', __name__)
 
@@ -22,6 +22,10 @@ def add_cors_headers(response):
             response.headers.add('Access-Control-Allow-Credentials', 'true')
         return response
 
+def json_response(payload):
+    """Encode a result payload with the configured result encoder"""
+    return current_app.response_class(result_encoder.dumps(payload), mimetype='application/json')
+
 @schema_bp.route('/tables', methods=['GET', 'OPTIONS'])
 def get_tables():
     """
@@ -45,23 +49,12 @@ def get_tables():
     @token_required
     def get_tables_with_auth():
         try:
-            sql = """
-                SELECT 
-                    table_name 
-                FROM 
-                    information_schema.tables 
-                WHERE 
-                    table_schema = 'public' 
-                    AND table_type = 'BASE TABLE'
-                ORDER BY 
-                    table_name
-            """
-            
-            result = query(sql)
+            # Served from the cached schema catalog
+            result = list(schema_catalog.get_catalog()['tables'])
             
-            response = jsonify({
+            response = json_response({
                 'message': 'Tables retrieved successfully',
-                'tables': [row['table_name'] for row in result]
+                'tables': result
             }), 200
             return add_cors_headers(response)
         
@@ -71,6 +64,101 @@ def get_tables():
     
     return get_tables_with_auth()
 
+@schema_bp.route('/catalog', methods=['GET', 'OPTIONS'])
+def get_schema_catalog():
+    """
+    Get every table with its columns, keys, indexes and estimated row count
+    ---
+    tags:
+      - Schema
+    security:
+      - Bearer: []
+    parameters:
+      - in: header
+        name: If-None-Match
+        required: false
+        type: string
+    responses:
+      200:
+        description: Schema catalog retrieved successfully
+      304:
+        description: Schema catalog unchanged since the given ETag
+      401:
+        description: Unauthorized
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        return add_cors_headers(response)
+    
+    # Apply token validation only for non-OPTIONS requests
+    @token_required
+    def get_schema_catalog_with_auth():
+        try:
+            etag, body = schema_catalog.get_catalog_payload()
+            
+            if request.if_none_match.contains_weak(etag.strip('"')):
+                response = make_response('', 304)
+            else:
+                response = current_app.response_class(body, mimetype='application/json')
+            response.headers['ETag'] = etag
+            # Clients may keep the catalog but must revalidate it
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return add_cors_headers(response)
+        
+        except Exception as e:
+            response = jsonify({'message': str(e)}), 500
+            return add_cors_headers(response)
+    
+    return get_schema_catalog_with_auth()
+
+@schema_bp.route('/complete', methods=['GET', 'OPTIONS'])
+def complete_identifiers():
+    """
+    Suggest table, column, function and keyword names for a prefix
+    ---
+    tags:
+      - Schema
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: prefix
+        required: true
+        type: string
+        description: Typed prefix; use table.prefix to complete that table's columns
+      - in: query
+        name: limit
+        required: false
+        type: integer
+    responses:
+      200:
+        description: Ranked suggestions
+      401:
+        description: Unauthorized
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        return add_cors_headers(response)
+    
+    # Apply token validation only for non-OPTIONS requests
+    @token_required
+    def complete_identifiers_with_auth():
+        try:
+            prefix = request.args.get('prefix', '')
+            limit = request.args.get('limit', autocomplete.COMPLETE_DEFAULT_LIMIT, type=int)
+            
+            response = json_response({
+                'prefix': prefix,
+                'suggestions': autocomplete.complete(prefix, limit)
+            }), 200
+            return add_cors_headers(response)
+        
+        except Exception as e:
+            response = jsonify({'message': str(e)}), 500
+            return add_cors_headers(response)
+    
+    return complete_identifiers_with_auth()
+
 @schema_bp.route('/tables/<table_name>', methods=['GET', 'OPTIONS'])
 def get_table_schema(table_name):
     """
@@ -102,80 +190,21 @@ def get_table_schema(table_name):
     def get_table_schema_with_auth():
         try:
             # Check if table exists
-            table_check_sql = """
-                SELECT 
-                    table_name 
-                FROM 
-                    information_schema.tables 
-                WHERE 
-                    table_schema = 'public' 
-                    AND table_name = %s
-            """
-            
-            table_check = query(table_check_sql, (table_name,))
+            table = schema_catalog.get_table(table_name)
             
-            if not table_check:
+            if table is None:
                 response = jsonify({'message': 'Table not found'}), 404
                 return add_cors_headers(response)
             
-            # Get columns
-            columns_sql = """
-                SELECT 
-                    column_name, 
-                    data_type, 
-                    is_nullable, 
-                    column_default
-                FROM 
-                    information_schema.columns 
-                WHERE 
-                    table_schema = 'public' 
-                    AND table_name = %s
-                ORDER BY 
-                    ordinal_position
-            """
-            
-            columns = query(columns_sql, (table_name,))
-            
-            # Get primary keys
-            pk_sql = """
-                SELECT 
-                    kcu.column_name
-                FROM 
-                    information_schema.table_constraints tc
-                    JOIN information_schema.key_column_usage kcu
-                    ON tc.constraint_name = kcu.constraint_name
-                WHERE 
-                    tc.constraint_type = 'PRIMARY KEY'
-                    AND tc.table_name = %s
-            """
-            
-            pk_result = query(pk_sql, (table_name,))
-            primary_keys = [row['column_name'] for row in pk_result]
+            # Columns and keys come from the cached schema catalog
+            columns = table['columns']
+            primary_keys = table['primaryKeys']
+            foreign_keys = table['foreignKeys']
             
-            # Get foreign keys
-            fk_sql = """
-                SELECT 
-                    kcu.column_name,
-                    ccu.table_name AS foreign_table_name,
-                    ccu.column_name AS foreign_column_name
-                FROM 
-                    information_schema.table_constraints tc
-                    JOIN information_schema.key_column_usage kcu
-                    ON tc.constraint_name = kcu.constraint_name
-                    JOIN information_schema.constraint_column_usage ccu
-                    ON ccu.constraint_name = tc.constraint_name
-                WHERE 
-                    tc.constraint_type = 'FOREIGN KEY'
-                    AND tc.table_name = %s
-            """
+            # Get sample data (sampled, truncated and cached until the table's stats change)
+            sample_data = table_preview.get_preview(table)
             
-            foreign_keys = query(fk_sql, (table_name,))
-            
-            # Get sample data
-            sample_sql = f"SELECT * FROM {table_name} LIMIT 5"
-            sample_data = query(sample_sql)
-            
-            response = jsonify({
+            response = json_response({
                 'message': 'Table schema retrieved successfully',
                 'table': table_name,
                 'columns': columns,
@@ -189,4 +218,50 @@ def get_table_schema(table_name):
             response = jsonify({'message': str(e)}), 500
             return add_cors_headers(response)
     
-    return get_table_schema_with_auth()
\ No newline at end of file
+    return get_table_schema_with_auth()
+
+@schema_bp.route('/tables/<table_name>/profile', methods=['GET', 'OPTIONS'])
+def get_table_profile(table_name):
+    """
+    Get per-column statistics for a table
+    ---
+    tags:
+      - Schema
+    security:
+      - Bearer: []
+    parameters:
+      - in: path
+        name: table_name
+        required: true
+        type: string
+    responses:
+      200:
+        description: Null fraction, distinct count, top values and histogram per column
+      401:
+        description: Unauthorized
+      404:
+        description: Table not found
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        return add_cors_headers(response)
+    
+    # Apply token validation only for non-OPTIONS requests
+    @token_required
+    def get_table_profile_with_auth():
+        try:
+            table = schema_catalog.get_table(table_name)
+            
+            if table is None:
+                response = jsonify({'message': 'Table not found'}), 404
+                return add_cors_headers(response)
+            
+            # From pg_stats where the table is analyzed, a sampled scan otherwise
+            response = json_response(column_profile.get_profile(table)), 200
+            return add_cors_headers(response)
+        
+        except Exception as e:
+            response = jsonify({'message': str(e)}), 500
+            return add_cors_headers(response)
+    
+    return get_table_profile_with_auth()
@@ -0,0 +1,41 @@
+import os
+import sys
+
+# Modules import each other as top-level packages (from utils import ..., from db.db import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+import pytest
+
+@pytest.fixture
+def client(monkeypatch):
+    """Flask test client with Redis treated as unavailable"""
+    from utils import query_cache, user_cache
+    monkeypatch.setattr(query_cache.redis_client, 'available', lambda: False)
+    monkeypatch.setattr(user_cache, '_ensure_listener', lambda: None)
+    import app
+    return app.app.test_client()
+
+@pytest.fixture
+def auth_headers():
+    """Build a Bearer header for a regular user; the claims are complete, so no user lookup runs"""
+    from middleware.auth_middleware import JWT_SECRET
+
+    def headers(user_id=1):
+        claims = {'id': user_id, 'username': f"user{user_id}", 'email': f"user{user_id}@example.com", 'userType': 'regular_user'}
+        return {'Authorization': 'Bearer ' + jwt.encode(claims, JWT_SECRET, algorithm='HS256')}
+    return headers
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Point the shared RedisClient at an in-memory fakeredis server; yields the text client"""
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    from utils.redis_client import redis_client
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(redis_client, '_client', client)
+    monkeypatch.setattr(redis_client, '_binary_client', fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(redis_client, '_scripts', {})
+    monkeypatch.setattr(redis_client, 'breaker', redis_client.breaker.__class__(lambda: None))
+    return client
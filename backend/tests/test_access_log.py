@@ -0,0 +1,53 @@
+import json
+import logging
+import pytest
+from middleware import access_log
+
+@pytest.fixture
+def access_records(monkeypatch):
+    records = []
+
+    class Collect(logging.Handler):
+        def emit(self, record):
+            records.append(json.loads(record.getMessage()))
+
+    handler = Collect()
+    access_log.access_logger.addHandler(handler)
+    monkeypatch.setattr(access_log.access_logger, 'level', logging.INFO)
+    monkeypatch.setattr(access_log, 'ACCESS_LOG_ENABLED', True)
+    yield records
+    access_log.access_logger.removeHandler(handler)
+
+def test_unsampled_fast_request_is_skipped(client, access_records, monkeypatch):
+    monkeypatch.setattr(access_log, 'ACCESS_LOG_SAMPLE_RATE', 0)
+    client.get('/api/routes')
+    assert access_records == []
+
+def test_sampled_request_is_logged(client, access_records, monkeypatch):
+    monkeypatch.setattr(access_log, 'ACCESS_LOG_SAMPLE_RATE', 1)
+    client.get('/api/routes')
+    assert len(access_records) == 1
+    entry = access_records[0]
+    assert entry['path'] == '/api/routes'
+    assert entry['status'] == 200
+    assert entry['sampleRate'] == 1
+    assert entry['responseBytes'] > 0
+
+def test_route_override_disables_health_checks(client, access_records, monkeypatch):
+    monkeypatch.setattr(access_log, 'ACCESS_LOG_SAMPLE_RATE', 1)
+    client.get('/health')
+    assert access_records == []
+
+def test_slow_request_is_always_logged(client, access_records, monkeypatch):
+    monkeypatch.setattr(access_log, 'ACCESS_LOG_SAMPLE_RATE', 0)
+    monkeypatch.setattr(access_log, 'ACCESS_LOG_SLOW_MS', 0.000001)
+    client.get('/api/routes')
+    assert len(access_records) == 1
+    assert access_records[0]['sampleRate'] == 0
+
+def test_login_body_is_never_logged(client, access_records, monkeypatch):
+    monkeypatch.setattr(access_log, 'ACCESS_LOG_SAMPLE_RATE', 1)
+    monkeypatch.setattr(access_log, 'ACCESS_LOG_BODY', True)
+    client.post('/api/auth/login', json={'username': 'a', 'password': 'secret'})
+    assert access_records
+    assert 'body' not in access_records[0]
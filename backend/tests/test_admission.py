@@ -0,0 +1,56 @@
+import pytest
+from utils import admission
+from utils.sql_analyzer import analyze
+
+@pytest.mark.parametrize('sql', [
+    'SELECT * FROM users',
+    'SELECT * FROM users;',
+    'SELECT * FROM users -- every user',
+    'SELECT * FROM users; -- every user',
+])
+def test_limited_sql_wraps_original_text(sql):
+    assert admission.limited_sql(sql, 10) == 'SELECT * FROM (SELECT * FROM users\n) AS limited LIMIT 10'
+
+def test_limited_sql_keeps_case_sensitive_literals():
+    sql = "SELECT * FROM users WHERE username = 'Alice'"
+    assert "'Alice'" in admission.limited_sql(sql, 5)
+
+def test_admit_limit_runs_wrapped_original(monkeypatch):
+    sql = "SELECT * FROM users WHERE username = 'Alice' -- big"
+    estimates = []
+
+    def estimate(text, key, run=None):
+        estimates.append(text)
+        return (10.0, 1.0) if 'LIMIT' in text else (1e12, 1e9)
+
+    monkeypatch.setattr(admission, 'ADMISSION_CONTROL_ENABLED', True)
+    monkeypatch.setattr(admission, 'ADMISSION_ACTION', 'limit')
+    monkeypatch.setattr(admission, 'ADMISSION_AUTO_LIMIT', 100)
+    monkeypatch.setattr(admission, 'estimate', estimate)
+
+    decision = admission.admit(sql, analyze(sql))
+    assert decision.action == 'limit'
+    assert decision.limit == 100
+    assert decision.sql == "SELECT * FROM (SELECT * FROM users WHERE username = 'Alice'\n) AS limited LIMIT 100"
+    assert estimates == [sql, decision.sql]
+
+def test_admit_skips_show(monkeypatch):
+    monkeypatch.setattr(admission, 'ADMISSION_CONTROL_ENABLED', True)
+    monkeypatch.setattr(admission, 'estimate', lambda text, key, run=None: pytest.fail('SHOW is not explainable'))
+    assert admission.admit('SHOW work_mem', analyze('SHOW work_mem')).action == 'allow'
+
+def test_estimate_runs_under_the_query_run(monkeypatch):
+    calls = []
+
+    def query(sql, params=None, run=None):
+        calls.append((sql, run))
+        return [{'QUERY PLAN': [{'Plan': {'Total Cost': 12.5, 'Plan Rows': 3}}]}]
+
+    monkeypatch.setattr(admission, 'query', query)
+    monkeypatch.setattr(admission, '_plans', admission.OrderedDict())
+    run = object()
+    assert admission.estimate('SELECT 1', 'fingerprint', run) == (12.5, 3)
+    assert calls == [('EXPLAIN (FORMAT JSON) SELECT 1', run)]
+    # Cached estimates skip the database
+    assert admission.estimate('SELECT 1', 'fingerprint', run) == (12.5, 3)
+    assert len(calls) == 1
@@ -0,0 +1,59 @@
+import pytest
+from utils import autocomplete, schema_catalog
+
+def table(name, *columns):
+    return {'name': name, 'estimatedRows': 0, 'columns': [{'column_name': column} for column in columns]}
+
+@pytest.fixture
+def catalog(monkeypatch):
+    current = {'version': '1', 'tables': {'orders': table('orders', 'id', 'created_at')}}
+    monkeypatch.setattr(schema_catalog, 'get_catalog', lambda: current)
+    monkeypatch.setattr(schema_catalog, 'get_table', lambda name: current['tables'].get(name))
+    monkeypatch.setattr(autocomplete, 'query', lambda sql: [{'name': 'count'}])
+    monkeypatch.setattr(autocomplete, '_index', None)
+    monkeypatch.setattr(autocomplete, '_catalog', None)
+    monkeypatch.setattr(autocomplete, '_functions', set())
+    # Incremental updates even for a one-table catalog
+    monkeypatch.setattr(autocomplete, 'COMPLETE_FULL_REBUILD_RATIO', 10)
+    return current
+
+def names(suggestions):
+    return [suggestion['name'] for suggestion in suggestions]
+
+def test_complete_ranks_whole_names_before_segments(catalog):
+    assert names(autocomplete.complete('ord'))[0] == 'orders'
+    assert 'created_at' in names(autocomplete.complete('at'))
+    assert names(autocomplete.complete('orders.cr')) == ['created_at']
+
+def test_update_does_not_touch_published_index(catalog, monkeypatch):
+    before = autocomplete._sync()
+    snapshot = (list(before.names), list(before.segments))
+
+    updated = {'version': '2', 'tables': dict(catalog['tables'], customers=table('customers', 'customer_name'))}
+    monkeypatch.setattr(schema_catalog, 'get_catalog', lambda: updated)
+
+    after = autocomplete._sync()
+    assert after is not before
+    assert (before.names, before.segments) == snapshot
+    assert 'customers' in names(autocomplete.complete('cust'))
+    assert not any(name == 'customers' for _, _, name in before.names)
+
+def test_estimate_refresh_keeps_index(catalog, monkeypatch):
+    before = autocomplete._sync()
+    refreshed = {'version': '1', 'tables': {'orders': dict(catalog['tables']['orders'], estimatedRows=500)}}
+    monkeypatch.setattr(schema_catalog, 'get_catalog', lambda: refreshed)
+    monkeypatch.setattr(autocomplete, 'query', lambda sql: pytest.fail('functions reloaded without DDL'))
+    assert autocomplete._sync() is before
+
+def test_ddl_without_name_changes_keeps_index(catalog, monkeypatch):
+    before = autocomplete._sync()
+    altered = {'version': '2', 'tables': {'orders': dict(catalog['tables']['orders'])}}
+    monkeypatch.setattr(schema_catalog, 'get_catalog', lambda: altered)
+    assert autocomplete._sync() is before
+
+def test_new_function_updates_index(catalog, monkeypatch):
+    autocomplete._sync()
+    altered = {'version': '2', 'tables': catalog['tables']}
+    monkeypatch.setattr(schema_catalog, 'get_catalog', lambda: altered)
+    monkeypatch.setattr(autocomplete, 'query', lambda sql: [{'name': 'count'}, {'name': 'order_total'}])
+    assert 'order_total' in names(autocomplete.complete('order_'))
@@ -0,0 +1,72 @@
+from datetime import datetime
+import pytest
+from utils import column_profile
+
+TABLE = {
+    'name': 'orders',
+    'estimatedRows': 1000,
+    'columns': [{'column_name': 'id', 'data_type': 'integer'}, {'column_name': 'note', 'data_type': 'text'}],
+}
+
+@pytest.fixture
+def database(monkeypatch):
+    state = {'analyzed_at': datetime(2024, 3, 1), 'queries': 0, 'pg_stats': ['id']}
+
+    def query(statement, params=None):
+        state['queries'] += 1
+        if statement is column_profile.PG_STATS_SQL:
+            assert params == ('orders',)
+            return [{
+                'attname': name, 'null_frac': 0.0, 'n_distinct': -1.0, 'avg_width': 4, 'correlation': 0.9,
+                'most_common_vals': None, 'most_common_freqs': None, 'histogram_bounds': ['1', '500', '1000'],
+            } for name in state['pg_stats']]
+        # The sampled scan over columns pg_stats has nothing on
+        return [{'sampled': 200, 'non_null_0': 150, 'distinct_0': 2,
+                 'top_0': [{'value': 'rush', 'count': 100}, {'value': 'gift', 'count': 50}]}]
+
+    monkeypatch.setattr(column_profile, 'query', query)
+    monkeypatch.setattr(column_profile, 'get_table_stats', lambda name: {'analyzed_at': state['analyzed_at']})
+    monkeypatch.setattr(column_profile, '_profiles', column_profile.OrderedDict())
+    return state
+
+def test_profile_merges_pg_stats_and_sample(database):
+    profile = column_profile.get_profile(TABLE)
+    assert profile['analyzedAt'] == '2024-03-01T00:00:00'
+    by_name = {column['name']: column for column in profile['columns']}
+
+    assert by_name['id']['source'] == 'pg_stats'
+    # Negative n_distinct is a fraction of the row estimate
+    assert by_name['id']['distinctCount'] == 1000
+    assert by_name['id']['histogramBounds'] == ['1', '500', '1000']
+
+    assert by_name['note']['source'] == 'sample'
+    assert by_name['note']['sampledRows'] == 200
+    assert by_name['note']['nullFraction'] == 0.25
+    assert by_name['note']['topValues'] == [{'value': 'rush', 'frequency': 0.5}, {'value': 'gift', 'frequency': 0.25}]
+
+def test_fully_analyzed_table_skips_sampling(database):
+    database['pg_stats'] = ['id', 'note']
+    column_profile.get_profile(TABLE)
+    assert database['queries'] == 1
+
+def test_profile_is_cached_until_analyze(database):
+    database['pg_stats'] = ['id', 'note']
+    column_profile.get_profile(TABLE)
+    column_profile.get_profile(TABLE)
+    assert database['queries'] == 1
+
+    database['analyzed_at'] = datetime(2024, 3, 2)
+    assert column_profile.get_profile(TABLE)['analyzedAt'] == '2024-03-02T00:00:00'
+    assert database['queries'] == 2
+
+def test_sampled_profiles_age_out(database, monkeypatch):
+    column_profile.get_profile(TABLE)
+    assert database['queries'] == 2
+    column_profile.get_profile(TABLE)
+    assert database['queries'] == 2
+
+    monkeypatch.setattr(column_profile, 'PROFILE_SAMPLED_TTL', -1)
+    column_profile._profiles.clear()
+    column_profile.get_profile(TABLE)
+    column_profile.get_profile(TABLE)
+    assert database['queries'] == 6
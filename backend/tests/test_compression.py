@@ -0,0 +1,48 @@
+import gzip
+import zstandard
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+from middleware import compression as compression_middleware
+from utils import compression
+
+def accept(header):
+    return parse_accept_header(header, Accept)
+
+def test_negotiate_prefers_client_weight_then_server_order():
+    assert compression_middleware.negotiate_encoding(accept('gzip, zstd')) == 'zstd'
+    assert compression_middleware.negotiate_encoding(accept('gzip;q=1, zstd;q=0.5')) == 'gzip'
+    assert compression_middleware.negotiate_encoding(accept('zstd;q=0, gzip;q=0')) is None
+    assert compression_middleware.negotiate_encoding(accept('identity')) is None
+
+def test_compress_stream_round_trips_every_encoding():
+    chunks = [b'{"id":1}\n', '{"id":2}\n', b'{"id":3}\n']
+    expected = b'{"id":1}\n{"id":2}\n{"id":3}\n'
+    assert gzip.decompress(b''.join(compression.compress_stream(iter(chunks), 'gzip', flush=True))) == expected
+    data = b''.join(compression.compress_stream(iter(chunks), 'zstd', flush=True))
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(data) == expected
+
+def test_compress_stream_closes_source():
+    closed = []
+
+    def source():
+        try:
+            yield b'a' * 10
+            yield b'b' * 10
+        finally:
+            closed.append(True)
+
+    stream = compression.compress_stream(source(), 'gzip', flush=True)
+    next(stream)
+    stream.close()
+    assert closed == [True]
+
+def test_large_response_is_compressed(client):
+    response = client.get('/api/routes', headers={'Accept-Encoding': 'gzip'})
+    assert len(gzip.decompress(response.data)) >= compression_middleware.COMPRESSION_MIN_SIZE
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+def test_small_response_is_sent_as_is(client):
+    response = client.get('/health', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json()
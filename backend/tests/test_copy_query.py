@@ -0,0 +1,141 @@
+import pytest
+from psycopg2 import extensions
+from db import db
+from routes import queries
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+
+    def fetchone(self):
+        return (4242, '0', 'app')
+
+    def copy_expert(self, sql, file):
+        self.conn.executed.append(sql)
+        file.write('id\n1\n')
+
+class FakeConnection:
+    closed = 0
+    encoding = 'UTF8'
+
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+class FakeRun:
+    timeout_ms = 1000
+    application_name = 'test'
+    pid = None
+
+    def started(self, pid):
+        self.pid = pid
+
+    def finished(self):
+        pass
+
+@pytest.fixture
+def connection(monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(db, 'get_connection', lambda: conn)
+    monkeypatch.setattr(db, '_pool', db.ConnectionPool(min_size=0))
+    return conn
+
+@pytest.mark.parametrize('sql', [
+    'SELECT 1',
+    'SELECT 1;',
+    'SELECT 1 -- one',
+    'SELECT 1; -- one\n',
+])
+def test_copy_wraps_statement(connection, sql):
+    assert b''.join(db.copy_query(sql)) == b'id\n1\n'
+    assert connection.executed[-1] == 'COPY (SELECT 1\n) TO STDOUT WITH CSV HEADER'
+
+def test_tracked_run_is_read_only(connection):
+    run = FakeRun()
+    list(db.copy_query('SELECT 1', run=run))
+    assert connection.executed[0] == 'SET TRANSACTION READ ONLY'
+    assert run.pid == 4242
+
+def test_download_rejects_show(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(queries, 'query', lambda sql, params=None, run=None: [{'query_text': 'SHOW work_mem'}])
+    monkeypatch.setattr(queries, 'copy_query', lambda *args, **kwargs: pytest.fail('SHOW cannot run in COPY'))
+    response = client.get('/api/queries/1/download', headers=auth_headers())
+    assert response.status_code == 400
+    assert 'SHOW' in response.get_json()['message']
+
+@pytest.mark.parametrize('body', [
+    {'query': 'SHOW work_mem', 'stream': True},
+    {'query': 'EXPLAIN SELECT 1', 'pageSize': 10},
+])
+def test_execute_rejects_show_in_cursor_modes(client, auth_headers, monkeypatch, body):
+    monkeypatch.setattr(queries, 'stream_rows', lambda *args, **kwargs: pytest.fail('SHOW cannot run in a cursor'))
+    monkeypatch.setattr(queries.jobs, 'submit_job', lambda *args, **kwargs: pytest.fail('SHOW cannot run in a cursor'))
+    response = client.post('/api/queries/execute', json=body, headers=auth_headers())
+    assert response.status_code == 400
+    assert 'SHOW' in response.get_json()['message']
+
+class Source:
+    """Generator stand-in that records whether it was closed"""
+
+    def __init__(self, items):
+        self.items = iter(items)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.items)
+
+    def close(self):
+        self.closed = True
+
+@pytest.mark.parametrize('download_format', ['csv', 'ndjson'])
+def test_download_closes_source_when_client_disconnects(client, auth_headers, monkeypatch, download_format):
+    sources = []
+
+    def copy_query(sql, run=None):
+        sources.append(Source([b'id\n1\n', b'2\n', b'3\n']))
+        return sources[-1]
+
+    def stream_rows(sql, batch_size=None, run=None):
+        sources.append(Source([(description, [(1,)]), (description, [(2,)]), (description, [(3,)])]))
+        return sources[-1]
+
+    description = [type('Column', (), {'name': 'id', 'type_code': 23})()]
+    monkeypatch.setattr(queries, 'query', lambda sql, params=None, run=None: [{'query_text': 'SELECT id FROM t'}])
+    monkeypatch.setattr(queries, 'copy_query', copy_query)
+    monkeypatch.setattr(queries, 'stream_rows', stream_rows)
+
+    response = client.get(f"/api/queries/1/download?format={download_format}", headers=auth_headers(),
+                          buffered=False)
+    assert response.status_code == 200
+    next(response.response)
+    response.close()
+    assert sources[0].closed
@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+import pytest
+from psycopg2 import extensions
+from db import db
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                if connection.broken:
+                    raise db.psycopg2.OperationalError('server closed the connection unexpectedly')
+        return Cursor()
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def opened(monkeypatch):
+    connections = []
+
+    def connect(dsn):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(db.psycopg2, 'connect', connect)
+    return connections
+
+def pool(**options):
+    return db.ConnectionPool(**dict({'min_size': 0, 'max_size': 2, 'timeout': 0.05}, **options))
+
+def test_connections_are_reused(opened):
+    p = pool()
+    with p.connection() as first:
+        pass
+    with p.connection() as second:
+        pass
+    assert first is second
+    stats = p.stats()
+    assert (stats['connections_opened'], stats['checkouts'], stats['idle'], stats['in_use']) == (1, 2, 1, 0)
+
+def test_warm_opens_min_size(opened):
+    p = pool(min_size=2)
+    p.warm()
+    assert len(opened) == 2
+    assert p.stats()['idle'] == 2
+
+def test_checkout_times_out_when_exhausted(opened):
+    p = pool(max_size=1)
+    conn = p.getconn()
+    with pytest.raises(db.PoolTimeout):
+        p.getconn()
+    p.putconn(conn)
+    stats = p.stats()
+    assert stats['timeouts'] == 1
+    assert p.getconn() is conn
+
+def test_waiters_are_counted(opened):
+    p = pool(max_size=1, timeout=1)
+    conn = p.getconn()
+    threading.Timer(0.05, p.putconn, (conn,)).start()
+    assert p.getconn() is conn
+    stats = p.stats()
+    assert stats['wait_count'] == 1
+    assert stats['wait_time_max'] > 0
+
+def test_failed_health_check_replaces_connection(opened):
+    p = pool(health_check_after=0)
+    with p.connection() as conn:
+        pass
+    conn.broken = True
+    with p.connection() as replacement:
+        pass
+    assert replacement is not conn
+    assert conn.closed
+    stats = p.stats()
+    assert stats['health_check_failures'] == 1
+    assert stats['connections_closed'] == 1
+
+def test_idle_connections_skip_health_check(opened):
+    p = pool(health_check_after=3600)
+    with p.connection() as conn:
+        pass
+    conn.broken = True
+    with p.connection() as again:
+        pass
+    assert again is conn
+
+def test_expired_connections_are_recycled(opened):
+    p = pool(max_lifetime=0.05)
+    with p.connection() as conn:
+        pass
+    time.sleep(0.06)
+    with p.connection() as replacement:
+        pass
+    assert replacement is not conn
+    assert conn.closed
+    # Recycling is not a health check failure
+    assert p.stats()['health_check_failures'] == 0
+
+def test_open_transaction_is_rolled_back_on_return(opened):
+    p = pool()
+    with p.connection() as conn:
+        conn.status = extensions.TRANSACTION_STATUS_INTRANS
+    assert conn.rollbacks == 1
+    assert p.stats()['idle'] == 1
+
+def test_forked_child_starts_empty_without_closing_parent_connections(opened):
+    p = pool()
+    with p.connection() as inherited:
+        pass
+    checked_out = p.getconn()
+
+    # As seen from a worker forked after the parent opened its connections
+    p._pid = os.getpid() + 1
+    with p.connection() as conn:
+        pass
+    assert conn not in (inherited, checked_out)
+    assert not inherited.closed
+    stats = p.stats()
+    assert (stats['connections_opened'], stats['idle']) == (1, 1)
+    # A connection checked out before the fork is not taken back
+    p.putconn(checked_out)
+    assert p.stats()['idle'] == 1
+    assert not checked_out.closed
+
+def test_closeall_refuses_checkouts(opened):
+    p = pool()
+    with p.connection() as conn:
+        pass
+    p.closeall()
+    assert conn.closed
+    with pytest.raises(db.PoolTimeout):
+        p.getconn()
@@ -0,0 +1,45 @@
+import pytest
+from routes import queries
+
+@pytest.fixture
+def database(monkeypatch):
+    calls = []
+    rows = []
+
+    def query(sql, params=None, run=None):
+        calls.append((sql, params))
+        return rows if sql.startswith('SELECT') else None
+
+    monkeypatch.setattr(queries, 'query', query)
+    return calls, rows
+
+def test_history_stores_analysis(client, auth_headers, database, monkeypatch):
+    calls, _ = database
+    monkeypatch.setattr(queries, 'query_rows', lambda sql, params=None, run=None: ([], []))
+    response = client.post('/api/queries/execute', json={'query': 'SELECT * FROM users', 'cache': False},
+                           headers=auth_headers())
+    assert response.status_code == 200
+
+    sql, params = calls[-1]
+    assert sql.startswith('INSERT INTO queries')
+    assert params[0] == 1
+    assert params[4:] == ('select', queries.analyze('SELECT * FROM users').fingerprint, ['users'])
+
+def test_history_uses_stored_analysis(client, auth_headers, database, monkeypatch):
+    _, rows = database
+    rows.append({'id': 1, 'query_text': 'SELECT * FROM users', 'statement_type': 'select',
+                 'fingerprint': 'f' * 64, 'tables': ['users']})
+    monkeypatch.setattr(queries, 'analyze', lambda sql: pytest.fail('stored analysis should be used'))
+
+    history = client.get('/api/queries/history', headers=auth_headers()).get_json()['history']
+    assert history[0]['tables'] == ['users']
+    assert history[0]['fingerprint'] == 'f' * 64
+
+def test_history_analyzes_older_entries(client, auth_headers, database):
+    _, rows = database
+    rows.append({'id': 1, 'query_text': 'SELECT * FROM queries', 'statement_type': None,
+                 'fingerprint': None, 'tables': None})
+
+    history = client.get('/api/queries/history', headers=auth_headers()).get_json()['history']
+    assert history[0]['statement_type'] == 'select'
+    assert history[0]['tables'] == ['queries']
@@ -0,0 +1,149 @@
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+import pytest
+from utils import jobs, query_tracker, rate_limit, result_store
+
+class RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append((fn, args))
+
+    def run_all(self):
+        for fn, args in self.submitted:
+            fn(*args)
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = RecordingExecutor()
+    monkeypatch.setattr(result_store, 'get_redis_client', lambda: None)
+    monkeypatch.setattr(result_store, '_local', result_store._LocalStore())
+    monkeypatch.setattr(jobs, '_get_executor', lambda long_running=True: executor)
+    monkeypatch.setattr(jobs, '_local_jobs', {})
+    monkeypatch.setattr(rate_limit, 'get_redis_client', lambda: None)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_MAX_CONCURRENT_QUERIES', 2)
+    monkeypatch.setattr(rate_limit, '_local_running', {})
+    return executor
+
+USER = {'id': 1, 'userType': 'regular_user'}
+
+def submitted_run(executor):
+    fn, (job_id, local, run, sql, page_size, max_rows, slot) = executor.submitted[-1]
+    return run
+
+def test_jobs_get_long_running_timeout(executor):
+    jobs.submit_job(USER, 'SELECT 1')
+    assert submitted_run(executor).timeout_ms == query_tracker.LONG_RUNNING_TIMEOUT_MS
+
+def test_snapshots_keep_interactive_timeout(executor):
+    jobs.submit_job(USER, 'SELECT 1', 10, long_running=False)
+    assert submitted_run(executor).timeout_ms == query_tracker.statement_timeout_for(USER)
+
+def test_job_metadata(executor):
+    job_id = jobs.submit_job(USER, 'SELECT 1', 10)
+    job = jobs.get_job(job_id)
+    assert job['userId'] == 1
+    assert job['status'] == 'queued'
+    assert job['pageSize'] == 10
+
+def test_jobs_count_against_concurrent_queries(executor, monkeypatch):
+    jobs.submit_job(USER, 'SELECT 1')
+    jobs.submit_job(USER, 'SELECT 2', long_running=False)
+    with pytest.raises(rate_limit.RateLimited):
+        jobs.submit_job(USER, 'SELECT 3')
+    # Another user's quota is separate
+    jobs.submit_job({'id': 2, 'userType': 'regular_user'}, 'SELECT 4')
+
+    def no_database():
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(jobs, 'get_pool', no_database)
+    executor.run_all()
+    assert rate_limit._local_running == {}
+    jobs.submit_job(USER, 'SELECT 5')
+
+def test_full_queue_releases_slot(executor, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_MAX_QUEUED', 0)
+    with pytest.raises(jobs.JobQueueFull):
+        jobs.submit_job(USER, 'SELECT 1')
+    assert rate_limit._local_running == {}
+
+def test_cancel_keeps_snapshot_ttl(executor, monkeypatch):
+    ttls = []
+    put_meta = result_store.put_meta
+
+    def recording_put_meta(namespace, result_id, fields, ttl):
+        if namespace == jobs.NAMESPACE and 'cancelRequested' in fields:
+            ttls.append(ttl)
+        put_meta(namespace, result_id, fields, ttl=ttl)
+
+    monkeypatch.setattr(result_store, 'put_meta', recording_put_meta)
+    monkeypatch.setattr(jobs, 'cancel_run', lambda user_id, run_id: True)
+
+    job_id = jobs.submit_job(USER, 'SELECT 1', 10, ttl=jobs.SNAPSHOT_TTL, long_running=False)
+    jobs.cancel_job(job_id, USER['id'])
+    # As seen from a worker that does not run the snapshot
+    jobs._local_jobs.clear()
+    jobs.cancel_job(job_id, USER['id'])
+    assert ttls == [jobs.SNAPSHOT_TTL] * 3
+
+Column = namedtuple('Column', 'name type_code')
+
+class SnapshotConnection:
+    """Serves one row to a named cursor"""
+
+    def cursor(self, name=None):
+        @contextmanager
+        def cursor():
+            class Cursor:
+                description = [Column('n', 23)]
+                rows = [(1,)]
+
+                def execute(self, sql):
+                    pass
+
+                def fetchmany(self, size):
+                    rows, self.rows = self.rows, []
+                    return rows
+            yield Cursor()
+        return cursor()
+
+    def commit(self):
+        pass
+
+def test_snapshot_is_served_while_jobs_are_busy(monkeypatch):
+    monkeypatch.setattr(result_store, 'get_redis_client', lambda: None)
+    monkeypatch.setattr(result_store, '_local', result_store._LocalStore())
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_ENABLED', False)
+    monkeypatch.setattr(jobs, 'JOB_WORKERS', 1)
+    monkeypatch.setattr(jobs, '_executors', {})
+    monkeypatch.setattr(jobs, '_executor_pid', None)
+    monkeypatch.setattr(jobs, '_local_jobs', {})
+    monkeypatch.setattr(jobs, 'begin_run', lambda cur, run: None)
+    monkeypatch.setattr(jobs, 'end_run', lambda run: None)
+    release = threading.Event()
+
+    class Pool:
+        @contextmanager
+        def connection(self):
+            if threading.current_thread().name.startswith('query-job'):
+                # A long job holding the only job thread
+                release.wait(5)
+            yield SnapshotConnection()
+
+    monkeypatch.setattr(jobs, 'get_pool', Pool)
+    try:
+        jobs.submit_job(USER, 'SELECT pg_sleep(600)')
+        jobs.submit_job(USER, 'SELECT pg_sleep(600)')
+        snapshot_id = jobs.submit_job(USER, 'SELECT 1', 10, ttl=jobs.SNAPSHOT_TTL, long_running=False)
+        job = jobs.wait_for_page(snapshot_id, 0, 2)
+        assert job['pages'] == 1
+        assert jobs.get_job_page(snapshot_id, 0) == '[{"n":1}]'
+    finally:
+        release.set()
+        # Let the jobs finish before the patches above are undone
+        for pool in list(jobs._executors.values()):
+            pool.shutdown(wait=True)
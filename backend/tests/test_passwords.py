@@ -0,0 +1,48 @@
+import time
+import bcrypt
+import pytest
+from utils import passwords
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(passwords, 'BCRYPT_ROUNDS', 4)
+    monkeypatch.setattr(passwords, '_executor_pid', None)
+    yield
+    passwords._get_executor().shutdown(wait=True)
+
+def test_hash_round_trip(pool):
+    password_hash = passwords.hash_password('secret')
+    assert passwords._rounds(password_hash) == 4
+    assert passwords.verify_password('secret', password_hash)
+    assert not passwords.verify_password('wrong', password_hash)
+
+def test_full_pool_is_busy(pool, monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_MAX_QUEUED', 0)
+    with pytest.raises(passwords.PasswordHashingBusy):
+        passwords.hash_password('secret')
+
+def test_slow_hash_times_out(pool, monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_TIMEOUT', 0.01)
+    monkeypatch.setattr(passwords, '_hash', lambda password: time.sleep(0.2))
+    with pytest.raises(passwords.PasswordHashingBusy):
+        passwords.hash_password('secret')
+
+def test_login_rehashes_at_current_cost(pool, monkeypatch):
+    updates = []
+    monkeypatch.setattr(passwords, 'query', lambda sql, params: updates.append(params))
+    old_hash = bcrypt.hashpw(b'secret', bcrypt.gensalt(rounds=5)).decode('utf-8')
+
+    assert passwords.verify_password('secret', old_hash, user_id=7)
+    passwords._get_executor().shutdown(wait=True)
+    new_hash, user_id, replaced = updates[0]
+    assert (user_id, replaced) == (7, old_hash)
+    assert passwords._rounds(new_hash) == 4
+    assert bcrypt.checkpw(b'secret', new_hash.encode('utf-8'))
+
+def test_current_cost_is_not_rehashed(pool, monkeypatch):
+    updates = []
+    monkeypatch.setattr(passwords, 'query', lambda sql, params: updates.append(params))
+    current = bcrypt.hashpw(b'secret', bcrypt.gensalt(rounds=4)).decode('utf-8')
+    assert passwords.verify_password('secret', current, user_id=7)
+    passwords._get_executor().shutdown(wait=True)
+    assert updates == []
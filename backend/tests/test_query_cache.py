@@ -0,0 +1,65 @@
+import time
+import pytest
+from utils import query_cache, tiered_cache
+from utils.sql_analyzer import analyze
+
+@pytest.fixture
+def cache(fake_redis, monkeypatch):
+    monkeypatch.setattr(tiered_cache, '_ensure_listener', lambda: None)
+    query_cache._results.invalidate(l2=False)
+    yield fake_redis
+    query_cache._results.invalidate(l2=False)
+
+def forget_locally():
+    # As seen from another worker, which only has Redis
+    query_cache._results.invalidate(l2=False)
+
+def test_equivalent_queries_share_an_entry(cache):
+    first = analyze('SELECT * FROM users WHERE id = 1').fingerprint
+    second = analyze('select *\n  from users where id = 1; -- again').fingerprint
+    assert query_cache.cache_result(first, '[{"id":1}]')
+    forget_locally()
+    assert query_cache.get_cached_result(second) == '[{"id":1}]'
+    assert query_cache.get_cached_result(analyze('SELECT * FROM users WHERE id = 2').fingerprint) is None
+
+def test_entries_expire_after_their_ttl(cache):
+    query_cache.cache_result('default', '[]')
+    query_cache.cache_result('short', '[]', ttl=5)
+    assert 0 < cache.ttl(query_cache.KEY_PREFIX + 'default') <= query_cache.QUERY_CACHE_TTL
+    assert 0 < cache.ttl(query_cache.KEY_PREFIX + 'short') <= 5
+
+def test_payloads_are_compressed(cache):
+    result = '[' + ','.join(['{"status":"pending"}'] * 1000) + ']'
+    query_cache.cache_result('big', result)
+    assert int(cache.get(query_cache.TOTAL_KEY)) < len(result) / 10
+
+def test_least_recently_used_entry_is_evicted(cache, monkeypatch):
+    monkeypatch.setattr(query_cache, 'QUERY_CACHE_MAX_ENTRIES', 2)
+    query_cache.cache_result('a', '["a"]')
+    time.sleep(0.001)
+    query_cache.cache_result('b', '["b"]')
+    time.sleep(0.001)
+    forget_locally()
+    assert query_cache.get_cached_result('a') == '["a"]'
+    time.sleep(0.001)
+    query_cache.cache_result('c', '["c"]')
+
+    forget_locally()
+    assert query_cache.get_cached_result('b') is None
+    assert query_cache.get_cached_result('a') == '["a"]'
+    assert query_cache.get_cached_result('c') == '["c"]'
+    assert cache.zcard(query_cache.LRU_KEY) == 2
+
+def test_oversized_results_stay_local(cache, monkeypatch):
+    monkeypatch.setattr(query_cache, 'QUERY_CACHE_MAX_ENTRY_BYTES', 1)
+    assert not query_cache.cache_result('large', '["large"]')
+    assert query_cache.get_cached_result('large') == '["large"]'
+    assert not cache.exists(query_cache.KEY_PREFIX + 'large')
+
+def test_expired_entries_are_cleaned_up_on_read(cache):
+    query_cache.cache_result('gone', '["gone"]')
+    cache.delete(query_cache.KEY_PREFIX + 'gone')
+    forget_locally()
+    assert query_cache.get_cached_result('gone') is None
+    assert not cache.hexists(query_cache.SIZES_KEY, query_cache.KEY_PREFIX + 'gone')
+    assert int(cache.get(query_cache.TOTAL_KEY)) == 0
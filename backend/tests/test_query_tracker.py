@@ -0,0 +1,64 @@
+import pytest
+from utils import query_tracker, result_store
+
+@pytest.fixture(autouse=True)
+def local_store(monkeypatch):
+    monkeypatch.setattr(result_store, 'get_redis_client', lambda: None)
+    monkeypatch.setattr(result_store, '_local', result_store._LocalStore())
+
+@pytest.fixture
+def cancelled_queries(monkeypatch):
+    sent = []
+
+    def query(sql, params=None):
+        sent.append(params)
+        return [{'cancelled': True}]
+
+    monkeypatch.setattr(query_tracker, 'query', query)
+    return sent
+
+def user(user_id):
+    return {'id': user_id, 'userType': 'regular_user'}
+
+def test_runs_are_namespaced_per_user():
+    mine = query_tracker.QueryRun(user(1), 'report')
+    theirs = query_tracker.QueryRun(user(2), 'report')
+    mine.started(101)
+    theirs.started(202)
+
+    assert query_tracker.get_run(1, 'report')['backendPid'] == 101
+    assert query_tracker.get_run(2, 'report')['backendPid'] == 202
+    assert query_tracker.get_run(3, 'report') is None
+
+def test_cancel_only_touches_own_run(cancelled_queries):
+    mine = query_tracker.QueryRun(user(1), 'report')
+    theirs = query_tracker.QueryRun(user(2), 'report')
+    mine.started(101)
+    theirs.started(202)
+
+    assert query_tracker.cancel_run(2, 'report')
+    assert cancelled_queries == [(202, theirs.application_name)]
+    assert theirs.was_cancelled()
+    assert not mine.was_cancelled()
+
+def test_reused_run_id_starts_uncancelled(cancelled_queries):
+    first = query_tracker.QueryRun(user(1), 'report')
+    first.started(101)
+    query_tracker.cancel_run(1, 'report')
+    first.finished()
+    assert first.was_cancelled()
+
+    second = query_tracker.QueryRun(user(1), 'report')
+    assert not second.was_cancelled()
+
+def test_application_name_fits_postgres_limit():
+    run = query_tracker.QueryRun(user(1), 'x' * 64)
+    assert len(run.application_name) <= 63
+
+def test_cancel_route_hides_other_users_runs(client, auth_headers, cancelled_queries):
+    query_tracker.QueryRun(user(1), 'report').started(101)
+
+    response = client.post('/api/queries/runs/report/cancel', headers=auth_headers(2))
+    assert response.status_code == 404
+    response = client.post('/api/queries/runs/report/cancel', headers=auth_headers(1))
+    assert response.get_json()['cancelled'] is True
@@ -0,0 +1,81 @@
+import time
+import pytest
+from utils import rate_limit
+
+USER = {'id': 1, 'userType': 'regular_user'}
+
+@pytest.fixture(autouse=True)
+def local_limits(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'get_redis_client', lambda: None)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(rate_limit, '_local_buckets', rate_limit.OrderedDict())
+    monkeypatch.setattr(rate_limit, '_local_running', {})
+
+def test_bucket_allows_burst_then_limits(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_RATE', 1)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_BURST', 3)
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: 1000.0)
+    for _ in range(3):
+        rate_limit.check_rate(1, 'schema.get_tables')
+    with pytest.raises(rate_limit.RateLimited) as excinfo:
+        rate_limit.check_rate(1, 'schema.get_tables')
+    assert excinfo.value.retry_after == 1
+    # Buckets are per user and per endpoint
+    rate_limit.check_rate(2, 'schema.get_tables')
+    rate_limit.check_rate(1, 'schema.get_table_schema')
+
+def test_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_QUERY_RATE', 2)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_QUERY_BURST', 1)
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: now[0])
+    rate_limit.check_rate(1, 'queries.execute_query')
+    with pytest.raises(rate_limit.RateLimited):
+        rate_limit.check_rate(1, 'queries.execute_query')
+    now[0] += 0.5
+    rate_limit.check_rate(1, 'queries.execute_query')
+
+def test_query_slots_cap_and_release(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_MAX_CONCURRENT_QUERIES', 2)
+    first = rate_limit.acquire_query_slot(USER)
+    rate_limit.acquire_query_slot(USER)
+    with pytest.raises(rate_limit.RateLimited) as excinfo:
+        rate_limit.acquire_query_slot(USER)
+    assert excinfo.value.retry_after == rate_limit.CONCURRENCY_RETRY_AFTER
+
+    first.release()
+    first.release()
+    assert rate_limit._local_running == {1: 1}
+    rate_limit.acquire_query_slot(USER)
+
+def test_token_bucket_script():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    client = fakeredis.FakeRedis()
+    key = rate_limit.BUCKET_KEY.format(1, 'queries.execute_query')
+    results = [client.eval(rate_limit.TOKEN_BUCKET_SCRIPT, 1, key, 1, 2, 1000) for _ in range(3)]
+    assert results == [0, 0, 1000]
+    assert client.eval(rate_limit.TOKEN_BUCKET_SCRIPT, 1, key, 1, 2, 1001) == 0
+
+def test_acquire_slot_script_drops_expired_leases():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    client = fakeredis.FakeRedis()
+    key = rate_limit.RUNNING_KEY.format(1)
+    # The key expires at the last lease, so the clock has to be real
+    now = int(time.time())
+    assert client.eval(rate_limit.ACQUIRE_SLOT_SCRIPT, 1, key, now, 1, now + 100, 'a') == 1
+    assert client.eval(rate_limit.ACQUIRE_SLOT_SCRIPT, 1, key, now, 1, now + 100, 'b') == 0
+    # Slot a's lease has run out
+    assert client.eval(rate_limit.ACQUIRE_SLOT_SCRIPT, 1, key, now + 101, 1, now + 200, 'b') == 1
+
+def test_short_lease_keeps_long_lease_alive():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    client = fakeredis.FakeRedis()
+    key = rate_limit.RUNNING_KEY.format(1)
+    now = int(time.time())
+    # A download holding a long lease, then an interactive query with a short one
+    assert client.eval(rate_limit.ACQUIRE_SLOT_SCRIPT, 1, key, now, 2, now + 1860, 'job') == 1
+    assert client.eval(rate_limit.ACQUIRE_SLOT_SCRIPT, 1, key, now, 2, now + 170, 'query') == 1
+    assert client.ttl(key) > 1800
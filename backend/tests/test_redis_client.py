@@ -0,0 +1,28 @@
+import os
+import redis
+from utils import redis_client
+
+def open_breaker(monkeypatch):
+    monkeypatch.setattr(redis_client, 'REDIS_BREAKER_PROBE_INTERVAL', 3600)
+    breaker = redis_client.CircuitBreaker(lambda: None)
+    for _ in range(redis_client.REDIS_BREAKER_THRESHOLD):
+        breaker.record_failure(redis.ConnectionError('connection refused'))
+    return breaker
+
+def test_breaker_opens_after_threshold(monkeypatch):
+    breaker = open_breaker(monkeypatch)
+    assert breaker.is_open()
+    assert not breaker.allow()
+    assert breaker.stats()['shortCircuited'] == 1
+
+def test_forked_worker_starts_closed(monkeypatch):
+    breaker = open_breaker(monkeypatch)
+    assert breaker.opened_at is not None
+
+    # As seen from a worker forked after the breaker opened
+    breaker._pid = os.getpid() + 1
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert breaker.opened_at is None
+    assert breaker.consecutive_failures == 0
+    assert breaker._pid == os.getpid()
@@ -0,0 +1,55 @@
+import json
+from collections import namedtuple
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import pyarrow as pa
+from utils import result_encoder
+
+Column = namedtuple('Column', 'name type_code precision scale')
+
+DESCRIPTION = [
+    Column('id', 23, None, None),
+    Column('price', 1700, None, None),
+    Column('ratio', 701, None, None),
+    Column('active', 16, None, None),
+    Column('name', 25, None, None),
+    Column('created', 1184, None, None),
+    Column('day', 1082, None, None),
+    Column('payload', 3802, None, None),
+]
+
+ROWS = [
+    (1, Decimal('9.99'), 0.5, True, 'café "x"', datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc), date(2024, 3, 1), {'b': 1, 'a': [None]}),
+    (2, None, float('inf'), False, None, None, None, None),
+]
+
+def test_typed_rows_match_default_encoder(monkeypatch):
+    typed = result_encoder.encode_rows(DESCRIPTION, ROWS)
+    monkeypatch.setattr(result_encoder, 'RESULT_ENCODER', 'default')
+    default = result_encoder.encode_rows(DESCRIPTION, ROWS)
+    assert json.loads(typed) == json.loads(default)
+    assert json.loads(typed)[0]['created'] == 'Fri, 01 Mar 2024 12:30:00 GMT'
+    assert json.loads(typed)[0]['price'] == '9.99'
+
+def test_columns_format_transposes_rows():
+    result = json.loads(result_encoder.encode_columns(DESCRIPTION[:2], [row[:2] for row in ROWS]))
+    assert result['columns'] == [{'name': 'id', 'type': 'int4'}, {'name': 'price', 'type': 'numeric'}]
+    assert result['rowCount'] == 2
+    assert result['data'] == [[1, 2], ['9.99', None]]
+
+def test_columns_format_without_rows():
+    result = json.loads(result_encoder.encode_columns(DESCRIPTION[:2], []))
+    assert result['rowCount'] == 0
+    assert result['data'] == [[], []]
+
+def test_no_result_set():
+    assert result_encoder.encode_rows(None, None) == 'null'
+    assert result_encoder.encode_columns(None, None) == 'null'
+
+def test_arrow_stream_round_trip():
+    description = [Column('id', 23, None, None), Column('price', 1700, 10, 2), Column('payload', 3802, None, None)]
+    rows = [(1, Decimal('9.99'), {'a': 1}), (2, None, None)]
+    table = pa.ipc.open_stream(result_encoder.encode_arrow(description, rows)).read_all()
+    assert table.schema.field('id').type == pa.int32()
+    assert table.schema.field('price').type == pa.decimal128(10, 2)
+    assert table.to_pydict() == {'id': [1, 2], 'price': [Decimal('9.99'), None], 'payload': ['{"a":1}', None]}
@@ -0,0 +1,83 @@
+import pytest
+from utils import schema_catalog
+
+@pytest.fixture
+def catalog_queries(monkeypatch):
+    estimates = {'users': 10}
+    sent = []
+
+    def query(sql, params=None):
+        sent.append(sql)
+        if sql is schema_catalog.TRACKED_SQL:
+            return [{'tracked': True}]
+        if sql is schema_catalog.TRIGGER_VERSION_SQL:
+            return [{'version': 'ddl:1'}]
+        if sql is schema_catalog.CATALOG_SQL:
+            return [{'name': 'users', 'estimated_rows': estimates['users'], 'columns': [], 'primary_keys': [],
+                     'foreign_keys': [], 'indexes': []}]
+        if sql is schema_catalog.ESTIMATES_SQL:
+            return [{'name': 'users', 'estimated_rows': estimates['users']}]
+        raise AssertionError(sql)
+
+    monkeypatch.setattr(schema_catalog, 'query', query)
+    monkeypatch.setattr(schema_catalog, 'get_redis_client', lambda: None)
+    monkeypatch.setattr(schema_catalog, '_catalog', None)
+    monkeypatch.setattr(schema_catalog, '_tracked', None)
+    monkeypatch.setattr(schema_catalog, '_payload', None)
+    monkeypatch.setattr(schema_catalog, 'SCHEMA_CATALOG_CHECK_INTERVAL', 0)
+    return estimates, sent
+
+def test_estimates_refresh_without_ddl(catalog_queries, monkeypatch):
+    estimates, sent = catalog_queries
+    monkeypatch.setattr(schema_catalog, 'SCHEMA_CATALOG_ESTIMATES_TTL', 300)
+    first_etag, _ = schema_catalog.get_catalog_payload()
+    assert schema_catalog.get_table('users')['estimatedRows'] == 10
+
+    estimates['users'] = 5000
+    schema_catalog.get_catalog()
+    assert schema_catalog.get_table('users')['estimatedRows'] == 10
+    assert schema_catalog.ESTIMATES_SQL not in sent
+
+    catalog = schema_catalog._catalog
+    monkeypatch.setattr(schema_catalog, '_catalog', dict(catalog, estimatedAt=catalog['estimatedAt'] - 300))
+    assert schema_catalog.get_table('users')['estimatedRows'] == 5000
+    assert schema_catalog.get_catalog()['version'] == 'ddl:1'
+    assert sent.count(schema_catalog.CATALOG_SQL) == 1
+    assert schema_catalog.get_catalog_payload()[0] != first_etag
+
+def test_estimates_ttl_zero_waits_for_ddl(catalog_queries, monkeypatch):
+    estimates, sent = catalog_queries
+    monkeypatch.setattr(schema_catalog, 'SCHEMA_CATALOG_ESTIMATES_TTL', 0)
+    schema_catalog.get_catalog()
+    catalog = schema_catalog._catalog
+    monkeypatch.setattr(schema_catalog, '_catalog', dict(catalog, estimatedAt=0))
+    estimates['users'] = 5000
+    assert schema_catalog.get_table('users')['estimatedRows'] == 10
+    assert schema_catalog.ESTIMATES_SQL not in sent
+
+def test_unchanged_catalog_returns_304(catalog_queries, client, auth_headers):
+    response = client.get('/api/schema/catalog', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 'ddl:1'
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    revalidated = client.get('/api/schema/catalog', headers=dict(auth_headers(), **{'If-None-Match': etag}))
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == etag
+
+    # Compressed responses carry a weak ETag, which still matches
+    weak = client.get('/api/schema/catalog', headers=dict(auth_headers(), **{'If-None-Match': 'W/' + etag}))
+    assert weak.status_code == 304
+
+def test_changed_catalog_returns_200(catalog_queries, client, auth_headers, monkeypatch):
+    etag = client.get('/api/schema/catalog', headers=auth_headers()).headers['ETag']
+    monkeypatch.setattr(schema_catalog, 'TRIGGER_VERSION_SQL', 'changed')
+    query = schema_catalog.query
+    monkeypatch.setattr(schema_catalog, 'query', lambda sql, params=None: [{'version': 'ddl:2'}] if sql == 'changed' else query(sql, params))
+
+    response = client.get('/api/schema/catalog', headers=dict(auth_headers(), **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 'ddl:2'
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,110 @@
+import threading
+import pytest
+from psycopg2 import errors as pg_errors
+from utils import single_flight
+
+class WatchedEvent(threading.Event):
+    """Event that reports when someone starts waiting on it"""
+
+    def __init__(self):
+        super().__init__()
+        self.waiting = threading.Event()
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return super().wait(timeout)
+
+def run_with_follower(key, leader_outcome, follower_fn):
+    """Run a leader and one follower for key; returns (leader outcome, follower outcome)"""
+    entered = threading.Event()
+    release = threading.Event()
+    outcomes = {}
+
+    def leader_fn():
+        entered.set()
+        release.wait(5)
+        if isinstance(leader_outcome, Exception):
+            raise leader_outcome
+        return leader_outcome
+
+    def call(name, fn):
+        try:
+            outcomes[name] = single_flight.do(key, fn)
+        except Exception as e:
+            outcomes[name] = e
+
+    leader = threading.Thread(target=call, args=('leader', leader_fn))
+    leader.start()
+    assert entered.wait(5)
+    done = single_flight._calls[key].done = WatchedEvent()
+    follower = threading.Thread(target=call, args=('follower', follower_fn))
+    follower.start()
+    assert done.waiting.wait(5)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    return outcomes['leader'], outcomes['follower']
+
+@pytest.fixture(autouse=True)
+def local_only(monkeypatch):
+    monkeypatch.setattr(single_flight, 'SINGLE_FLIGHT_ENABLED', True)
+    monkeypatch.setattr(single_flight, 'SINGLE_FLIGHT_DISTRIBUTED', False)
+
+def test_followers_share_result():
+    leader, follower = run_with_follower('ok', '[1]', lambda: pytest.fail('follower should not run'))
+    assert leader == ('[1]', False)
+    assert follower == ('[1]', True)
+
+def test_followers_share_sql_errors():
+    error = pg_errors.UndefinedTable('relation "missing" does not exist')
+    leader, follower = run_with_follower('sql-error', error, lambda: pytest.fail('follower should not run'))
+    assert leader is error
+    assert follower is error
+
+@pytest.mark.parametrize('error', [
+    pg_errors.QueryCanceled('canceling statement due to user request'),
+    pg_errors.AdminShutdown('terminating connection due to administrator command'),
+])
+def test_followers_rerun_after_cancelled_leader(error):
+    leader, follower = run_with_follower('cancelled', error, lambda: '[2]')
+    assert leader is error
+    assert follower == ('[2]', False)
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.published = []
+
+    def set_bytes(self, key, value, expiry):
+        self.values[key] = value
+
+    def get_bytes(self, key):
+        return self.values.get(key)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def run_script(self, script, keys, args):
+        return None
+
+def test_cancelled_leader_publishes_no_error_across_workers():
+    client = FakeRedis()
+
+    def cancelled():
+        raise pg_errors.QueryCanceled('canceling statement due to statement timeout')
+
+    with pytest.raises(pg_errors.QueryCanceled):
+        single_flight._lead(client, 'k', 'lock', 'token', cancelled)
+    assert client.values == {}
+    assert client.published == [(single_flight.CHANNEL_PREFIX + 'k', 'token')]
+
+def test_sql_error_is_published_across_workers():
+    client = FakeRedis()
+
+    def failing():
+        raise pg_errors.DivisionByZero('division by zero')
+
+    with pytest.raises(pg_errors.DivisionByZero):
+        single_flight._lead(client, 'k', 'lock', 'token', failing)
+    with pytest.raises(single_flight.SharedQueryError, match='division by zero'):
+        single_flight._read_result(client, f"{single_flight.RESULT_PREFIX}k:token")
@@ -0,0 +1,70 @@
+import pytest
+from utils.sql_analyzer import analyze, tokenize, strip_statement, runs_in_cursor
+
+@pytest.mark.parametrize('sql', [
+    'SELECT 1',
+    'select * from users where id = 1;',
+    'WITH t AS (SELECT 1) SELECT * FROM t',
+    'EXPLAIN SELECT * FROM users',
+    'SHOW work_mem',
+    "SELECT 'set_config(' AS text",
+])
+def test_read_only_queries_are_allowed(sql):
+    analysis = analyze(sql)
+    assert analysis.read_only, analysis.reason
+
+@pytest.mark.parametrize('sql', [
+    'DELETE FROM users',
+    'SELECT 1; SELECT 2',
+    'SELECT * INTO copy FROM users',
+    "SELECT set_config('statement_timeout', '0', false)",
+    "SELECT \"set_config\"('statement_timeout', '0', false)",
+    "SELECT pg_catalog.\"SET_CONFIG\"('statement_timeout', '0', false)",
+    'SELECT * FROM users FOR UPDATE',
+    'SELECT * FROM (SELECT * FROM users FOR UPDATE) AS locked',
+    'WITH t AS (SELECT * FROM users FOR NO KEY UPDATE) SELECT * FROM t',
+    'WITH t AS (DELETE FROM users RETURNING *) SELECT * FROM t',
+    'EXPLAIN ANALYZE DELETE FROM users',
+    "SELECT pg_notify('user_changed', md5(random()::text)) FROM generate_series(1, 1000000)",
+    "SELECT pg_catalog.PG_NOTIFY('user_changed', '1')",
+    "SELECT query_to_xml('select pg_terminate_backend(123)', true, false, '')",
+    "SELECT \"query_to_xml_and_xmlschema\"('select 1', true, false, '')",
+    "SELECT table_to_xml('users', true, false, '')",
+    "SELECT database_to_xml(true, false, '')",
+])
+def test_writes_are_rejected(sql):
+    analysis = analyze(sql)
+    assert not analysis.read_only
+    assert analysis.reason
+
+def test_comments_separate_tokens():
+    normalized, _ = tokenize('SELECT x/**/y FROM t')
+    assert normalized == 'select x y from t'
+    assert analyze('SELECT x/**/y FROM t').fingerprint != analyze('SELECT xy FROM t').fingerprint
+
+def test_fingerprint_ignores_case_whitespace_and_comments():
+    assert analyze('SELECT *\n  FROM users -- all of them').fingerprint == analyze('select * from users').fingerprint
+
+def test_tables_exclude_ctes():
+    analysis = analyze('WITH recent AS (SELECT * FROM queries) SELECT * FROM recent JOIN users u ON u.id = 1')
+    assert analysis.tables == ('queries', 'users')
+
+@pytest.mark.parametrize('sql, expected', [
+    ('SELECT 1;', 'SELECT 1'),
+    ('SELECT 1 ; ;\n', 'SELECT 1'),
+    ('SELECT 1 -- trailing comment', 'SELECT 1'),
+    ('SELECT 1; /* done */', 'SELECT 1'),
+    ("SELECT ';' -- x", "SELECT ';'"),
+])
+def test_strip_statement(sql, expected):
+    assert strip_statement(sql) == expected
+
+@pytest.mark.parametrize('sql, expected', [
+    ('SELECT 1', True),
+    ('(SELECT 1)', True),
+    ('TABLE users', True),
+    ('SHOW work_mem', False),
+    ('EXPLAIN SELECT 1', False),
+])
+def test_runs_in_cursor(sql, expected):
+    assert runs_in_cursor(analyze(sql)) is expected
@@ -0,0 +1,41 @@
+import pytest
+from utils import schema_catalog, table_preview
+
+TABLE = {'name': 'users', 'columns': [{'column_name': 'id', 'data_type': 'integer'}], 'estimatedRows': 10}
+
+@pytest.fixture
+def catalog(monkeypatch):
+    catalog = {'version': 'ddl:1', 'tables': {'users': TABLE}}
+    samples = []
+    monkeypatch.setattr(table_preview, '_previews', table_preview.OrderedDict())
+    monkeypatch.setattr(table_preview, 'get_table_stats', lambda name: {'n_mod_since_analyze': 0, 'analyzed_at': None})
+    monkeypatch.setattr(schema_catalog, 'get_catalog', lambda: catalog)
+    monkeypatch.setattr(table_preview, '_sample', lambda table: samples.append(table['name']) or [{'id': len(samples)}])
+    return catalog, samples
+
+def test_preview_is_cached_while_nothing_changes(catalog):
+    _, samples = catalog
+    assert table_preview.get_preview(TABLE) == [{'id': 1}]
+    assert table_preview.get_preview(TABLE) == [{'id': 1}]
+    assert samples == ['users']
+
+def test_ddl_invalidates_preview(catalog):
+    current, samples = catalog
+    table_preview.get_preview(TABLE)
+    # A column rename bumps the catalog version but leaves the table's stats alone
+    current['version'] = 'ddl:2'
+    assert table_preview.get_preview(TABLE) == [{'id': 2}]
+    assert len(samples) == 2
+
+def test_long_values_are_cut():
+    row = table_preview._fit_budget([{'bio': 'x' * (table_preview.PREVIEW_MAX_VALUE_CHARS + 10)}])[0]
+    assert row['bio'] == 'x' * table_preview.PREVIEW_MAX_VALUE_CHARS + table_preview.TRUNCATION_MARK
+
+def test_wide_columns_are_cut_in_the_database():
+    columns = [
+        {'column_name': 'tags', 'data_type': 'ARRAY', 'format_type': 'text[]'},
+        {'column_name': 'code', 'data_type': 'character varying', 'format_type': 'character varying(50)'},
+        {'column_name': 'id', 'data_type': 'integer', 'format_type': 'integer'},
+    ]
+    items = table_preview._select_list(columns).seq[::2]
+    assert [type(item) for item in items] == [table_preview.sql.Composed, table_preview.sql.Composed, table_preview.sql.Identifier]
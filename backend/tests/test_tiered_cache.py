@@ -0,0 +1,101 @@
+import pytest
+from utils import tiered_cache
+from utils.tiered_cache import TieredCache
+
+@pytest.fixture
+def cache(fake_redis, monkeypatch):
+    monkeypatch.setattr(tiered_cache, '_ensure_listener', lambda: None)
+    monkeypatch.setattr(tiered_cache, '_caches', {})
+    return TieredCache('widgets', 60)
+
+def test_l2_answers_after_l1_is_dropped(cache):
+    cache.set('a', {'n': 1})
+    assert cache.get('a') == {'n': 1}
+    cache._forget('a')
+    assert cache.get('a') == {'n': 1}
+    assert (cache.l1_hits, cache.l2_hits, cache.misses) == (1, 1, 0)
+
+def test_writes_and_invalidations_are_broadcast(cache, fake_redis):
+    pubsub = fake_redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(tiered_cache.CHANNEL)
+    cache.set('a', 1)
+    cache.invalidate('a')
+    cache.invalidate()
+    messages = []
+    for _ in range(10):
+        if len(messages) == 3:
+            break
+        received = pubsub.get_message(timeout=0.1)
+        if received is not None:
+            messages.append(received)
+    origin = tiered_cache._origin()
+    assert [message['data'] for message in messages] == [
+        f"{origin}\x00widgets\x00a", f"{origin}\x00widgets\x00a", f"{origin}\x00widgets\x00",
+    ]
+    assert not fake_redis.exists(cache.redis_key('a'))
+
+class StopListening(BaseException):
+    pass
+
+class FakePubSub:
+    """Runs subscribed() once the listener has subscribed, delivers the messages, then stops the listener"""
+
+    def __init__(self, messages, subscribed):
+        self.messages = list(messages)
+        self.subscribed = subscribed
+        self.channels = []
+        self.closed = False
+
+    def subscribe(self, channel):
+        self.channels.append(channel)
+
+    def get_message(self, timeout):
+        if self.subscribed is not None:
+            self.subscribed, subscribed = None, self.subscribed
+            subscribed()
+        if not self.messages:
+            raise StopListening()
+        return self.messages.pop(0)
+
+    def close(self):
+        self.closed = True
+
+def message(origin, name, key):
+    return {'type': 'message', 'data': f"{origin}\x00{name}\x00{key}"}
+
+def test_listener_drops_keys_other_workers_changed(cache, monkeypatch):
+    other = TieredCache('gadgets', 60)
+    # Subscribing clears every L1, since messages may have been missed meanwhile
+    cache.set('stale', 0, l2=False)
+
+    def populate():
+        assert 'stale' not in cache._entries
+        cache.set('a', 1, l2=False)
+        cache.set('b', 2, l2=False)
+        cache.set('c', 3, l2=False)
+        other.set('a', 4, l2=False)
+
+    pubsub = FakePubSub([
+        None,
+        {'type': 'subscribe', 'data': 1},
+        message('other-host:1', 'widgets', 'a'),
+        message(tiered_cache._origin(), 'widgets', 'b'),  # this worker's own write
+        message('other-host:1', 'unknown', 'c'),
+    ], populate)
+    monkeypatch.setattr(tiered_cache.redis_client, 'pubsub', lambda: pubsub)
+    with pytest.raises(StopListening):
+        tiered_cache._listen()
+
+    assert pubsub.channels == [tiered_cache.CHANNEL]
+    assert pubsub.closed
+    assert 'a' not in cache._entries
+    assert 'b' in cache._entries
+    assert 'c' in cache._entries
+    assert 'a' in other._entries
+
+def test_listener_clears_whole_cache(cache, monkeypatch):
+    pubsub = FakePubSub([message('other-host:1', 'widgets', '')], lambda: cache.set('a', 1, l2=False))
+    monkeypatch.setattr(tiered_cache.redis_client, 'pubsub', lambda: pubsub)
+    with pytest.raises(StopListening):
+        tiered_cache._listen()
+    assert cache.stats()['entries'] == 0
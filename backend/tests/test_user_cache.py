@@ -0,0 +1,120 @@
+import socket
+import pytest
+from utils import query_cache, user_cache
+
+@pytest.fixture
+def users(monkeypatch):
+    rows = {1: {'id': 1, 'username': 'ada', 'email': 'ada@example.com', 'user_type': 'regular_user'}}
+    monkeypatch.setattr(query_cache.redis_client, 'available', lambda: False)
+    monkeypatch.setattr(user_cache, 'get_redis_client', lambda: None)
+    monkeypatch.setattr(user_cache, '_ensure_listener', lambda: None)
+    monkeypatch.setattr(user_cache, 'query', lambda sql, params: [rows[params[0]]] if params[0] in rows else [])
+    user_cache._versions.invalidate()
+    user_cache._users.invalidate()
+    return rows
+
+def claims(ver=0, **overrides):
+    return dict({'id': 1, 'username': 'ada', 'email': 'ada@example.com', 'userType': 'regular_user', 'ver': ver},
+                **overrides)
+
+def test_current_claims_are_trusted(users, monkeypatch):
+    monkeypatch.setattr(user_cache, 'query', lambda sql, params: pytest.fail('claims should be trusted'))
+    assert user_cache.resolve(claims())['user_type'] == 'regular_user'
+
+def test_update_is_visible_immediately(users):
+    assert user_cache.resolve(claims())['user_type'] == 'regular_user'
+
+    users[1] = dict(users[1], user_type='admin_user')
+    # What the listener does for the trigger's NOTIFY, whose payload is the id as text
+    user_cache.bump_version(str(1))
+
+    assert user_cache.resolve(claims())['user_type'] == 'admin_user'
+    fresh = claims(ver=user_cache.get_version(1), userType='admin_user')
+    assert user_cache.resolve(fresh)['user_type'] == 'admin_user'
+
+def test_deleted_user_stops_resolving(users):
+    assert user_cache.resolve(claims()) is not None
+    del users[1]
+    user_cache.bump_version('1')
+    assert user_cache.resolve(claims()) is None
+
+class StopListening(BaseException):
+    pass
+
+class Notify:
+    def __init__(self, payload):
+        self.payload = payload
+
+class ListeningConnection:
+    """Readable from the start; the first poll delivers one notification, the second stops the loop"""
+
+    def __init__(self, payloads=('1',)):
+        self.payloads = payloads
+        self._sockets = socket.socketpair()
+        self._sockets[1].send(b'x')
+        self.executed = []
+        self.notifies = []
+        self.polls = 0
+        self.closed = False
+
+    def fileno(self):
+        return self._sockets[0].fileno()
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                connection.executed.append(sql)
+        return Cursor()
+
+    def poll(self):
+        self.polls += 1
+        if self.polls > 1:
+            raise StopListening()
+        self.notifies.extend(Notify(payload) for payload in self.payloads)
+
+    def close(self):
+        self.closed = True
+        for sock in self._sockets:
+            sock.close()
+
+def test_listener_bumps_notified_users(monkeypatch):
+    conn = ListeningConnection()
+    bumped = []
+    monkeypatch.setattr(user_cache, 'get_connection', lambda: conn)
+    monkeypatch.setattr(user_cache, 'bump_version', bumped.append)
+
+    with pytest.raises(StopListening):
+        user_cache._listen()
+    assert conn.executed == ['LISTEN user_changed']
+    assert bumped == [1]
+    assert conn.closed
+
+def test_listener_ignores_payloads_that_are_not_user_ids(monkeypatch):
+    conn = ListeningConnection(payloads=('x', '', '1; 2', '42'))
+    bumped = []
+    monkeypatch.setattr(user_cache, 'get_connection', lambda: conn)
+    monkeypatch.setattr(user_cache, 'bump_version', bumped.append)
+
+    with pytest.raises(StopListening):
+        user_cache._listen()
+    assert bumped == [42]
+
+def test_version_keys_expire(users, monkeypatch):
+    calls = []
+
+    class Redis:
+        def incr(self, key, expiry=None):
+            calls.append((key, expiry))
+            return 7
+
+    monkeypatch.setattr(user_cache, 'get_redis_client', Redis)
+    assert user_cache.bump_version(1) == 7
+    assert calls == [('auth:v1:user:1:version', user_cache.AUTH_USER_VERSION_TTL)]
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from db.db import query
+from utils.sql_analyzer import strip_statement
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "false").lower() == "true"
+ADMISSION_MAX_COST = float(os.getenv("ADMISSION_MAX_COST", "1000000"))  # planner cost units
+ADMISSION_MAX_ROWS = float(os.getenv("ADMISSION_MAX_ROWS", "1000000"))  # planner row estimate
+ADMISSION_ACTION = os.getenv("ADMISSION_ACTION", "queue").lower()  # reject, queue or limit
+ADMISSION_AUTO_LIMIT = int(os.getenv("ADMISSION_AUTO_LIMIT", "10000"))
+ADMISSION_PLAN_TTL = int(os.getenv("ADMISSION_PLAN_TTL", "300"))  # seconds a plan estimate is reused
+ADMISSION_PLAN_CACHE_SIZE = 4096
+
+ACTIONS = ('reject', 'queue', 'limit')
+# SHOW and EXPLAIN cannot be explained themselves
+EXPLAINABLE_STATEMENTS = {'select', 'with', 'values', 'table'}
+
+class AdmissionDecision:
+    """What to do with a query: allow, reject, queue or limit
+
+    sql is the statement to run (wrapped in a LIMIT for 'limit') and
+    result_key the fingerprint its result is cached and coalesced under.
+    """
+
+    __slots__ = ('action', 'sql', 'result_key', 'cost', 'rows', 'limit')
+
+    def __init__(self, action, sql, result_key, cost=None, rows=None, limit=None):
+        self.action = action
+        self.sql = sql
+        self.result_key = result_key
+        self.cost = cost
+        self.rows = rows
+        self.limit = limit
+
+_plans_lock = threading.Lock()
+_plans = OrderedDict()  # fingerprint -> (expires_at, cost, rows)
+
+def estimate(sql, key, run=None):
+    """Return the planner's (total cost, row estimate) for sql, cached under key
+
+    With a run the EXPLAIN gets the same read-only, time-limited and
+    cancellable transaction as the query itself, since planning can be slow.
+    """
+    now = time.monotonic()
+    with _plans_lock:
+        entry = _plans.get(key)
+        if entry is not None and entry[0] > now:
+            _plans.move_to_end(key)
+            return entry[1], entry[2]
+
+    result = query('EXPLAIN (FORMAT JSON) ' + sql, run=run)
+    plan = result[0]['QUERY PLAN'][0]['Plan']
+    cost, rows = plan['Total Cost'], plan['Plan Rows']
+
+    with _plans_lock:
+        _plans[key] = (now + ADMISSION_PLAN_TTL, cost, rows)
+        _plans.move_to_end(key)
+        if len(_plans) > ADMISSION_PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return cost, rows
+
+def limited_sql(sql, limit):
+    """Wrap a query in SELECT * FROM (...) LIMIT n, keeping its original text
+
+    Trailing semicolons and comments are stripped, and the closing parenthesis
+    goes on its own line so a -- comment inside the query cannot swallow it.
+    """
+    return f"SELECT * FROM ({strip_statement(sql)}\n) AS limited LIMIT {int(limit)}"
+
+def admit(sql, analysis, run=None):
+    """Decide whether a read-only query may run as submitted; run is the QueryRun the estimates run under"""
+    if not ADMISSION_CONTROL_ENABLED or analysis.statement_type not in EXPLAINABLE_STATEMENTS:
+        return AdmissionDecision('allow', sql, analysis.fingerprint)
+
+    cost, rows = estimate(sql, analysis.fingerprint, run)
+    if cost <= ADMISSION_MAX_COST and rows <= ADMISSION_MAX_ROWS:
+        return AdmissionDecision('allow', sql, analysis.fingerprint, cost, rows)
+
+    action = ADMISSION_ACTION if ADMISSION_ACTION in ACTIONS else 'reject'
+    logger.info(f"Query {analysis.fingerprint[:12]} over admission limits (cost {cost}, rows {rows}): {action}")
+    if action == 'limit':
+        # A LIMIT only helps when the planner can stop early; otherwise reject
+        limited = limited_sql(sql, ADMISSION_AUTO_LIMIT)
+        key = f"{analysis.fingerprint}:limit:{ADMISSION_AUTO_LIMIT}"
+        limited_cost, limited_rows = estimate(limited, key, run)
+        if limited_cost <= ADMISSION_MAX_COST:
+            return AdmissionDecision('limit', limited, key, limited_cost, limited_rows, ADMISSION_AUTO_LIMIT)
+        action = 'reject'
+    return AdmissionDecision(action, sql, analysis.fingerprint, cost, rows)
@@ -0,0 +1,203 @@
+import bisect
+import logging
+import threading
+from dotenv import load_dotenv
+from db.db import query
+from utils import schema_catalog
+from utils.sql_analyzer import KEYWORDS, READ_STATEMENTS
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+COMPLETE_DEFAULT_LIMIT = 20
+COMPLETE_MAX_LIMIT = 100
+COMPLETE_SCAN_FACTOR = 10  # candidates read per index range, per requested suggestion
+COMPLETE_FULL_REBUILD_RATIO = 0.25  # rebuild from scratch when this share of tables changed
+
+KIND_RANK = {'table': 0, 'column': 1, 'function': 2, 'keyword': 3}
+
+# User-callable functions: skip type I/O, trigger and other internal-only functions
+FUNCTIONS_SQL = """
+    SELECT DISTINCT p.proname AS name
+    FROM pg_proc p
+    JOIN pg_namespace n ON n.oid = p.pronamespace
+    WHERE n.nspname IN ('pg_catalog', 'public')
+        AND p.prorettype NOT IN ('internal'::regtype, 'cstring'::regtype, 'trigger'::regtype,
+                                 'event_trigger'::regtype, 'language_handler'::regtype)
+        AND NOT ('internal'::regtype = ANY(p.proargtypes))
+        AND p.proname NOT LIKE '\\_%'
+"""
+
+class _Index:
+    """Sorted (key, kind, name) records searched with bisect
+
+    names holds every identifier under its lowercase name; segments holds it
+    again under each snake_case suffix, so 'at' also finds created_at.
+    A published index is never modified; updates go to a copy() that replaces it.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.segments = []
+        self.refs = {}  # (kind, name) -> set of tables that contribute it (empty for global names)
+
+    @staticmethod
+    def _segment_keys(lower):
+        return [lower[i + 1:] for i, char in enumerate(lower[:-1]) if char == '_' and lower[i + 1] != '_']
+
+    def bulk_load(self, refs):
+        self.refs = refs
+        self.names = sorted((name.lower(), kind, name) for (kind, name) in refs)
+        self.segments = sorted(
+            (key, kind, name) for (kind, name) in refs for key in self._segment_keys(name.lower())
+        )
+
+    def copy(self):
+        """Independent copy to update incrementally; cheaper than bulk_load since nothing is re-sorted"""
+        index = _Index()
+        index.refs = {ref: set(owners) for ref, owners in self.refs.items()}
+        index.names = list(self.names)
+        index.segments = list(self.segments)
+        return index
+
+    def add(self, kind, name, table=None):
+        owners = self.refs.get((kind, name))
+        if owners is None:
+            owners = self.refs[(kind, name)] = set()
+            lower = name.lower()
+            bisect.insort(self.names, (lower, kind, name))
+            for key in self._segment_keys(lower):
+                bisect.insort(self.segments, (key, kind, name))
+        if table is not None:
+            owners.add(table)
+
+    def remove(self, kind, name, table=None):
+        owners = self.refs.get((kind, name))
+        if owners is None:
+            return
+        owners.discard(table)
+        if owners:
+            return
+        del self.refs[(kind, name)]
+        lower = name.lower()
+        _remove(self.names, (lower, kind, name))
+        for key in self._segment_keys(lower):
+            _remove(self.segments, (key, kind, name))
+
+    def search(self, prefix, limit):
+        lower = prefix.lower()
+        scores = {}
+        # Whole-name matches always outrank segment matches, so segments are only read when needed
+        for match_rank, records in ((1, self.names), (2, self.segments)):
+            start = bisect.bisect_left(records, (lower,))
+            end = min(bisect.bisect_left(records, (lower + '\uffff',)), start + limit * COMPLETE_SCAN_FACTOR)
+            for key, kind, name in records[start:end]:
+                if (kind, name) not in scores:
+                    rank = 0 if key == lower and match_rank == 1 else match_rank
+                    scores[(kind, name)] = (rank, KIND_RANK[kind], len(name), name)
+            if len(scores) >= limit:
+                break
+        ranked = sorted(scores.items(), key=lambda item: item[1])
+        return [ref for ref, _ in ranked[:limit]]
+
+def _remove(records, record):
+    i = bisect.bisect_left(records, record)
+    if i < len(records) and records[i] == record:
+        del records[i]
+
+_lock = threading.Lock()
+_index = None
+_catalog = None  # catalog object the index was last synced with
+_functions = set()
+
+def _table_names(table):
+    return [('table', table['name'])] + [('column', column['column_name']) for column in table['columns']]
+
+def _sync():
+    """Bring the index up to date with the schema catalog, incrementally when possible"""
+    global _index, _catalog, _functions
+    catalog = schema_catalog.get_catalog()
+    if catalog is _catalog:
+        return _index
+    with _lock:
+        if catalog is _catalog:
+            return _index
+        old_tables = _catalog['tables'] if _catalog is not None else {}
+        new_tables = catalog['tables']
+        # Row estimates refresh without DDL; only names matter here
+        changed = [
+            name for name in set(old_tables) | set(new_tables)
+            if name not in old_tables or name not in new_tables
+            or _table_names(old_tables[name]) != _table_names(new_tables[name])
+        ]
+        if _index is not None and not changed and catalog['version'] == _catalog['version']:
+            # Same schema with fresh row estimates: functions cannot have changed either
+            _catalog = catalog
+            return _index
+
+        try:
+            functions = {row['name'] for row in query(FUNCTIONS_SQL)}
+        except Exception as e:
+            logger.error(f"Could not load function names for completion: {str(e)}")
+            functions = _functions
+
+        if _index is not None and not changed and functions == _functions:
+            _catalog = catalog
+            return _index
+
+        if _index is None or len(changed) > COMPLETE_FULL_REBUILD_RATIO * max(len(new_tables), 1):
+            refs = {('keyword', word.upper()): set() for word in KEYWORDS | READ_STATEMENTS}
+            refs.update({('function', name): set() for name in functions})
+            for table in new_tables.values():
+                for ref in _table_names(table):
+                    refs.setdefault(ref, set()).add(table['name'])
+            index = _Index()
+            index.bulk_load(refs)
+            logger.info(f"Built completion index with {len(index.names)} names")
+        else:
+            # Searches run without the lock, so they must keep seeing the old index until the swap
+            index = _index.copy()
+            for name in changed:
+                if name in old_tables:
+                    for kind, ref in _table_names(old_tables[name]):
+                        index.remove(kind, ref, name)
+                if name in new_tables:
+                    for kind, ref in _table_names(new_tables[name]):
+                        index.add(kind, ref, name)
+            for name in _functions - functions:
+                index.remove('function', name)
+            for name in functions - _functions:
+                index.add('function', name)
+            logger.info(f"Updated completion index for {len(changed)} changed tables")
+
+        _index, _catalog, _functions = index, catalog, functions
+        return _index
+
+def complete(prefix, limit=COMPLETE_DEFAULT_LIMIT):
+    """Ranked completions for a prefix; 'table.prefix' completes that table's columns
+
+    Matching is by prefix of the whole name or of a snake_case segment only;
+    there is no subsequence or typo-tolerant matching.
+    """
+    limit = max(1, min(limit, COMPLETE_MAX_LIMIT))
+    index = _sync()
+
+    if '.' in prefix:
+        table_name, _, column_prefix = prefix.rpartition('.')
+        table = schema_catalog.get_table(table_name)
+        if table is None:
+            return []
+        lower = column_prefix.lower()
+        names = [column['column_name'] for column in table['columns'] if column['column_name'].lower().startswith(lower)]
+        names.sort(key=lambda name: (name.lower() != lower, len(name), name))
+        return [{'name': name, 'kind': 'column', 'tables': [table_name]} for name in names[:limit]]
+
+    suggestions = []
+    for kind, name in index.search(prefix, limit):
+        suggestion = {'name': name, 'kind': kind}
+        if kind == 'column':
+            suggestion['tables'] = sorted(index.refs.get((kind, name), ()))[:5]
+        suggestions.append(suggestion)
+    return suggestions
@@ -0,0 +1,156 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from psycopg2 import sql
+from dotenv import load_dotenv
+from db.db import query
+from utils.table_stats import get_table_stats
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "10000"))  # rows read for columns without pg_stats
+PROFILE_TOP_VALUES = 10
+PROFILE_SAMPLED_TTL = int(os.getenv("PROFILE_SAMPLED_TTL", "600"))  # seconds; sampled profiles age out even without ANALYZE
+PROFILE_CACHE_SIZE = 512
+
+# The anyarray columns are cast through text so they come back as plain string lists.
+# Parents of inheritance or partition trees have a second row per column covering their
+# children (only that one for partitioned tables); it matches what SELECT on the parent reads.
+PG_STATS_SQL = """
+    SELECT DISTINCT ON (attname)
+        attname,
+        null_frac,
+        n_distinct,
+        avg_width,
+        correlation,
+        most_common_vals::text::text[] AS most_common_vals,
+        most_common_freqs,
+        histogram_bounds::text::text[] AS histogram_bounds
+    FROM pg_stats
+    WHERE schemaname = 'public' AND tablename = %s
+    ORDER BY attname, inherited DESC
+"""
+
+_lock = threading.Lock()
+_profiles = OrderedDict()  # table -> (analyzed_at, expires_at, profile)
+
+def get_profile(table):
+    """Return column statistics for a catalog table entry
+
+    pg_stats answers for analyzed columns; the rest are profiled from one
+    sampled scan. Cached until the table is analyzed again.
+    """
+    name = table['name']
+    stats = get_table_stats(name)
+    analyzed_at = stats['analyzed_at'] if stats else None
+    with _lock:
+        entry = _profiles.get(name)
+        if entry is not None and entry[0] == analyzed_at and (entry[1] is None or entry[1] > time.monotonic()):
+            _profiles.move_to_end(name)
+            return entry[2]
+
+    profile = _build_profile(table, analyzed_at)
+    sampled = any(column['source'] == 'sample' for column in profile['columns'])
+    expires_at = time.monotonic() + PROFILE_SAMPLED_TTL if sampled else None
+    with _lock:
+        _profiles[name] = (analyzed_at, expires_at, profile)
+        _profiles.move_to_end(name)
+        if len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+    return profile
+
+def _build_profile(table, analyzed_at):
+    estimated_rows = table.get('estimatedRows') or 0
+    pg_stats = {row['attname']: row for row in query(PG_STATS_SQL, (table['name'],))}
+    missing = [column for column in table['columns'] if column['column_name'] not in pg_stats]
+    sampled = _sample_columns(table, missing) if missing else {}
+
+    columns = []
+    for column in table['columns']:
+        name = column['column_name']
+        if name in pg_stats:
+            columns.append(_from_pg_stats(column, pg_stats[name], estimated_rows))
+        else:
+            columns.append(sampled[name])
+    return {
+        'table': table['name'],
+        'estimatedRows': estimated_rows,
+        'analyzedAt': analyzed_at.isoformat() if analyzed_at else None,
+        'columns': columns,
+    }
+
+def _from_pg_stats(column, stats, estimated_rows):
+    n_distinct = stats['n_distinct']
+    # Negative n_distinct is a fraction of the row count
+    distinct = round(-n_distinct * estimated_rows) if n_distinct < 0 else round(n_distinct)
+    values = stats['most_common_vals'] or []
+    freqs = stats['most_common_freqs'] or []
+    return {
+        'name': column['column_name'],
+        'dataType': column['data_type'],
+        'source': 'pg_stats',
+        'nullFraction': stats['null_frac'],
+        'distinctCount': distinct,
+        'avgWidth': stats['avg_width'],
+        'correlation': stats['correlation'],
+        'topValues': [{'value': value, 'frequency': freq} for value, freq in zip(values, freqs)],
+        'histogramBounds': stats['histogram_bounds'],
+    }
+
+def _sample_columns(table, columns):
+    """Profile columns pg_stats knows nothing about from one bounded sample"""
+    relation = sql.Identifier(table['name'])
+    estimated_rows = table.get('estimatedRows') or 0
+    if estimated_rows > PROFILE_SAMPLE_ROWS:
+        percent = min(100.0, 100.0 * PROFILE_SAMPLE_ROWS / estimated_rows)
+        source = sql.SQL("{} TABLESAMPLE SYSTEM ({})").format(relation, sql.Literal(percent))
+    else:
+        source = relation
+
+    measures = [sql.SQL("count(*) AS sampled")]
+    for i, column in enumerate(columns):
+        identifier = sql.Identifier(column['column_name'])
+        measures.append(sql.SQL(
+            "count({c}) AS {nn}, count(DISTINCT {c}::text) AS {d}, "
+            "(SELECT json_agg(t) FROM (SELECT {c}::text AS value, count(*) AS count FROM sample "
+            "WHERE {c} IS NOT NULL GROUP BY 1 ORDER BY 2 DESC LIMIT {top}) t) AS {tv}"
+        ).format(
+            c=identifier,
+            nn=sql.Identifier(f"non_null_{i}"),
+            d=sql.Identifier(f"distinct_{i}"),
+            tv=sql.Identifier(f"top_{i}"),
+            top=sql.Literal(PROFILE_TOP_VALUES),
+        ))
+    statement = sql.SQL(
+        "WITH sample AS MATERIALIZED (SELECT {columns} FROM {source} LIMIT {limit}) SELECT {measures} FROM sample"
+    ).format(
+        columns=sql.SQL(', ').join(sql.Identifier(column['column_name']) for column in columns),
+        source=source,
+        limit=sql.Literal(PROFILE_SAMPLE_ROWS),
+        measures=sql.SQL(', ').join(measures),
+    )
+    row = query(statement)[0]
+
+    sampled = row['sampled']
+    profiles = {}
+    for i, column in enumerate(columns):
+        non_null = row[f"non_null_{i}"]
+        top = row[f"top_{i}"] or []
+        profiles[column['column_name']] = {
+            'name': column['column_name'],
+            'dataType': column['data_type'],
+            'source': 'sample',
+            'sampledRows': sampled,
+            'nullFraction': (sampled - non_null) / sampled if sampled else None,
+            'distinctCount': row[f"distinct_{i}"],
+            'avgWidth': None,
+            'correlation': None,
+            'topValues': [{'value': item['value'], 'frequency': item['count'] / sampled} for item in top],
+            'histogramBounds': None,
+        }
+    return profiles
@@ -0,0 +1,106 @@
+import os
+import zlib
+from dotenv import load_dotenv
+
+try:
+    import zstandard
+except ImportError:  # optional, pip install zstandard
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # optional, pip install brotli
+    brotli = None
+
+# Load environment variables
+load_dotenv()
+
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))  # 1-9
+BR_LEVEL = int(os.getenv("COMPRESSION_BR_LEVEL", "4"))  # 0-11; above ~5 costs far more CPU for little gain
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))  # 1-22
+
+class _GzipCompressor:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+class _BrotliCompressor:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+def available_encodings():
+    """Content codings this server can produce"""
+    encodings = ['gzip']
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+    return encodings
+
+def compressor(encoding, level=None):
+    """Return an incremental compressor with compress(data), flush() and finish()"""
+    if encoding == 'gzip':
+        return _GzipCompressor(GZIP_LEVEL if level is None else level)
+    if encoding == 'br' and brotli is not None:
+        return _BrotliCompressor(BR_LEVEL if level is None else level)
+    if encoding == 'zstd' and zstandard is not None:
+        return _ZstdCompressor(ZSTD_LEVEL if level is None else level)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+def compress(data, encoding, level=None):
+    """Compress a whole body"""
+    c = compressor(encoding, level)
+    return c.compress(data) + c.finish()
+
+def compress_stream(chunks, encoding, level=None, flush=False):
+    """Compress a byte stream chunk by chunk
+
+    With flush=True every chunk is flushed through, so a client sees each one as
+    soon as it is produced, at some cost in ratio. The source is closed when the
+    compressed stream is.
+    """
+    c = compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = c.compress(chunk)
+            if flush:
+                data += c.flush()
+            if data:
+                yield data
+        yield c.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,99 @@
+import os
+import logging
+from dotenv import load_dotenv
+from utils import result_encoder
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, pip install pyarrow
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("DOWNLOAD_PARQUET_ROW_GROUP_SIZE", "100000"))  # rows fetched and written per row group
+PARQUET_COMPRESSION = os.getenv("DOWNLOAD_PARQUET_COMPRESSION", "zstd")  # codec inside the file: zstd, snappy, gzip or none
+
+# format -> (mimetype, file extension)
+DOWNLOAD_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# compression -> (mimetype, file extension suffix)
+DOWNLOAD_COMPRESSIONS = {
+    'gzip': ('application/gzip', 'gz'),
+    'zstd': ('application/zstd', 'zst'),
+}
+
+def _close(batches):
+    close = getattr(batches, 'close', None)
+    if close is not None:
+        close()
+
+def ndjson_chunks(first_batch, batches):
+    """Encode (description, rows) batches from stream_rows as NDJSON bytes"""
+    encoder = result_encoder.encoder_for(first_batch[0])
+    try:
+        yield encoder.encode_lines(first_batch[1]).encode('utf-8')
+        for _, rows in batches:
+            yield encoder.encode_lines(rows).encode('utf-8')
+    finally:
+        # Releases the cursor's connection when the client goes away mid-download
+        _close(batches)
+
+class _ChunkSink:
+    """Write-only file object that holds what ParquetWriter writes until it is drained"""
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def parquet_chunks(first_batch, batches):
+    """Write (description, rows) batches as a Parquet file, one row group per batch
+
+    Each row group is handed out as soon as it is written, so only one batch
+    is held in memory. Requires pyarrow.
+    """
+    description, rows = first_batch
+    schema = result_encoder.arrow_schema(description)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(
+        pa.PythonFile(sink, mode='w'), schema,
+        compression=None if PARQUET_COMPRESSION == 'none' else PARQUET_COMPRESSION
+    )
+    try:
+        writer.write_batch(result_encoder.arrow_batch(description, rows, schema), row_group_size=len(rows))
+        yield sink.drain()
+        for _, rows in batches:
+            writer.write_batch(result_encoder.arrow_batch(description, rows, schema), row_group_size=len(rows))
+            yield sink.drain()
+    finally:
+        # Writes the footer; a file cut short by an error has none and fails to open
+        writer.close()
+        _close(batches)
+    yield sink.drain()
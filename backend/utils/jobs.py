@@ -0,0 +1,244 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from db.db import get_pool, begin_run, end_run
+from utils import result_store, result_encoder, rate_limit
+from utils.query_tracker import QueryRun, cancel_run
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # concurrent jobs per gunicorn worker
+SNAPSHOT_WORKERS = int(os.getenv("PAGINATION_SNAPSHOT_WORKERS", "2"))  # concurrent snapshots per gunicorn worker, apart from jobs
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "20"))  # queued + running jobs per gunicorn worker
+JOB_PAGE_SIZE = int(os.getenv("JOB_PAGE_SIZE", "1000"))
+JOB_MAX_PAGE_SIZE = 10000
+JOB_HEARTBEAT_INTERVAL = 10  # seconds
+JOB_HEARTBEAT_TIMEOUT = 60  # seconds without a heartbeat before a job is reported lost
+
+# Paginated /execute results are read from a short-lived job snapshot
+SNAPSHOT_TTL = int(os.getenv("PAGINATION_SNAPSHOT_TTL", "600"))  # seconds a result window stays open
+SNAPSHOT_MAX_ROWS = int(os.getenv("PAGINATION_MAX_ROWS", "100000"))
+SNAPSHOT_WAIT_TIMEOUT = float(os.getenv("PAGINATION_WAIT_TIMEOUT", "30"))  # seconds a request waits for its page
+
+NAMESPACE = "job"
+ACTIVE_STATUSES = ('queued', 'running')
+
+class JobQueueFull(Exception):
+    """Raised when this worker already has JOB_MAX_QUEUED jobs in flight"""
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested"""
+
+class _LocalJob:
+    def __init__(self, ttl):
+        self.cancelled = threading.Event()
+        self.conn = None
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.progress = threading.Condition()  # notified whenever a page lands or the job ends
+
+_executors = {}  # long_running -> ThreadPoolExecutor
+_executor_pid = None
+_local_jobs = {}
+_local_jobs_lock = threading.Lock()
+_heartbeat_thread = None
+
+def _get_executor(long_running=True):
+    """Create the executors lazily so each gunicorn worker gets its own threads
+
+    Snapshots a request is waiting on (long_running=False) run on their own
+    threads, so their first page never queues behind background jobs.
+    """
+    global _executor_pid, _heartbeat_thread
+    with _local_jobs_lock:
+        if _executor_pid != os.getpid():
+            _executors.clear()
+            _executors[True] = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='query-job')
+            _executors[False] = ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS, thread_name_prefix='query-snapshot')
+            _executor_pid = os.getpid()
+            _local_jobs.clear()
+            _heartbeat_thread = threading.Thread(target=_heartbeat_loop, name='query-job-heartbeat', daemon=True)
+            _heartbeat_thread.start()
+        return _executors[long_running]
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        with _local_jobs_lock:
+            local_jobs = list(_local_jobs.items())
+        for job_id, local in local_jobs:
+            result_store.put_meta(NAMESPACE, job_id, {'heartbeatAt': time.time()}, ttl=local.ttl)
+
+def submit_job(user, sql, page_size=JOB_PAGE_SIZE, ttl=result_store.RESULT_STORE_TTL, max_rows=None,
+               long_running=True):
+    """Queue a query for background execution and return its job id
+
+    user is the caller's JWT claims. Pages are stored as JSON array strings
+    encoded by result_encoder. Results are kept for ttl seconds and the job
+    stops reading (marking itself truncated) once max_rows rows are stored.
+    long_running=False keeps the caller's interactive statement timeout, for
+    work a request is waiting on such as pagination snapshots.
+
+    Each job holds one of the user's concurrent query slots until it finishes;
+    raises rate_limit.RateLimited when the user has none free.
+    """
+    page_size = max(1, min(int(page_size), JOB_MAX_PAGE_SIZE))
+    executor = _get_executor(long_running)
+    slot = rate_limit.acquire_query_slot(user, long_running)
+    with _local_jobs_lock:
+        if len(_local_jobs) >= JOB_MAX_QUEUED:
+            slot.release()
+            raise JobQueueFull("Too many queued jobs, try again later")
+        job_id = uuid.uuid4().hex
+        local = _local_jobs[job_id] = _LocalJob(ttl)
+
+    now = time.time()
+    result_store.put_meta(NAMESPACE, job_id, {
+        'id': job_id,
+        'userId': user['id'],
+        'query': sql,
+        'status': 'queued',
+        'pageSize': page_size,
+        'pages': 0,
+        'rowCount': 0,
+        'truncated': False,
+        'columns': None,
+        'error': None,
+        'cancelRequested': False,
+        'createdAt': now,
+        'startedAt': None,
+        'finishedAt': None,
+        'heartbeatAt': now,
+        'ttl': ttl,
+    }, ttl=ttl)
+    # The run shares the job id so the job can be cancelled by backend PID from any worker
+    run = QueryRun(user, run_id=job_id, long_running=long_running)
+    executor.submit(_run_job, job_id, local, run, sql, page_size, max_rows, slot)
+    return job_id
+
+def _update(job_id, local, fields):
+    result_store.put_meta(NAMESPACE, job_id, fields, ttl=local.ttl)
+    with local.progress:
+        local.progress.notify_all()
+
+def _run_job(job_id, local, run, sql, page_size, max_rows, slot):
+    try:
+        if local.cancelled.is_set() or _cancel_requested(job_id):
+            raise JobCancelled()
+        _update(job_id, local, {'status': 'running', 'startedAt': time.time(), 'heartbeatAt': time.time()})
+
+        with get_pool().connection() as conn:
+            with local.lock:
+                local.conn = conn
+            try:
+                _fetch_pages(conn, job_id, local, run, sql, page_size, max_rows)
+            finally:
+                with local.lock:
+                    local.conn = None
+                end_run(run)
+
+        _update(job_id, local, {'status': 'succeeded', 'finishedAt': time.time()})
+    except Exception as e:
+        if isinstance(e, JobCancelled) or local.cancelled.is_set() or _cancel_requested(job_id):
+            logger.info(f"Job {job_id} cancelled")
+            _update(job_id, local, {'status': 'cancelled', 'finishedAt': time.time()})
+        else:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            _update(job_id, local, {'status': 'failed', 'error': str(e), 'finishedAt': time.time()})
+    finally:
+        slot.release()
+        with _local_jobs_lock:
+            _local_jobs.pop(job_id, None)
+
+def _fetch_pages(conn, job_id, local, run, sql, page_size, max_rows):
+    with conn.cursor() as cur:
+        begin_run(cur, run)
+    with conn.cursor(name=f"job_{job_id}") as cur:
+        cur.itersize = page_size
+        cur.execute(sql)
+        pages = 0
+        row_count = 0
+        while True:
+            if local.cancelled.is_set() or _cancel_requested(job_id):
+                local.cancelled.set()
+                raise JobCancelled()
+            if max_rows is not None and row_count >= max_rows:
+                _update(job_id, local, {'truncated': True})
+                break
+            batch = cur.fetchmany(page_size if max_rows is None else min(page_size, max_rows - row_count))
+            if not batch:
+                break
+            result_store.put_page(NAMESPACE, job_id, pages, result_encoder.encode_rows(cur.description, batch), ttl=local.ttl)
+            pages += 1
+            row_count += len(batch)
+            progress = {'pages': pages, 'rowCount': row_count, 'heartbeatAt': time.time()}
+            if pages == 1:
+                progress['columns'] = [column.name for column in cur.description]
+            _update(job_id, local, progress)
+    conn.commit()
+
+def _cancel_requested(job_id):
+    meta = result_store.get_meta(NAMESPACE, job_id)
+    return bool(meta and meta.get('cancelRequested'))
+
+def get_job(job_id):
+    """Return job metadata, reporting jobs whose worker stopped heartbeating as failed"""
+    meta = result_store.get_meta(NAMESPACE, job_id)
+    if meta is None:
+        return None
+    heartbeat = meta.get('heartbeatAt') or 0
+    if meta.get('status') in ACTIVE_STATUSES and time.time() - heartbeat > JOB_HEARTBEAT_TIMEOUT:
+        meta['status'] = 'failed'
+        meta['error'] = 'Job worker stopped responding'
+    return meta
+
+def wait_for_page(job_id, page, timeout):
+    """Wait until a page exists or the job has ended; returns the latest job metadata"""
+    deadline = time.monotonic() + timeout
+    local = _local_jobs.get(job_id)
+    while True:
+        job = get_job(job_id)
+        if job is None or job['pages'] > page or job['status'] not in ACTIVE_STATUSES:
+            return job
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return job
+        if local is not None:
+            with local.progress:
+                local.progress.wait(min(remaining, 1.0))
+        else:
+            # Running in another worker: poll the shared store
+            time.sleep(min(remaining, 0.05))
+
+def get_job_page(job_id, page):
+    """Return one page of a job's results as a JSON array string, or None"""
+    return result_store.get_page(NAMESPACE, job_id, page)
+
+def cancel_job(job_id, user_id):
+    """Request cancellation of a user's job; cancels the running statement if there is one"""
+    local = _local_jobs.get(job_id)
+    if local is not None:
+        ttl = local.ttl
+    else:
+        # Keep the job's own lifetime; snapshots are shorter-lived than jobs
+        meta = result_store.get_meta(NAMESPACE, job_id)
+        ttl = meta.get('ttl', result_store.RESULT_STORE_TTL) if meta else result_store.RESULT_STORE_TTL
+    result_store.put_meta(NAMESPACE, job_id, {'cancelRequested': True}, ttl=ttl)
+
+    if local is not None:
+        local.cancelled.set()
+        with local.lock:
+            if local.conn is not None:
+                local.conn.cancel()
+        return True
+
+    # Running in another worker: cancel its backend by PID
+    cancel_run(user_id, job_id)
+    return True
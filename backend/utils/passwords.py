@@ -0,0 +1,104 @@
+"""Password hashing on a bounded per-process pool
+
+The request thread still blocks on its hash, so the pool frees no request
+capacity. What it adds is a cap on concurrent bcrypt work and on the queue in
+front of it: overflow and slow hashes fail fast with PasswordHashingBusy
+instead of piling up behind each other.
+"""
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+from dotenv import load_dotenv
+from db.db import query
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # cost for new hashes; stored hashes are upgraded on login
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "1"))  # concurrent hashes per gunicorn worker
+PASSWORD_HASH_MAX_QUEUED = int(os.getenv("PASSWORD_HASH_MAX_QUEUED", "8"))  # queued + running hashes per gunicorn worker
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))  # seconds a request waits for its hash
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing pool is full or a hash did not finish in time"""
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = None
+
+def _get_executor():
+    """Create the executor lazily so each gunicorn worker gets its own threads"""
+    global _executor, _executor_pid, _slots
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # bcrypt releases the GIL while hashing, so threads run it in parallel with requests
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+            _executor_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_QUEUED)
+        return _executor
+
+def _submit(fn, *args):
+    executor = _get_executor()
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise PasswordHashingBusy("Too many sign-ins in progress, try again later")
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+def _wait(future):
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FutureTimeout:
+        raise PasswordHashingBusy("Password hashing timed out, try again later")
+
+def _rounds(password_hash):
+    # Modular crypt format: $2b$<cost>$<salt+hash>
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def _hash(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+def _check(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def hash_password(password):
+    """Hash a password at BCRYPT_ROUNDS on the hashing pool"""
+    return _wait(_submit(_hash, password))
+
+def verify_password(password, password_hash, user_id=None):
+    """Check a password on the hashing pool
+
+    When it matches a hash made at a different cost and user_id is given,
+    the stored hash is replaced at BCRYPT_ROUNDS in the background.
+    """
+    matched = _wait(_submit(_check, password, password_hash))
+    if matched and user_id is not None and _rounds(password_hash) != BCRYPT_ROUNDS:
+        try:
+            _submit(_rehash, user_id, password, password_hash)
+        except PasswordHashingBusy:
+            pass  # upgraded on a later login
+    return matched
+
+def _rehash(user_id, password, old_hash):
+    try:
+        # Only replace the hash that was verified, in case the password changed meanwhile
+        query(
+            'UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s',
+            (_hash(password), user_id, old_hash)
+        )
+        logger.info(f"Rehashed password for user {user_id} at cost {BCRYPT_ROUNDS}")
+    except Exception as e:
+        logger.error(f"Password rehash failed for user {user_id}: {str(e)}")
@@ -0,0 +1,125 @@
+import os
+import time
+import zlib
+import logging
+from dotenv import load_dotenv
+from utils.redis_client import redis_client
+from utils.tiered_cache import TieredCache
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Cache settings
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "false").lower() == "true"
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "300"))  # seconds
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "10000"))
+QUERY_CACHE_MAX_ENTRY_BYTES = int(os.getenv("QUERY_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+QUERY_CACHE_COMPRESSION_LEVEL = int(os.getenv("QUERY_CACHE_COMPRESSION_LEVEL", "6"))
+
+KEY_PREFIX = "qcache:v1:"
+LRU_KEY = "qcache:v1:lru"  # sorted set of entry keys scored by last access time
+SIZES_KEY = "qcache:v1:sizes"  # hash of entry key -> payload bytes
+TOTAL_KEY = "qcache:v1:bytes"  # running total of cached payload bytes
+
+# Stores the payload, records its size and evicts least recently used
+# entries until the cache fits both caps. Never evicts the entry just written.
+SET_SCRIPT = """
+local old = redis.call('HGET', KEYS[3], KEYS[1])
+if old then redis.call('DECRBY', KEYS[4], old) end
+local size = string.len(ARGV[1])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+redis.call('HSET', KEYS[3], KEYS[1], size)
+local total = redis.call('INCRBY', KEYS[4], size)
+local count = redis.call('ZCARD', KEYS[2])
+local max_bytes = tonumber(ARGV[4])
+local max_entries = tonumber(ARGV[5])
+local evicted = 0
+while (total > max_bytes or count > max_entries) and count > 1 do
+    local oldest = redis.call('ZRANGE', KEYS[2], 0, 0)[1]
+    if oldest == KEYS[1] then break end
+    local oldest_size = redis.call('HGET', KEYS[3], oldest)
+    redis.call('DEL', oldest)
+    redis.call('ZREM', KEYS[2], oldest)
+    redis.call('HDEL', KEYS[3], oldest)
+    if oldest_size then
+        total = redis.call('DECRBY', KEYS[4], oldest_size)
+    end
+    count = count - 1
+    evicted = evicted + 1
+end
+return evicted
+"""
+
+# Returns the payload and bumps its LRU score, cleaning up entries whose TTL expired
+GET_SCRIPT = """
+local payload = redis.call('GET', KEYS[1])
+if payload then
+    redis.call('ZADD', KEYS[2], ARGV[1], KEYS[1])
+    return payload
+end
+local size = redis.call('HGET', KEYS[3], KEYS[1])
+if size then
+    redis.call('DECRBY', KEYS[4], size)
+    redis.call('HDEL', KEYS[3], KEYS[1])
+end
+redis.call('ZREM', KEYS[2], KEYS[1])
+return false
+"""
+
+def get_redis_client():
+    """Return the shared RedisClient, or None while its circuit breaker is open"""
+    return redis_client if redis_client.available() else None
+
+class _ResultCache(TieredCache):
+    """Query results: JSON strings in L1, zlib-compressed in the size-capped Redis LRU"""
+
+    def _l2_get(self, key):
+        client = get_redis_client()
+        if client is None:
+            return None
+        return client.run_script(GET_SCRIPT, keys=[KEY_PREFIX + key, LRU_KEY, SIZES_KEY, TOTAL_KEY], args=[time.time()]) or None
+
+    def _l2_set(self, key, payload, ttl):
+        client = get_redis_client()
+        if client is None:
+            return False
+        if len(payload) > QUERY_CACHE_MAX_ENTRY_BYTES:
+            logger.info(f"Result for {key} too large to cache ({len(payload)} bytes)")
+            return False
+        evicted = client.run_script(
+            SET_SCRIPT,
+            keys=[KEY_PREFIX + key, LRU_KEY, SIZES_KEY, TOTAL_KEY],
+            args=[payload, ttl, time.time(), QUERY_CACHE_MAX_BYTES, QUERY_CACHE_MAX_ENTRIES]
+        )
+        if evicted is None:
+            return False
+        if evicted:
+            logger.info(f"Query cache evicted {evicted} least recently used entries")
+        return True
+
+    def _l2_delete(self, key):
+        client = get_redis_client()
+        return client.delete(KEY_PREFIX + key) if client is not None else False
+
+_results = _ResultCache(
+    'qresult',
+    QUERY_CACHE_TTL,
+    dumps=lambda result_json: zlib.compress(result_json.encode('utf-8'), QUERY_CACHE_COMPRESSION_LEVEL),
+    loads=lambda payload: zlib.decompress(payload).decode('utf-8'),
+    sizeof=len,
+)
+
+def get_cached_result(fingerprint):
+    """Return the cached JSON-encoded result for a fingerprint, or None on miss"""
+    return _results.get(fingerprint)
+
+def cache_result(fingerprint, result_json, ttl=None):
+    """Compress and store a JSON-encoded result; returns False when Redis did not take it
+
+    The result is kept in this worker's memory either way.
+    """
+    return _results.set(fingerprint, result_json, ttl)
@@ -0,0 +1,109 @@
+import os
+import re
+import time
+import uuid
+import logging
+from dotenv import load_dotenv
+from db.db import query
+from utils import result_store
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Statement timeouts in milliseconds; 0 disables the limit
+STATEMENT_TIMEOUT_DEFAULT_MS = int(os.getenv("STATEMENT_TIMEOUT_MS", "110000"))  # below gunicorn's 120 s timeout
+STATEMENT_TIMEOUT_BY_ROLE_MS = {
+    'regular_user': int(os.getenv("STATEMENT_TIMEOUT_REGULAR_USER_MS", str(STATEMENT_TIMEOUT_DEFAULT_MS))),
+    'admin_user': int(os.getenv("STATEMENT_TIMEOUT_ADMIN_USER_MS", "300000")),
+}
+# Background work (jobs, exports) is not bound by the request timeout
+LONG_RUNNING_TIMEOUT_MS = int(os.getenv("STATEMENT_TIMEOUT_LONG_RUNNING_MS", "1800000"))
+
+NAMESPACE = "run"
+FINISHED_RUN_TTL = 300  # seconds a finished run stays visible
+RUN_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def statement_timeout_for(user, long_running=False):
+    """Statement timeout in ms for a user's JWT claims"""
+    if long_running:
+        return LONG_RUNNING_TIMEOUT_MS
+    role = (user or {}).get('userType') or (user or {}).get('user_type')
+    return STATEMENT_TIMEOUT_BY_ROLE_MS.get(role, STATEMENT_TIMEOUT_DEFAULT_MS)
+
+def is_valid_run_id(run_id):
+    return bool(run_id) and bool(RUN_ID_PATTERN.match(run_id))
+
+def _run_key(user_id, run_id):
+    # Client-chosen run ids only need to be unique per user
+    return f"{user_id}:{run_id}"
+
+class QueryRun:
+    """One tracked execution of user SQL
+
+    Passed to db.query/stream_query/copy_query as run=..., which apply the
+    timeout and application_name to the transaction and report the backend PID.
+    Runs are tracked per user, so two users may pick the same run id.
+    """
+
+    def __init__(self, user, run_id=None, long_running=False):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.user_id = user['id']
+        self.key = _run_key(self.user_id, self.run_id)
+        self.timeout_ms = statement_timeout_for(user, long_running)
+        # Server-generated and short enough for Postgres' 63-byte limit
+        self.application_name = f"run:{uuid.uuid4().hex}"
+        self.backend_pid = None
+        if run_id is not None:
+            # A reused run id must not inherit an earlier run's cancellation
+            result_store.put_meta(NAMESPACE, self.key, {'cancelRequested': False}, ttl=FINISHED_RUN_TTL)
+
+    def started(self, pid):
+        self.backend_pid = pid
+        # Kept a little past the timeout in case finished() never runs
+        ttl = int(self.timeout_ms / 1000) + 60 if self.timeout_ms else result_store.RESULT_STORE_TTL
+        result_store.put_meta(NAMESPACE, self.key, {
+            'userId': self.user_id,
+            'applicationName': self.application_name,
+            'backendPid': pid,
+            'status': 'running',
+            'timeoutMs': self.timeout_ms,
+            'startedAt': time.time(),
+        }, ttl=ttl)
+
+    def finished(self):
+        if self.backend_pid is None:
+            return
+        result_store.put_meta(NAMESPACE, self.key, {
+            'status': 'finished',
+            'backendPid': None,
+            'finishedAt': time.time(),
+        }, ttl=FINISHED_RUN_TTL)
+
+    def was_cancelled(self):
+        meta = result_store.get_meta(NAMESPACE, self.key)
+        return bool(meta and meta.get('cancelRequested'))
+
+def get_run(user_id, run_id):
+    """Return one of a user's runs, or None if it is unknown or another user's"""
+    return result_store.get_meta(NAMESPACE, _run_key(user_id, run_id))
+
+def cancel_run(user_id, run_id):
+    """Send pg_cancel_backend to a user's run; returns True if a statement was signalled
+
+    The application_name check makes sure a PID that has moved on to another
+    statement is never cancelled by mistake.
+    """
+    key = _run_key(user_id, run_id)
+    result_store.put_meta(NAMESPACE, key, {'cancelRequested': True})
+    meta = get_run(user_id, run_id)
+    if not meta or meta.get('status') != 'running' or not meta.get('backendPid'):
+        return False
+    result = query(
+        'SELECT pg_cancel_backend(pid) AS cancelled FROM pg_stat_activity WHERE pid = %s AND application_name = %s',
+        (meta['backendPid'], meta.get('applicationName'))
+    )
+    cancelled = bool(result and result[0]['cancelled'])
+    logger.info(f"Cancel requested for run {run_id} (backend {meta['backendPid']}): {cancelled}")
+    return cancelled
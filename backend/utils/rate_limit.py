@@ -0,0 +1,186 @@
+import os
+import math
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from utils.query_cache import get_redis_client
+from utils.query_tracker import statement_timeout_for
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "10"))  # requests per second per user and endpoint
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "30"))
+RATE_LIMIT_QUERY_RATE = float(os.getenv("RATE_LIMIT_QUERY_RATE", "2"))  # for endpoints that run user SQL
+RATE_LIMIT_QUERY_BURST = float(os.getenv("RATE_LIMIT_QUERY_BURST", "10"))
+RATE_LIMIT_MAX_CONCURRENT_QUERIES = int(os.getenv("RATE_LIMIT_MAX_CONCURRENT_QUERIES", "3"))  # running queries per user
+CONCURRENCY_RETRY_AFTER = 1  # seconds
+SLOT_LEASE_MARGIN = 60  # seconds a slot outlives the statement timeout, in case release never runs
+SLOT_LEASE_UNBOUNDED = 3600  # seconds, for users without a statement timeout
+LOCAL_BUCKETS_SIZE = 10000
+
+# Endpoints that run user SQL get the tighter query limits
+QUERY_ENDPOINTS = {'queries.execute_query', 'queries.download_results', 'jobs.submit_job'}
+
+BUCKET_KEY = "ratelimit:v1:bucket:{}:{}"  # user id, endpoint
+RUNNING_KEY = "ratelimit:v1:running:{}"  # sorted set of slot ids scored by lease expiry
+
+# Refill by elapsed time, then take one token; returns 0 or the ms until a token is available
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local retry_ms = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return retry_ms
+"""
+
+# Drop expired leases, then add this slot if the user is under the cap; returns 1 or 0
+# The key lives until its longest lease, so a short slot never cuts a long one short
+ACQUIRE_SLOT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+local longest = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+redis.call('EXPIREAT', KEYS[1], math.ceil(tonumber(longest[2])))
+return 1
+"""
+
+RELEASE_SLOT_SCRIPT = """
+return redis.call('ZREM', KEYS[1], ARGV[1])
+"""
+
+class RateLimited(Exception):
+    """Raised when a user is over a rate or concurrency limit"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class QuerySlot:
+    """One of a user's concurrent query slots; release() is idempotent"""
+
+    __slots__ = ('user_id', 'slot_id', 'shared', 'released')
+
+    def __init__(self, user_id, slot_id, shared):
+        self.user_id = user_id
+        self.slot_id = slot_id
+        self.shared = shared  # held in Redis rather than in this process
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        if self.shared:
+            client = get_redis_client()
+            if client is not None:
+                client.run_script(RELEASE_SLOT_SCRIPT, keys=[RUNNING_KEY.format(self.user_id)], args=[self.slot_id])
+            return
+        with _local_lock:
+            remaining = _local_running.get(self.user_id, 1) - 1
+            if remaining > 0:
+                _local_running[self.user_id] = remaining
+            else:
+                _local_running.pop(self.user_id, None)
+
+# Per-process fallbacks while Redis is unreachable
+_local_lock = threading.Lock()
+_local_buckets = OrderedDict()  # (user id, endpoint) -> [tokens, ts]
+_local_running = {}  # user id -> running queries
+
+def limits_for(endpoint):
+    """(rate per second, burst) for an endpoint"""
+    if endpoint in QUERY_ENDPOINTS:
+        return RATE_LIMIT_QUERY_RATE, RATE_LIMIT_QUERY_BURST
+    return RATE_LIMIT_RATE, RATE_LIMIT_BURST
+
+def check_rate(user_id, endpoint):
+    """Take a token from the user's bucket for an endpoint; raises RateLimited when empty"""
+    if not RATE_LIMIT_ENABLED:
+        return
+    rate, burst = limits_for(endpoint)
+    now = time.time()
+    retry_ms = None
+    client = get_redis_client()
+    if client is not None:
+        retry_ms = client.run_script(
+            TOKEN_BUCKET_SCRIPT, keys=[BUCKET_KEY.format(user_id, endpoint)], args=[rate, burst, now]
+        )
+    if retry_ms is None:
+        retry_ms = _local_take(user_id, endpoint, rate, burst, now)
+    if retry_ms:
+        raise RateLimited("Too many requests, slow down", math.ceil(retry_ms / 1000))
+
+def _local_take(user_id, endpoint, rate, burst, now):
+    key = (user_id, endpoint)
+    with _local_lock:
+        bucket = _local_buckets.get(key)
+        if bucket is None:
+            bucket = _local_buckets[key] = [burst, now]
+            if len(_local_buckets) > LOCAL_BUCKETS_SIZE:
+                _local_buckets.popitem(last=False)
+        _local_buckets.move_to_end(key)
+        tokens = min(burst, bucket[0] + max(0.0, now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0
+        bucket[0] = tokens
+        return math.ceil((1 - tokens) / rate * 1000)
+
+def acquire_query_slot(user, long_running=False):
+    """Reserve one of the user's concurrent query slots; raises RateLimited when all are taken
+
+    user is the caller's JWT claims. Slots are leased for the statement
+    timeout, so a worker that dies mid-query cannot hold one forever.
+    """
+    user_id = user['id']
+    slot_id = uuid.uuid4().hex
+    if not RATE_LIMIT_ENABLED:
+        return QuerySlot(user_id, slot_id, False)
+
+    timeout_ms = statement_timeout_for(user, long_running)
+    lease = timeout_ms / 1000 + SLOT_LEASE_MARGIN if timeout_ms else SLOT_LEASE_UNBOUNDED
+    now = time.time()
+    acquired = None
+    client = get_redis_client()
+    if client is not None:
+        acquired = client.run_script(
+            ACQUIRE_SLOT_SCRIPT,
+            keys=[RUNNING_KEY.format(user_id)],
+            args=[now, RATE_LIMIT_MAX_CONCURRENT_QUERIES, now + lease, slot_id]
+        )
+    if acquired is not None:
+        shared = True
+    else:
+        shared = False
+        with _local_lock:
+            running = _local_running.get(user_id, 0)
+            acquired = running < RATE_LIMIT_MAX_CONCURRENT_QUERIES
+            if acquired:
+                _local_running[user_id] = running + 1
+    if not acquired:
+        raise RateLimited(
+            f"Too many queries running, at most {RATE_LIMIT_MAX_CONCURRENT_QUERIES} at a time",
+            CONCURRENCY_RETRY_AFTER
+        )
+    return QuerySlot(user_id, slot_id, shared)
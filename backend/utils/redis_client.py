@@ -2,11 +2,9 @@ import redis
 import logging
 import time
 import os
+import threading
 from dotenv import load_dotenv
-from typing import Optional
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -17,130 +15,276 @@ REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB = int(os.getenv('REDIS_DB', 0))
 REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', None)
-MAX_RETRIES = 10
-RETRY_DELAY = 2  # seconds
-
-# Create Redis client
-redis_client: Optional[redis.Redis] = None
-
-def get_redis_client() -> redis.Redis:
-    global redis_client
-    if redis_client is None:
-        max_retries = 10
-        retry_count = 0
-        while retry_count < max_retries:
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))  # per pool, per gunicorn worker
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "1"))  # seconds
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "1"))  # seconds
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "1"))  # seconds to wait for a free pooled connection
+
+# Circuit breaker: open after this many consecutive connection errors, then probe in the background
+REDIS_BREAKER_THRESHOLD = int(os.getenv("REDIS_BREAKER_THRESHOLD", "3"))
+REDIS_BREAKER_PROBE_INTERVAL = float(os.getenv("REDIS_BREAKER_PROBE_INTERVAL", "5"))  # seconds between probes
+
+# Only these errors mean Redis itself is unhealthy; others are bugs in the command
+CONNECTION_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+class CircuitBreaker:
+    """Fail fast while Redis is down, and probe it off the request path
+
+    Closed: calls go through. After REDIS_BREAKER_THRESHOLD consecutive
+    connection errors the breaker opens and calls are short-circuited until a
+    background probe gets a PING through. State is per process: a worker forked
+    from a process with an open breaker starts closed, since the probe thread
+    that would close it did not survive the fork.
+    """
+
+    def __init__(self, probe):
+        self._probe = probe
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self.open = False
+        self.consecutive_failures = 0
+        self.calls = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.opened_count = 0
+        self.opened_at = None
+        self.last_error = None
+        self.last_failure_at = None
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def is_open(self):
+        if self._pid != os.getpid():
+            self._reset()
+        return self.open
+
+    def allow(self):
+        if self.is_open():
+            self.short_circuited += 1
+            return False
+        return True
+
+    def record_success(self, latency):
+        self.calls += 1
+        self.consecutive_failures = 0
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def record_failure(self, error):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            self.last_failure_at = time.time()
+            if not self.open and self.consecutive_failures >= REDIS_BREAKER_THRESHOLD:
+                self.open = True
+                self.opened_count += 1
+                self.opened_at = time.time()
+                logger.error(f"Redis circuit opened after {self.consecutive_failures} failures: {error}")
+            if self.open and (self._probe_thread is None or not self._probe_thread.is_alive()):
+                self._probe_thread = threading.Thread(target=self._probe_loop, name='redis-probe', daemon=True)
+                self._probe_thread.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(REDIS_BREAKER_PROBE_INTERVAL)
             try:
-                logger.info(f"Attempting to connect to Redis at {REDIS_HOST}:{REDIS_PORT} (attempt {retry_count + 1}/{max_retries})")
-                redis_client = redis.Redis(
-                    host=REDIS_HOST,
-                    port=REDIS_PORT,
-                    db=REDIS_DB,
-                    password=REDIS_PASSWORD,
-                    decode_responses=True
-                )
-                # Test connection
-                redis_client.ping()
-                logger.info("Successfully connected to Redis")
-                break
-            except redis.ConnectionError as e:
-                retry_count += 1
-                if retry_count == max_retries:
-                    logger.error(f"Failed to connect to Redis after {max_retries} attempts: {str(e)}")
-                    raise
-                logger.warning(f"Failed to connect to Redis (attempt {retry_count}/{max_retries}): {str(e)}")
-                time.sleep(2)  # Wait 2 seconds before retrying
-    return redis_client
+                self._probe()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Redis probe failed, circuit stays open: {str(e)}")
+                continue
+            with self._lock:
+                self.open = False
+                self.consecutive_failures = 0
+                self._probe_thread = None
+            logger.info(f"Redis circuit closed after {time.time() - self.opened_at:.1f} s")
+            return
+
+    def stats(self):
+        succeeded = self.calls - self.failures
+        return {
+            'state': 'open' if self.open else 'closed',
+            'consecutiveFailures': self.consecutive_failures,
+            'calls': self.calls,
+            'failures': self.failures,
+            'shortCircuited': self.short_circuited,
+            'openedCount': self.opened_count,
+            'openedAt': self.opened_at,
+            'lastError': self.last_error,
+            'lastFailureAt': self.last_failure_at,
+            'avgLatencyMs': round(self.total_latency / succeeded * 1000, 3) if succeeded else None,
+            'maxLatencyMs': round(self.max_latency * 1000, 3),
+        }
+
+def _pool_stats(pool):
+    if pool is None:
+        return None
+    # BlockingConnectionPool keeps idle connections (and None placeholders) in a queue
+    created = len(pool._connections)
+    idle = sum(1 for connection in list(pool.pool.queue) if connection)
+    return {
+        'maxConnections': pool.max_connections,
+        'created': created,
+        'inUse': created - idle,
+        'idle': idle,
+    }
 
 class RedisClient:
+    """Shared Redis access with lazily created, bounded connection pools
+
+    Nothing connects until the first command. Every method returns a
+    neutral value (None/False/0) when Redis is unavailable instead of raising.
+    """
     _instance = None
-    _client = None
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(RedisClient, cls).__new__(cls)
-            cls._instance.connect_with_retry()
+            instance = super(RedisClient, cls).__new__(cls)
+            instance._lock = threading.Lock()
+            instance._client = None
+            instance._binary_client = None
+            instance._scripts = {}
+            instance.breaker = CircuitBreaker(instance._ping)
+            cls._instance = instance
         return cls._instance
 
-    def connect_with_retry(self):
-        """Connect to Redis with retry logic"""
-        for attempt in range(MAX_RETRIES):
-            try:
-                logger.info(f"Attempting to connect to Redis at {REDIS_HOST}:{REDIS_PORT} (attempt {attempt + 1}/{MAX_RETRIES})")
-                self._client = redis.Redis(
-                    host=REDIS_HOST,
-                    port=REDIS_PORT,
-                    db=REDIS_DB,
-                    password=REDIS_PASSWORD,
-                    decode_responses=True,
-                    socket_timeout=5,
-                    socket_connect_timeout=5
-                )
-                # Test the connection
-                self._client.ping()
-                logger.info("Successfully connected to Redis")
-                return
-            except redis.ConnectionError as e:
-                logger.error(f"Failed to connect to Redis (attempt {attempt + 1}/{MAX_RETRIES}): {str(e)}")
-                if attempt < MAX_RETRIES - 1:
-                    logger.info(f"Retrying in {RETRY_DELAY} seconds...")
-                    time.sleep(RETRY_DELAY)
-                else:
-                    logger.error("Max retries reached. Could not connect to Redis.")
-                    raise
-            except Exception as e:
-                logger.error(f"Unexpected error connecting to Redis: {str(e)}")
-                if attempt < MAX_RETRIES - 1:
-                    logger.info(f"Retrying in {RETRY_DELAY} seconds...")
-                    time.sleep(RETRY_DELAY)
-                else:
-                    logger.error("Max retries reached. Could not connect to Redis.")
-                    raise
+    def _make_pool(self, decode_responses):
+        # BlockingConnectionPool waits briefly for a free connection instead of failing at the limit
+        return redis.BlockingConnectionPool(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD,
+            decode_responses=decode_responses,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            health_check_interval=30
+        )
 
-    def get(self, key):
-        """Get value from Redis"""
+    def _clients(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    logger.info(f"Creating Redis connection pools for {REDIS_HOST}:{REDIS_PORT} (max {REDIS_MAX_CONNECTIONS} connections each)")
+                    # Separate client for compressed/binary payloads
+                    self._binary_client = redis.Redis(connection_pool=self._make_pool(False))
+                    self._client = redis.Redis(connection_pool=self._make_pool(True))
+        return self._client, self._binary_client
+
+    def _ping(self):
+        self._clients()[0].ping()
+
+    def _call(self, description, default, fn, binary=False):
+        """Run fn(client) through the circuit breaker; default on any error"""
+        if not self.breaker.allow():
+            return default
+        client = self._clients()[1 if binary else 0]
+        started = time.perf_counter()
         try:
-            if not self._client:
-                logger.error("Redis client not initialized")
-                return None
-            return self._client.get(key)
+            result = fn(client)
+        except CONNECTION_ERRORS as e:
+            self.breaker.record_failure(e)
+            logger.error(f"Redis unavailable while {description}: {str(e)}")
+            return default
         except Exception as e:
-            logger.error(f"Error getting key {key} from Redis: {str(e)}")
-            return None
+            logger.error(f"Error {description} in Redis: {str(e)}")
+            return default
+        self.breaker.record_success(time.perf_counter() - started)
+        return result
+
+    def available(self):
+        """False while the circuit is open, so callers can skip Redis entirely"""
+        return not self.breaker.is_open()
+
+    def health(self):
+        """Breaker state, call counts, latency and pool usage"""
+        stats = self.breaker.stats()
+        stats['pool'] = _pool_stats(self._client.connection_pool if self._client is not None else None)
+        stats['binaryPool'] = _pool_stats(self._binary_client.connection_pool if self._binary_client is not None else None)
+        return stats
+
+    def get(self, key):
+        """Get value from Redis"""
+        return self._call(f"getting key {key}", None, lambda c: c.get(key))
 
     def set(self, key, value, expiry=None):
         """Set value in Redis with optional expiry"""
-        try:
-            if not self._client:
-                logger.error("Redis client not initialized")
-                return False
-            if expiry:
-                return self._client.setex(key, expiry, value)
-            return self._client.set(key, value)
-        except Exception as e:
-            logger.error(f"Error setting key {key} in Redis: {str(e)}")
-            return False
+        if expiry:
+            return self._call(f"setting key {key}", False, lambda c: c.setex(key, expiry, value))
+        return self._call(f"setting key {key}", False, lambda c: c.set(key, value))
 
     def delete(self, key):
         """Delete key from Redis"""
-        try:
-            if not self._client:
-                logger.error("Redis client not initialized")
-                return False
-            return bool(self._client.delete(key))
-        except Exception as e:
-            logger.error(f"Error deleting key {key} from Redis: {str(e)}")
-            return False
+        return bool(self._call(f"deleting key {key}", False, lambda c: c.delete(key)))
 
     def exists(self, key):
         """Check if key exists in Redis"""
-        try:
-            if not self._client:
-                logger.error("Redis client not initialized")
-                return False
-            return bool(self._client.exists(key))
-        except Exception as e:
-            logger.error(f"Error checking key {key} in Redis: {str(e)}")
-            return False
+        return bool(self._call(f"checking key {key}", False, lambda c: c.exists(key)))
+
+    def incr(self, key, expiry=None):
+        """Atomically increment an integer key, refreshing its optional expiry; None on error"""
+        def incr(client):
+            pipe = client.pipeline()
+            pipe.incr(key)
+            if expiry:
+                pipe.expire(key, expiry)
+            return pipe.execute()[0]
+        return self._call(f"incrementing key {key}", None, incr)
+
+    def get_bytes(self, key):
+        """Get raw bytes value from Redis"""
+        return self._call(f"getting key {key}", None, lambda c: c.get(key), binary=True)
+
+    def set_bytes(self, key, value, expiry=None):
+        """Set raw bytes value in Redis with optional expiry"""
+        if expiry:
+            return self._call(f"setting key {key}", False, lambda c: c.setex(key, expiry, value), binary=True)
+        return self._call(f"setting key {key}", False, lambda c: c.set(key, value), binary=True)
+
+    def hset_many(self, key, mapping, expiry=None):
+        """Set several hash fields at once, refreshing the key's expiry"""
+        def hset(client):
+            pipe = client.pipeline()
+            pipe.hset(key, mapping=mapping)
+            if expiry:
+                pipe.expire(key, expiry)
+            pipe.execute()
+            return True
+        return self._call(f"setting hash {key}", False, hset)
+
+    def hgetall(self, key):
+        """Get all fields of a hash; None on error"""
+        return self._call(f"getting hash {key}", None, lambda c: c.hgetall(key))
+
+    def set_if_absent(self, key, value, expiry_ms):
+        """Set key only if it does not exist (lock acquisition)"""
+        return bool(self._call(f"setting key {key}", False, lambda c: c.set(key, value, nx=True, px=expiry_ms)))
+
+    def publish(self, channel, message):
+        """Publish a message on a channel"""
+        return self._call(f"publishing to {channel}", 0, lambda c: c.publish(channel, message))
+
+    def pubsub(self):
+        """Return a PubSub object, or None when Redis is unavailable"""
+        return self._call("creating pubsub", None, lambda c: c.pubsub(ignore_subscribe_messages=True))
+
+    def run_script(self, script, keys=None, args=None):
+        """Run a Lua script atomically, registering it on first use"""
+        def run(client):
+            registered = self._scripts.get(script)
+            if registered is None:
+                registered = self._scripts[script] = client.register_script(script)
+            return registered(keys=keys or [], args=args or [])
+        return self._call("running script", None, run, binary=True)
 
-# Create a singleton instance
-redis_client = RedisClient()
\ No newline at end of file
+# Shared instance; creating it does not connect
+redis_client = RedisClient()
@@ -0,0 +1,271 @@
+import os
+import json
+import math
+import logging
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from uuid import UUID
+from datetime import date, timezone
+from json.encoder import encode_basestring_ascii
+from dotenv import load_dotenv
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # optional, pip install orjson
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional, pip install pyarrow
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+RESULT_ENCODER = os.getenv("RESULT_ENCODER", "typed").lower()  # typed, orjson or default
+ENCODER_CACHE_SIZE = 256
+
+# Postgres type OIDs (pg_type.oid) as reported in cursor.description[i].type_code
+INT_OIDS = {20, 21, 23, 26}  # int8, int2, int4, oid
+FLOAT_OIDS = {700, 701}  # float4, float8
+NUMERIC_OID = 1700
+BOOL_OID = 16
+TEXT_OIDS = {18, 19, 25, 1042, 1043}  # char, name, text, bpchar, varchar
+DATE_OID = 1082
+TIMESTAMP_OIDS = {1114, 1184}  # timestamp, timestamptz
+STRING_LIKE_OIDS = {1083, 1266, 1186, 2950, 869, 650, 829}  # time, timetz, interval, uuid, inet, cidr, macaddr
+BYTEA_OID = 17
+JSON_OIDS = {114, 3802}  # json, jsonb
+
+# Type names reported alongside columnar results; other types are reported by OID
+TYPE_NAMES = {
+    16: 'bool', 17: 'bytea', 18: 'char', 19: 'name', 20: 'int8', 21: 'int2', 23: 'int4', 25: 'text',
+    26: 'oid', 114: 'json', 650: 'cidr', 700: 'float4', 701: 'float8', 829: 'macaddr', 869: 'inet',
+    1042: 'bpchar', 1043: 'varchar', 1082: 'date', 1083: 'time', 1114: 'timestamp', 1184: 'timestamptz',
+    1186: 'interval', 1266: 'timetz', 1700: 'numeric', 2950: 'uuid', 3802: 'jsonb',
+}
+ARROW_MAX_DECIMAL_PRECISION = 38  # decimal128
+
+if RESULT_ENCODER == 'orjson' and orjson is None:
+    logger.warning("RESULT_ENCODER=orjson but orjson is not installed, using the typed encoder")
+    RESULT_ENCODER = 'typed'
+
+def _default(value):
+    """Types json cannot encode natively; matches Flask's DefaultJSONProvider where it has an opinion"""
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    if isinstance(value, (memoryview, bytes, bytearray)):
+        return '\\x' + bytes(value).hex()
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    # time, timedelta, ranges, network addresses...
+    return str(value)
+
+def _encode_float(value):
+    if math.isfinite(value):
+        return repr(value)
+    return 'NaN' if value != value else ('Infinity' if value > 0 else '-Infinity')
+
+def _encode_bool(value):
+    return 'true' if value else 'false'
+
+def _encode_str(value):
+    return encode_basestring_ascii(str(value))
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+def _encode_timestamp(value):
+    # werkzeug's http_date without the timetuple round trip; naive values are taken as UTC like there
+    if value.tzinfo is not None and value.utcoffset():
+        value = value.astimezone(timezone.utc)
+    return (
+        f'"{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} '
+        f'{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT"'
+    )
+
+def _encode_date(value):
+    return f'"{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} 00:00:00 GMT"'
+
+def _encode_bytea(value):
+    return '"\\\\x' + bytes(value).hex() + '"'
+
+def _encode_any(value):
+    # json/jsonb, arrays, composites and anything else psycopg2 hands back
+    return json.dumps(value, default=_default, separators=(',', ':'), sort_keys=True)
+
+def column_encoder(type_code):
+    """Pick the encoder for one column from its type OID"""
+    if type_code in INT_OIDS:
+        return int.__repr__
+    if type_code in FLOAT_OIDS:
+        return _encode_float
+    if type_code == BOOL_OID:
+        return _encode_bool
+    if type_code in TEXT_OIDS:
+        return encode_basestring_ascii
+    if type_code in STRING_LIKE_OIDS or type_code == NUMERIC_OID:
+        # numeric stays a string, as Flask encodes Decimal, so no precision is lost
+        return _encode_str
+    if type_code in TIMESTAMP_OIDS:
+        return _encode_timestamp
+    if type_code == DATE_OID:
+        return _encode_date
+    if type_code == BYTEA_OID:
+        return _encode_bytea
+    return _encode_any
+
+class RowEncoder:
+    """Encodes result tuples as JSON objects with one precomputed encoder per column
+
+    Keys are emitted in column order, so no dict is built per row.
+    """
+
+    __slots__ = ('names', 'columns', 'header')
+
+    def __init__(self, description):
+        self.names = [column.name for column in description]
+        self.columns = [
+            (encode_basestring_ascii(column.name) + ':', column_encoder(column.type_code))
+            for column in description
+        ]
+        self.header = json.dumps([
+            {'name': column.name, 'type': TYPE_NAMES.get(column.type_code, str(column.type_code))}
+            for column in description
+        ], separators=(',', ':'))
+
+    def encode_row(self, row):
+        return '{' + ','.join([
+            key + ('null' if value is None else encode(value))
+            for (key, encode), value in zip(self.columns, row)
+        ]) + '}'
+
+    def encode_rows(self, rows):
+        """JSON array of rows"""
+        if RESULT_ENCODER == 'orjson':
+            return orjson.dumps(
+                [dict(zip(self.names, row)) for row in rows],
+                default=_default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            ).decode('utf-8')
+        if RESULT_ENCODER == 'default':
+            return json.dumps([dict(zip(self.names, row)) for row in rows], default=_default, sort_keys=True)
+        encode_row = self.encode_row
+        return '[' + ','.join([encode_row(row) for row in rows]) + ']'
+
+    def encode_lines(self, rows):
+        """NDJSON, one row per line"""
+        encode_row = self.encode_row
+        return ''.join([encode_row(row) + '\n' for row in rows])
+
+    def encode_columns(self, rows):
+        """Column names and types once, then one value array per column"""
+        values_by_column = zip(*rows) if rows else [()] * len(self.columns)
+        data = ','.join([
+            '[' + ','.join(['null' if value is None else encode(value) for value in values]) + ']'
+            for (_, encode), values in zip(self.columns, values_by_column)
+        ])
+        return '{"columns":' + self.header + ',"rowCount":' + str(len(rows)) + ',"data":[' + data + ']}'
+
+_lock = threading.Lock()
+_encoders = OrderedDict()  # ((name, type_code), ...) -> RowEncoder
+
+def encoder_for(description):
+    """Return a RowEncoder for a cursor.description, reused across queries with the same columns"""
+    key = tuple((column.name, column.type_code) for column in description)
+    with _lock:
+        encoder = _encoders.get(key)
+        if encoder is not None:
+            _encoders.move_to_end(key)
+            return encoder
+    encoder = RowEncoder(description)
+    with _lock:
+        _encoders[key] = encoder
+        if len(_encoders) > ENCODER_CACHE_SIZE:
+            _encoders.popitem(last=False)
+    return encoder
+
+def encode_rows(description, rows):
+    """Encode a result (cursor.description plus tuple rows) as a JSON array string"""
+    if description is None:
+        return 'null' if rows is None else '[]'
+    return encoder_for(description).encode_rows(rows)
+
+def encode_columns(description, rows):
+    """Encode a result as {"columns": [{name, type}], "rowCount": n, "data": [[column values]]}"""
+    if description is None:
+        return 'null'
+    return encoder_for(description).encode_columns(rows)
+
+def _arrow_type(column):
+    type_code = column.type_code
+    if type_code == 21:
+        return pa.int16()
+    if type_code == 23:
+        return pa.int32()
+    if type_code in INT_OIDS:
+        return pa.int64()
+    if type_code == 700:
+        return pa.float32()
+    if type_code == 701:
+        return pa.float64()
+    if type_code == BOOL_OID:
+        return pa.bool_()
+    if type_code == NUMERIC_OID and column.precision and column.precision <= ARROW_MAX_DECIMAL_PRECISION:
+        # Unconstrained numeric has no precision and stays a string
+        return pa.decimal128(column.precision, column.scale or 0)
+    if type_code == DATE_OID:
+        return pa.date32()
+    if type_code == 1114:
+        return pa.timestamp('us')
+    if type_code == 1184:
+        return pa.timestamp('us', tz='UTC')
+    if type_code == BYTEA_OID:
+        return pa.binary()
+    return pa.string()
+
+def _arrow_values(column, arrow_type, values):
+    # Values Arrow cannot take as-is become bytes or strings, encoded like the JSON formats
+    if pa.types.is_binary(arrow_type):
+        return [None if value is None else bytes(value) for value in values]
+    if not pa.types.is_string(arrow_type) or column.type_code in TEXT_OIDS:
+        return values
+    if column.type_code in JSON_OIDS:
+        return [None if value is None else json.dumps(value, default=_default, separators=(',', ':')) for value in values]
+    return [value if value is None or isinstance(value, str) else _default(value) for value in values]
+
+def arrow_schema(description):
+    """Arrow schema for a cursor.description; requires pyarrow"""
+    return pa.schema([pa.field(column.name, _arrow_type(column)) for column in description])
+
+def arrow_batch(description, rows, schema=None):
+    """Convert tuple rows to an Arrow record batch, column by column"""
+    schema = schema or arrow_schema(description)
+    values_by_column = zip(*rows) if rows else [()] * len(description)
+    return pa.RecordBatch.from_arrays([
+        pa.array(_arrow_values(column, field.type, list(values)), type=field.type)
+        for column, field, values in zip(description, schema, values_by_column)
+    ], schema=schema)
+
+def encode_arrow(description, rows):
+    """Encode a result as an Arrow IPC stream; requires pyarrow"""
+    schema = arrow_schema(description or [])
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        if rows:
+            writer.write_batch(arrow_batch(description, rows, schema))
+    return sink.getvalue().to_pybytes()
+
+def dumps(obj):
+    """Serialize any response payload, through orjson when it is selected"""
+    if RESULT_ENCODER == 'orjson':
+        return orjson.dumps(
+            obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+        ).decode('utf-8')
+    return json.dumps(obj, default=_default, separators=(',', ':'), sort_keys=True)
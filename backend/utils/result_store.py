@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import zlib
+import logging
+import threading
+from dotenv import load_dotenv
+from utils.query_cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+RESULT_STORE_TTL = int(os.getenv("RESULT_STORE_TTL", "3600"))  # seconds results stay fetchable
+RESULT_STORE_LOCAL_MAX_BYTES = int(os.getenv("RESULT_STORE_LOCAL_MAX_BYTES", str(64 * 1024 * 1024)))
+
+KEY_PREFIX = "results:v1:"
+
+class _LocalStore:
+    """In-process fallback used while Redis is unavailable"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}  # key -> (expires_at, dict)
+        self._pages = {}  # key -> (expires_at, bytes)
+        self._bytes = 0
+
+    def _purge(self, now):
+        for key in [k for k, (expires_at, _) in self._meta.items() if expires_at <= now]:
+            del self._meta[key]
+        for key in [k for k, (expires_at, _) in self._pages.items() if expires_at <= now]:
+            self._bytes -= len(self._pages.pop(key)[1])
+
+    def put_meta(self, key, fields, ttl):
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            _, meta = self._meta.get(key, (None, {}))
+            meta = dict(meta, **fields)
+            self._meta[key] = (now + ttl, meta)
+
+    def get_meta(self, key):
+        with self._lock:
+            entry = self._meta.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return dict(entry[1])
+
+    def put_page(self, key, payload, ttl):
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            if self._bytes + len(payload) > RESULT_STORE_LOCAL_MAX_BYTES:
+                logger.error(f"Local result store full, dropping page {key}")
+                return False
+            if key in self._pages:
+                self._bytes -= len(self._pages[key][1])
+            self._pages[key] = (now + ttl, payload)
+            self._bytes += len(payload)
+            return True
+
+    def get_page(self, key):
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    def delete_meta(self, key):
+        with self._lock:
+            self._meta.pop(key, None)
+
+_local = _LocalStore()
+
+def _meta_key(namespace, result_id):
+    return f"{KEY_PREFIX}{namespace}:{result_id}:meta"
+
+def _page_key(namespace, result_id, page):
+    return f"{KEY_PREFIX}{namespace}:{result_id}:page:{page}"
+
+def put_meta(namespace, result_id, fields, ttl=RESULT_STORE_TTL):
+    """Merge fields into a result's metadata; values must be JSON serializable"""
+    key = _meta_key(namespace, result_id)
+    client = get_redis_client()
+    if client is not None and client.hset_many(key, {k: json.dumps(v) for k, v in fields.items()}, ttl):
+        return
+    _local.put_meta(key, fields, ttl)
+
+def get_meta(namespace, result_id):
+    """Return a result's metadata dict, or None if unknown or expired"""
+    key = _meta_key(namespace, result_id)
+    client = get_redis_client()
+    if client is not None:
+        raw = client.hgetall(key)
+        if raw:
+            return {k: json.loads(v) for k, v in raw.items()}
+    return _local.get_meta(key)
+
+def delete_meta(namespace, result_id):
+    key = _meta_key(namespace, result_id)
+    client = get_redis_client()
+    if client is not None:
+        client.delete(key)
+    _local.delete_meta(key)
+
+def put_page(namespace, result_id, page, rows_json, ttl=RESULT_STORE_TTL):
+    """Store one page of rows (a JSON array string), compressed"""
+    key = _page_key(namespace, result_id, page)
+    payload = zlib.compress(rows_json.encode('utf-8'))
+    client = get_redis_client()
+    if client is not None and client.set_bytes(key, payload, ttl):
+        return True
+    return _local.put_page(key, payload, ttl)
+
+def get_page(namespace, result_id, page):
+    """Return one stored page as a JSON array string, or None"""
+    key = _page_key(namespace, result_id, page)
+    client = get_redis_client()
+    payload = client.get_bytes(key) if client is not None else None
+    if payload is None:
+        payload = _local.get_page(key)
+    if payload is None:
+        return None
+    return zlib.decompress(payload).decode('utf-8')
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from dotenv import load_dotenv
+from db.db import query
+from utils.query_cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+SCHEMA_CATALOG_CHECK_INTERVAL = float(os.getenv("SCHEMA_CATALOG_CHECK_INTERVAL", "5"))  # seconds between version checks
+SCHEMA_CATALOG_ESTIMATES_TTL = float(os.getenv("SCHEMA_CATALOG_ESTIMATES_TTL", "300"))  # seconds before row estimates are re-read; 0 only on DDL
+SCHEMA_CATALOG_REDIS_TTL = 86400  # seconds
+
+REDIS_KEY = "schema:v2:catalog"
+VERSION_TABLE = "schema_catalog_version"  # bumped by the DDL event trigger in db/init.sql
+EVENT_TRIGGER = "schema_catalog_version_bump"
+
+TRACKED_SQL = f"""
+    SELECT EXISTS (
+        SELECT 1 FROM pg_event_trigger WHERE evtname = '{EVENT_TRIGGER}' AND evtenabled <> 'D'
+    ) AND to_regclass('public.{VERSION_TABLE}') IS NOT NULL AS tracked
+"""
+
+TRIGGER_VERSION_SQL = f"SELECT 'ddl:' || version AS version FROM {VERSION_TABLE}"
+
+# Without the event trigger, any DDL in public rewrites catalog rows and so changes their xmin
+CATALOG_VERSION_SQL = """
+    SELECT concat_ws(':', 'xmin',
+        (SELECT count(*) || '.' || coalesce(sum(c.xmin::text::bigint), 0)
+         FROM pg_class c WHERE c.relnamespace = 'public'::regnamespace),
+        (SELECT count(*) || '.' || coalesce(sum(a.xmin::text::bigint), 0)
+         FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid
+         WHERE c.relnamespace = 'public'::regnamespace),
+        (SELECT count(*) || '.' || coalesce(sum(d.xmin::text::bigint), 0)
+         FROM pg_attrdef d JOIN pg_class c ON c.oid = d.adrelid
+         WHERE c.relnamespace = 'public'::regnamespace),
+        (SELECT count(*) || '.' || coalesce(sum(con.xmin::text::bigint), 0)
+         FROM pg_constraint con WHERE con.connamespace = 'public'::regnamespace)
+    ) AS version
+"""
+
+# Every table in public with its columns, keys and indexes, in one round trip.
+# data_type follows information_schema.columns (character varying, ARRAY, USER-DEFINED);
+# format_type is the full declared type, such as character varying(50) or integer[].
+# Tables and columns are filtered by privilege as information_schema filters them.
+CATALOG_SQL = f"""
+    SELECT
+        c.relname AS name,
+        greatest(c.reltuples, 0)::bigint AS estimated_rows,
+        coalesce((
+            SELECT json_agg(json_build_object(
+                'column_name', a.attname,
+                'data_type', CASE
+                    WHEN coalesce(bt.typelem, t.typelem) <> 0 AND coalesce(bt.typlen, t.typlen) = -1 THEN 'ARRAY'
+                    WHEN coalesce(bt.typnamespace, t.typnamespace) = 'pg_catalog'::regnamespace
+                        THEN format_type(coalesce(bt.oid, t.oid), NULL)
+                    ELSE 'USER-DEFINED'
+                END,
+                'format_type', format_type(a.atttypid, a.atttypmod),
+                'is_nullable', CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END,
+                'column_default', pg_get_expr(d.adbin, d.adrelid)
+            ) ORDER BY a.attnum)
+            FROM pg_attribute a
+            JOIN pg_type t ON t.oid = a.atttypid
+            -- Domains report their base type
+            LEFT JOIN pg_type bt ON t.typtype = 'd' AND bt.oid = t.typbasetype
+            LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+            WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+                AND (pg_has_role(c.relowner, 'USAGE')
+                     OR has_column_privilege(c.oid, a.attnum, 'SELECT, INSERT, UPDATE, REFERENCES'))
+        ), '[]') AS columns,
+        coalesce((
+            SELECT json_agg(a.attname ORDER BY k.ord)
+            FROM pg_constraint con
+            CROSS JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+            JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+            WHERE con.conrelid = c.oid AND con.contype = 'p'
+        ), '[]') AS primary_keys,
+        coalesce((
+            SELECT json_agg(json_build_object(
+                'column_name', a.attname,
+                'foreign_table_name', fc.relname,
+                'foreign_column_name', fa.attname
+            ) ORDER BY con.conname, k.ord)
+            FROM pg_constraint con
+            CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(attnum, fattnum, ord)
+            JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+            JOIN pg_class fc ON fc.oid = con.confrelid
+            JOIN pg_attribute fa ON fa.attrelid = con.confrelid AND fa.attnum = k.fattnum
+            WHERE con.conrelid = c.oid AND con.contype = 'f'
+        ), '[]') AS foreign_keys,
+        coalesce((
+            SELECT json_agg(json_build_object(
+                'name', ic.relname,
+                'columns', (
+                    SELECT coalesce(json_agg(a.attname ORDER BY k.ord), '[]')
+                    FROM unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+                    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = k.attnum
+                ),
+                'unique', i.indisunique,
+                'primary', i.indisprimary
+            ) ORDER BY ic.relname)
+            FROM pg_index i
+            JOIN pg_class ic ON ic.oid = i.indexrelid
+            WHERE i.indrelid = c.oid
+        ), '[]') AS indexes
+    FROM pg_class c
+    WHERE c.relnamespace = 'public'::regnamespace
+        AND c.relkind IN ('r', 'p')
+        AND c.relname <> '{VERSION_TABLE}'
+        AND (pg_has_role(c.relowner, 'USAGE')
+             OR has_table_privilege(c.oid, 'SELECT, INSERT, UPDATE, DELETE, TRUNCATE, REFERENCES, TRIGGER')
+             OR has_any_column_privilege(c.oid, 'SELECT, INSERT, UPDATE, REFERENCES'))
+    ORDER BY c.relname
+"""
+
+# reltuples moves with VACUUM and ANALYZE, which are not DDL and do not bump the version
+ESTIMATES_SQL = f"""
+    SELECT c.relname AS name, greatest(c.reltuples, 0)::bigint AS estimated_rows
+    FROM pg_class c
+    WHERE c.relnamespace = 'public'::regnamespace
+        AND c.relkind IN ('r', 'p')
+        AND c.relname <> '{VERSION_TABLE}'
+"""
+
+_lock = threading.Lock()
+_catalog = None  # {'version': str, 'estimatedAt': epoch seconds, 'tables': {name: table}}
+_next_check = 0.0
+_tracked = None  # whether the DDL event trigger is installed
+_payload = None  # (catalog, etag, body) for the last catalog served by get_catalog_payload
+
+def get_catalog():
+    """Return the cached schema catalog, reloading it when the catalog version changed
+
+    Only one thread checks the version at a time; the others keep serving the
+    cached catalog meanwhile.
+    """
+    catalog = _catalog
+    if catalog is not None and time.monotonic() < _next_check:
+        return catalog
+    if not _lock.acquire(blocking=catalog is None):
+        return catalog
+    try:
+        return _refresh()
+    except Exception as e:
+        if catalog is None:
+            raise
+        logger.error(f"Schema catalog refresh failed, serving cached catalog: {str(e)}")
+        return catalog
+    finally:
+        _lock.release()
+
+def get_catalog_payload():
+    """Return (etag, compact JSON body) of the whole catalog, serialized once per version"""
+    global _payload
+    catalog = get_catalog()
+    payload = _payload
+    if payload is None or payload[0] is not catalog:
+        body = json.dumps({
+            'version': catalog['version'],
+            'tables': list(catalog['tables'].values()),
+        }, separators=(',', ':'))
+        etag = '"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+        payload = _payload = (catalog, etag, body)
+    return payload[1], payload[2]
+
+def get_table(name):
+    """Return one table's catalog entry, or None if it does not exist"""
+    return get_catalog()['tables'].get(name)
+
+def invalidate():
+    """Force a version check on the next request"""
+    global _next_check
+    _next_check = 0.0
+
+def _refresh():
+    global _catalog, _next_check, _tracked
+    if _catalog is not None and time.monotonic() < _next_check:
+        return _catalog
+
+    version = _current_version()
+    if _catalog is None or _catalog['version'] != version:
+        catalog = _load_from_redis(version)
+        if catalog is None:
+            _tracked = None  # the trigger may have been installed since
+            started = time.perf_counter()
+            catalog = _load_from_database(version)
+            logger.info(f"Loaded schema catalog {version} ({len(catalog['tables'])} tables) in {(time.perf_counter() - started) * 1000:.1f} ms")
+            _store_in_redis(catalog)
+        _catalog = catalog
+    if 0 < SCHEMA_CATALOG_ESTIMATES_TTL <= time.time() - _catalog.get('estimatedAt', 0):
+        _catalog = _with_fresh_estimates(_catalog)
+        _store_in_redis(_catalog)
+    _next_check = time.monotonic() + SCHEMA_CATALOG_CHECK_INTERVAL
+    return _catalog
+
+def _current_version():
+    global _tracked
+    if _tracked is None:
+        _tracked = bool(query(TRACKED_SQL)[0]['tracked'])
+        if not _tracked:
+            logger.info("Schema DDL event trigger not installed, versioning the catalog by xmin")
+    if _tracked:
+        result = query(TRIGGER_VERSION_SQL)
+        if result:
+            return result[0]['version']
+    return query(CATALOG_VERSION_SQL)[0]['version']
+
+def _load_from_database(version):
+    tables = {}
+    for row in query(CATALOG_SQL):
+        tables[row['name']] = {
+            'name': row['name'],
+            'estimatedRows': row['estimated_rows'],
+            'columns': row['columns'],
+            'primaryKeys': row['primary_keys'],
+            'foreignKeys': row['foreign_keys'],
+            'indexes': row['indexes'],
+        }
+    return {'version': version, 'estimatedAt': time.time(), 'tables': tables}
+
+def _with_fresh_estimates(catalog):
+    """Copy of the catalog with current row estimates; the version is unchanged"""
+    estimates = {row['name']: row['estimated_rows'] for row in query(ESTIMATES_SQL)}
+    tables = {
+        name: dict(table, estimatedRows=estimates.get(name, table['estimatedRows']))
+        for name, table in catalog['tables'].items()
+    }
+    return {'version': catalog['version'], 'estimatedAt': time.time(), 'tables': tables}
+
+def _load_from_redis(version):
+    client = get_redis_client()
+    if client is None:
+        return None
+    payload = client.get_bytes(REDIS_KEY)
+    if not payload:
+        return None
+    try:
+        catalog = json.loads(zlib.decompress(payload))
+    except Exception as e:
+        logger.error(f"Discarding corrupt schema catalog in Redis: {str(e)}")
+        return None
+    return catalog if catalog.get('version') == version else None
+
+def _store_in_redis(catalog):
+    client = get_redis_client()
+    if client is not None:
+        client.set_bytes(REDIS_KEY, zlib.compress(json.dumps(catalog).encode('utf-8')), SCHEMA_CATALOG_REDIS_TTL)
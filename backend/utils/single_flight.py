@@ -0,0 +1,176 @@
+import os
+import time
+import uuid
+import zlib
+import logging
+import threading
+import psycopg2
+from psycopg2 import errors as pg_errors
+from dotenv import load_dotenv
+from utils.query_cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+# Coalescing across gunicorn workers needs Redis, so it is opt-in
+SINGLE_FLIGHT_DISTRIBUTED = os.getenv("SINGLE_FLIGHT_DISTRIBUTED", "false").lower() == "true"
+SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT", "110"))  # seconds a follower waits
+SINGLE_FLIGHT_LOCK_TTL = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL", "120"))  # seconds a leader holds the Redis lock
+SINGLE_FLIGHT_RESULT_TTL = 30  # seconds the shared result stays readable for late followers
+
+LOCK_PREFIX = "sf:v1:lock:"
+RESULT_PREFIX = "sf:v1:result:"
+CHANNEL_PREFIX = "sf:v1:done:"
+
+# Delete the lock only if this leader still owns it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class SharedQueryError(Exception):
+    """The leading execution of a coalesced query failed"""
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+def _shareable(error):
+    """Whether followers may be handed the leader's error instead of running the query
+
+    Only errors the SQL itself causes are; a cancelled or timed-out leader, or a
+    lost connection, says nothing about how a follower's own run would go.
+    """
+    if isinstance(error, SharedQueryError):
+        return True
+    return isinstance(error, psycopg2.Error) and not isinstance(
+        error, (pg_errors.QueryCanceled, psycopg2.OperationalError, psycopg2.InterfaceError)
+    )
+
+def do(key, fn):
+    """Run fn once per key across concurrent callers and share its result
+
+    Returns (result, shared) where shared is True when the result came from
+    another caller's execution. fn must return a JSON string. SQL errors are
+    shared too; if the leader was cancelled or lost its connection, followers
+    run fn themselves.
+    """
+    if not SINGLE_FLIGHT_ENABLED:
+        return fn(), False
+
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _Call()
+            _calls[key] = call
+
+    if not leader:
+        if not call.done.wait(SINGLE_FLIGHT_WAIT_TIMEOUT):
+            logger.warning(f"Timed out waiting for in-flight query {key}, running it directly")
+            return fn(), False
+        if call.error is not None:
+            if not _shareable(call.error):
+                return fn(), False
+            raise call.error
+        return call.result, True
+
+    try:
+        call.result, shared = _do_across_workers(key, fn)
+        return call.result, shared
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+def _do_across_workers(key, fn):
+    """Coalesce with other gunicorn workers through a Redis lock and pub/sub"""
+    client = get_redis_client() if SINGLE_FLIGHT_DISTRIBUTED else None
+    if client is None:
+        return fn(), False
+
+    token = uuid.uuid4().hex
+    lock_key = LOCK_PREFIX + key
+    if client.set_if_absent(lock_key, token, SINGLE_FLIGHT_LOCK_TTL * 1000):
+        return _lead(client, key, lock_key, token, fn), False
+
+    shared = _follow(client, key)
+    if shared is not None:
+        return shared, True
+    return fn(), False
+
+def _lead(client, key, lock_key, token, fn):
+    result_key = f"{RESULT_PREFIX}{key}:{token}"
+    try:
+        result = fn()
+    except Exception as e:
+        # Followers that find no result once the lock is released run the query themselves
+        if _shareable(e):
+            client.set_bytes(result_key, b'E' + str(e).encode('utf-8'), SINGLE_FLIGHT_RESULT_TTL)
+        client.publish(CHANNEL_PREFIX + key, token)
+        raise
+    else:
+        client.set_bytes(result_key, b'R' + zlib.compress(result.encode('utf-8')), SINGLE_FLIGHT_RESULT_TTL)
+        client.publish(CHANNEL_PREFIX + key, token)
+        return result
+    finally:
+        client.run_script(RELEASE_SCRIPT, keys=[lock_key], args=[token])
+
+def _follow(client, key):
+    """Wait for another worker's leader; returns None if we should run the query ourselves"""
+    lock_key = LOCK_PREFIX + key
+    token = client.get(lock_key)
+    if not token:
+        return None
+    # Results are keyed by the leader's token so an older run is never picked up
+    result_key = f"{RESULT_PREFIX}{key}:{token}"
+    pubsub = client.pubsub()
+    if pubsub is None:
+        return None
+    try:
+        pubsub.subscribe(CHANNEL_PREFIX + key)
+        deadline = time.monotonic() + SINGLE_FLIGHT_WAIT_TIMEOUT
+        while True:
+            # Checked after subscribing so a result published just before is not missed
+            shared = _read_result(client, result_key)
+            if shared is not None:
+                return shared
+            if client.get(lock_key) != token:
+                # Leader released the lock; its result may have landed in between
+                return _read_result(client, result_key)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Timed out waiting for query {key} in another worker, running it directly")
+                return None
+            pubsub.get_message(timeout=min(remaining, 1.0))
+    except SharedQueryError:
+        raise
+    except Exception as e:
+        logger.error(f"Single-flight wait failed for {key}: {str(e)}")
+        return None
+    finally:
+        try:
+            pubsub.close()
+        except Exception:
+            pass
+
+def _read_result(client, result_key):
+    payload = client.get_bytes(result_key)
+    if not payload:
+        return None
+    if payload[:1] == b'E':
+        raise SharedQueryError(payload[1:].decode('utf-8'))
+    return zlib.decompress(payload[1:]).decode('utf-8')
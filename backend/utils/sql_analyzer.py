@@ -0,0 +1,406 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+SQL_ANALYSIS_CACHE_SIZE = int(os.getenv("SQL_ANALYSIS_CACHE_SIZE", "4096"))
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>[Ee]'(?:[^'\\]|\\.|'')*'|'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*")
+  | (?P<dollar>\$(?P<tag>[A-Za-z_]\w*)?\$.*?\$(?P=tag)?\$)
+  | (?P<space>\s+)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_\u0080-\uffff][\w$\u0080-\uffff]*)
+  | (?P<param>\$\d+|%s|%\(\w+\)s)
+  | (?P<op>::|<=|>=|<>|!=|\|\||.)
+""", re.S | re.X)
+
+# Statements that only read
+READ_STATEMENTS = {'select', 'with', 'values', 'table', 'show'}
+# Statements that can run in a cursor or COPY (...); SHOW and EXPLAIN cannot
+CURSOR_STATEMENTS = {'select', 'with', 'values', 'table'}
+MODIFYING_STATEMENTS = {'insert', 'update', 'delete', 'merge'}
+EXPLAIN_OPTIONS = {'analyze', 'analyse', 'verbose'}
+
+# Functions that write, signal other backends or change session settings
+WRITE_FUNCTIONS = {
+    'nextval', 'setval', 'set_config', 'pg_terminate_backend', 'pg_cancel_backend', 'pg_reload_conf',
+    'pg_rotate_logfile', 'pg_switch_wal', 'pg_promote', 'pg_create_restore_point', 'lo_import', 'lo_export',
+    'lo_unlink', 'lo_create', 'lo_from_bytea', 'lo_put', 'pg_advisory_lock', 'pg_advisory_xact_lock',
+    'pg_try_advisory_lock', 'pg_try_advisory_xact_lock', 'dblink', 'dblink_exec', 'pg_file_write',
+    'pg_read_file', 'pg_read_binary_file', 'pg_ls_dir', 'txid_current', 'pg_current_xact_id', 'pg_notify',
+    # These run SQL passed in as a string, which the checks here never see
+    'query_to_xml', 'query_to_xmlschema', 'query_to_xml_and_xmlschema', 'cursor_to_xml', 'cursor_to_xmlschema',
+    'table_to_xml', 'table_to_xmlschema', 'table_to_xml_and_xmlschema', 'schema_to_xml', 'schema_to_xmlschema',
+    'schema_to_xml_and_xmlschema', 'database_to_xml', 'database_to_xmlschema', 'database_to_xml_and_xmlschema',
+}
+
+# Words that make a result depend on more than the data it reads
+VOLATILE_WORDS = {
+    'random', 'now', 'clock_timestamp', 'statement_timestamp', 'timeofday', 'nextval', 'setval', 'txid_current',
+    'current_date', 'current_time', 'current_timestamp', 'localtime', 'localtimestamp', 'gen_random_uuid',
+    'pg_sleep', 'pg_current_xact_id', 'uuid_generate_v4',
+}
+
+# Reserved and clause words that are never column names
+KEYWORDS = {
+    'all', 'and', 'any', 'array', 'as', 'asc', 'asymmetric', 'between', 'both', 'by', 'case', 'cast', 'collate',
+    'cross', 'current_date', 'current_time', 'current_timestamp', 'current_user', 'default', 'desc', 'distinct',
+    'do', 'else', 'end', 'except', 'exists', 'false', 'fetch', 'filter', 'first', 'following', 'for', 'from',
+    'full', 'group', 'having', 'ilike', 'in', 'inner', 'intersect', 'interval', 'into', 'is', 'isnull', 'join',
+    'last', 'lateral', 'leading', 'left', 'like', 'limit', 'localtime', 'localtimestamp', 'materialized',
+    'natural', 'next', 'not', 'notnull', 'null', 'nulls', 'offset', 'on', 'only', 'or', 'order', 'ordinality',
+    'outer', 'over', 'partition', 'preceding', 'range', 'recursive', 'right', 'row', 'rows', 'select',
+    'session_user', 'similar', 'some', 'symmetric', 'table', 'tablesample', 'then', 'ties', 'to', 'trailing',
+    'true', 'unbounded', 'union', 'unknown', 'using', 'values', 'when', 'where', 'window', 'with', 'within',
+    'without', 'zone', 'precision', 'varying', 'time', 'timestamp', 'date', 'current', 'escape', 'groups',
+    'exclude', 'others', 'no', 'key', 'share', 'update', 'nowait', 'skip', 'locked', 'of', 'repeatable',
+    'bernoulli', 'system', 'explain', 'analyze', 'analyse', 'verbose', 'show', 'user', 'percent', 'insert',
+    'delete', 'merge', 'returning',
+}
+
+# Words that end a FROM/JOIN table list
+FROM_LIST_END = {
+    'where', 'group', 'having', 'order', 'limit', 'offset', 'fetch', 'for', 'window', 'union', 'intersect',
+    'except', 'on', 'using', 'join', 'inner', 'left', 'right', 'full', 'cross', 'natural', 'returning',
+    'tablesample', 'into',
+}
+
+class SqlAnalysis:
+    """Parsed facts about one query text, shared by the cache, admission and history layers
+
+    tables are the relations read (CTE names excluded); columns are a best
+    effort, qualified as table.column when the qualifier could be resolved.
+    """
+
+    __slots__ = ('fingerprint', 'normalized', 'statement_type', 'statement_count', 'read_only', 'reason',
+                 'tables', 'columns', 'deterministic')
+
+    def __init__(self, fingerprint, normalized, statement_type, statement_count, read_only, reason,
+                 tables, columns, deterministic):
+        self.fingerprint = fingerprint
+        self.normalized = normalized
+        self.statement_type = statement_type
+        self.statement_count = statement_count
+        self.read_only = read_only
+        self.reason = reason
+        self.tables = tables
+        self.columns = columns
+        self.deterministic = deterministic
+
+_cache_lock = threading.Lock()
+_by_text = OrderedDict()  # raw SQL -> SqlAnalysis
+_by_fingerprint = OrderedDict()  # fingerprint -> SqlAnalysis
+
+def analyze(sql):
+    """Return the SqlAnalysis for a query, cached by text and by fingerprint"""
+    with _cache_lock:
+        analysis = _by_text.get(sql)
+        if analysis is not None:
+            _by_text.move_to_end(sql)
+            return analysis
+
+    normalized, tokens = tokenize(sql)
+    statements = split_statements(tokens)
+    tables, columns = extract_references(tokens)
+    fingerprint = hashlib.sha256((normalized + '\x00' + ','.join(tables)).encode('utf-8')).hexdigest()
+
+    with _cache_lock:
+        analysis = _by_fingerprint.get(fingerprint)
+        if analysis is None:
+            analysis = _classify(fingerprint, normalized, statements, tables, columns)
+            _remember(_by_fingerprint, fingerprint, analysis)
+        else:
+            _by_fingerprint.move_to_end(fingerprint)
+        _remember(_by_text, sql, analysis)
+    return analysis
+
+def _remember(cache, key, analysis):
+    cache[key] = analysis
+    if len(cache) > SQL_ANALYSIS_CACHE_SIZE:
+        cache.popitem(last=False)
+
+def tokenize(sql):
+    """Return (normalized sql, significant tokens) for a query
+
+    Normalizing replaces comments with whitespace, collapses whitespace and
+    lowercases everything outside quotes. Tokens are (kind, value) pairs with
+    words lowercased and quoted identifiers unquoted.
+    """
+    parts = []
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ('comment', 'space'):
+            # A comment separates tokens like whitespace does: x/**/y is not xy
+            if parts and parts[-1] != ' ':
+                parts.append(' ')
+            continue
+        text = match.group(0)
+        if kind in ('word', 'op'):
+            text = text.lower()
+        parts.append(text)
+        if kind == 'ident':
+            tokens.append(('ident', text[1:-1].replace('""', '"')))
+        elif kind == 'dollar':
+            tokens.append(('string', text))
+        else:
+            tokens.append((kind, text))
+    normalized = ''.join(parts).strip()
+    return normalized.rstrip(';').strip(), tokens
+
+def strip_statement(sql):
+    """Return sql up to its last significant token, dropping trailing semicolons and comments
+
+    The result can be wrapped in a subquery or COPY (...) without a trailing
+    -- comment or ; swallowing the closing parenthesis.
+    """
+    end = 0
+    for match in TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ('comment', 'space') or (kind == 'op' and match.group(0) == ';'):
+            continue
+        end = match.end()
+    return sql[:end]
+
+def runs_in_cursor(analysis):
+    """Whether a read-only query can be streamed, paged or exported (not SHOW or EXPLAIN)"""
+    return analysis.statement_type in CURSOR_STATEMENTS
+
+def split_statements(tokens):
+    """Split tokens on top-level semicolons, dropping empty statements"""
+    statements = [[]]
+    for token in tokens:
+        if token == ('op', ';'):
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    return [statement for statement in statements if statement]
+
+def _classify(fingerprint, normalized, statements, tables, columns):
+    statement_type = None
+    reason = None
+    if not statements:
+        reason = 'Query is empty'
+    else:
+        statement_type = _leading_word(statements[0])
+        if len(statements) > 1:
+            reason = 'Only one statement per query is allowed'
+        else:
+            reason = _read_only_violation(statements[0])
+    words = {value for statement in statements for kind, value in statement if kind == 'word'}
+    return SqlAnalysis(
+        fingerprint=fingerprint,
+        normalized=normalized,
+        statement_type=statement_type,
+        statement_count=len(statements),
+        read_only=reason is None,
+        reason=reason,
+        tables=tables,
+        columns=columns,
+        deterministic=not (words & VOLATILE_WORDS),
+    )
+
+def _leading_word(tokens):
+    for kind, value in tokens:
+        if kind == 'word':
+            return value
+        if value != '(':
+            return None
+    return None
+
+def _read_only_violation(tokens):
+    """Return why a single statement is not read-only, or None"""
+    start = 0
+    while start < len(tokens) and tokens[start] == ('op', '('):
+        start += 1
+    if start >= len(tokens):
+        return 'Query is empty'
+    first = tokens[start][1]
+    if first == 'explain':
+        # EXPLAIN ANALYZE runs the statement, so check what it explains
+        i = start + 1
+        if i < len(tokens) and tokens[i] == ('op', '('):
+            i = _skip_parens(tokens, i)
+        while i < len(tokens) and tokens[i][0] == 'word' and tokens[i][1] in EXPLAIN_OPTIONS:
+            i += 1
+        return _read_only_violation(tokens[i:])
+    if first not in READ_STATEMENTS:
+        return f"Only SELECT queries are allowed, found {first.upper()}"
+
+    depth = 0
+    for i, (kind, value) in enumerate(tokens):
+        if kind == 'op':
+            if value == '(':
+                depth += 1
+            elif value == ')':
+                depth -= 1
+            continue
+        following = tokens[i + 1] if i + 1 < len(tokens) else (None, None)
+        if kind == 'ident' and value.lower() in WRITE_FUNCTIONS and following == ('op', '('):
+            # "set_config"(...) calls the same function as set_config(...)
+            return f"Function {value.lower()} is not allowed"
+        if kind != 'word':
+            continue
+        if value == 'into' and depth == 0:
+            return 'SELECT INTO is not allowed'
+        if value == 'for' and following[1] in ('update', 'share', 'no', 'key'):
+            # Also inside subqueries and CTEs, which lock rows just the same
+            return 'Row locking clauses are not allowed'
+        if value in WRITE_FUNCTIONS and following == ('op', '('):
+            return f"Function {value} is not allowed"
+        if value == 'as':
+            body = _cte_body_word(tokens, i)
+            if body in MODIFYING_STATEMENTS:
+                return f"Data-modifying {body.upper()} inside WITH is not allowed"
+    return None
+
+def _cte_body_word(tokens, i):
+    """First word of a CTE body when tokens[i] is the AS of a WITH item"""
+    j = i + 1
+    if j < len(tokens) and tokens[j] == ('word', 'not'):
+        j += 1
+    if j < len(tokens) and tokens[j] == ('word', 'materialized'):
+        j += 1
+    if j >= len(tokens) or tokens[j] != ('op', '('):
+        return None
+    while j < len(tokens) and tokens[j] == ('op', '('):
+        j += 1
+    return tokens[j][1] if j < len(tokens) and tokens[j][0] == 'word' else None
+
+def _skip_parens(tokens, i):
+    """Index just past the parenthesis group starting at tokens[i]"""
+    depth = 0
+    while i < len(tokens):
+        if tokens[i] == ('op', '('):
+            depth += 1
+        elif tokens[i] == ('op', ')'):
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+def _is_name(token):
+    return token[0] == 'ident' or (token[0] == 'word' and token[1] not in KEYWORDS)
+
+def _qualified_name(tokens, i):
+    """Read a dotted name at tokens[i]; returns (parts, next index)"""
+    parts = [tokens[i][1]]
+    i += 1
+    while i + 1 < len(tokens) and tokens[i] == ('op', '.') and tokens[i + 1][0] in ('word', 'ident'):
+        parts.append(tokens[i + 1][1])
+        i += 2
+    return parts, i
+
+def extract_references(tokens):
+    """Return (tables, columns) referenced by a statement, both sorted tuples"""
+    ctes = set()
+    tables = set()
+    aliases = {}  # alias or table name -> table
+    consumed = set()  # token indexes that name tables, aliases or CTEs
+    calls = []  # per open parenthesis: True when it is a function call
+
+    for i, (kind, value) in enumerate(tokens):
+        if (kind, value) == ('op', '('):
+            previous = tokens[i - 1] if i else (None, None)
+            calls.append(previous[0] == 'ident' or (previous[0] == 'word' and previous[1] not in KEYWORDS))
+        elif (kind, value) == ('op', ')'):
+            if calls:
+                calls.pop()
+        elif kind == 'word' and value == 'as' and _cte_body_word(tokens, i) is not None:
+            name_index = i - 1
+            if name_index >= 0 and tokens[name_index] == ('op', ')'):
+                # WITH name(col, ...) AS: step back over the column list
+                depth = 0
+                while name_index >= 0:
+                    if tokens[name_index] == ('op', ')'):
+                        depth += 1
+                    elif tokens[name_index] == ('op', '('):
+                        depth -= 1
+                        if depth == 0:
+                            break
+                    name_index -= 1
+                name_index -= 1
+            if name_index >= 0 and tokens[name_index][0] in ('word', 'ident'):
+                ctes.add(tokens[name_index][1])
+                consumed.add(name_index)
+        elif kind == 'word' and value in ('from', 'join') and not (calls and calls[-1]):
+            # FROM inside extract(), substring() and friends is not a table list
+            _read_table_list(tokens, i + 1, value == 'from', tables, aliases, consumed)
+
+    tables -= ctes
+    columns = set()
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        if i in consumed or kind not in ('word', 'ident') or (kind == 'word' and value in KEYWORDS):
+            i += 1
+            continue
+        previous = tokens[i - 1] if i else (None, None)
+        parts, end = _qualified_name(tokens, i)
+        following = tokens[end] if end < len(tokens) else (None, None)
+        skip = (
+            following == ('op', '(')  # function call
+            or previous in (('word', 'as'), ('op', '::'), ('op', '.'))  # alias, type or star qualifier
+            or following[0] == 'string'  # typed literal such as date '2024-01-01'
+            or (end < len(tokens) - 1 and following == ('op', '.'))  # qualified star
+        )
+        if not skip:
+            column = parts[-1]
+            qualifier = '.'.join(parts[:-1])
+            if qualifier:
+                columns.add(f"{aliases.get(qualifier, qualifier)}.{column}")
+            elif column not in aliases and column not in ctes:
+                columns.add(column)
+        i = end
+    return tuple(sorted(tables)), tuple(sorted(columns))
+
+def _read_table_list(tokens, i, comma_list, tables, aliases, consumed):
+    while i < len(tokens):
+        while i < len(tokens) and tokens[i] in (('word', 'only'), ('word', 'lateral')):
+            i += 1
+        if i >= len(tokens):
+            return
+        table = None
+        if tokens[i] == ('op', '('):
+            # Subquery or parenthesized join; its own FROM is read separately
+            i = _skip_parens(tokens, i)
+        elif _is_name(tokens[i]):
+            start = i
+            parts, i = _qualified_name(tokens, i)
+            if i < len(tokens) and tokens[i] == ('op', '('):
+                # Set-returning function such as generate_series(...)
+                i = _skip_parens(tokens, i)
+            else:
+                table = '.'.join(parts)
+                tables.add(table)
+                aliases[parts[-1]] = table
+                consumed.update(range(start, i))
+        else:
+            return
+
+        if i < len(tokens) and tokens[i] == ('word', 'as'):
+            i += 1
+        if i < len(tokens) and _is_name(tokens[i]) and tokens[i][1] not in FROM_LIST_END:
+            alias = tokens[i][1]
+            aliases[alias] = table or alias
+            consumed.add(i)
+            i += 1
+            if i < len(tokens) and tokens[i] == ('op', '('):
+                # Column alias list: AS t(a, b)
+                consumed.update(range(i, _skip_parens(tokens, i)))
+                i = _skip_parens(tokens, i)
+        if not (comma_list and i < len(tokens) and tokens[i] == ('op', ',')):
+            return
+        i += 1
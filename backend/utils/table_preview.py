@@ -0,0 +1,99 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from psycopg2 import sql
+from dotenv import load_dotenv
+from db.db import query
+from utils import schema_catalog
+from utils.table_stats import get_table_stats
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+PREVIEW_ROWS = int(os.getenv("PREVIEW_ROWS", "5"))
+PREVIEW_MAX_VALUE_CHARS = int(os.getenv("PREVIEW_MAX_VALUE_CHARS", "200"))  # longer values are cut
+PREVIEW_MAX_BYTES = int(os.getenv("PREVIEW_MAX_BYTES", str(16 * 1024)))  # JSON budget per preview
+PREVIEW_FULL_SCAN_ROWS = 10000  # tables estimated below this are read without sampling
+PREVIEW_SAMPLE_TARGET_ROWS = 1000  # rows the sample aims for, so LIMIT has some to pick from
+PREVIEW_CACHE_SIZE = 1024
+
+TRUNCATION_MARK = '…'
+
+# Variable-length types that can hold large (TOASTed) values
+WIDE_TYPE_PREFIXES = ('text', 'character', 'json', 'bytea', 'xml', 'tsvector')
+
+_lock = threading.Lock()
+_previews = OrderedDict()  # table -> ((catalog version, n_mod_since_analyze, analyzed_at), rows)
+
+def get_preview(table):
+    """Return a few sample rows for a catalog table entry, cached until its stats or the schema change"""
+    name = table['name']
+    stats = get_table_stats(name)
+    # The catalog version moves with DDL, which can change the columns without touching the stats
+    version = schema_catalog.get_catalog()['version']
+    stamp = (version, stats['n_mod_since_analyze'], stats['analyzed_at']) if stats else (version, None, None)
+    with _lock:
+        entry = _previews.get(name)
+        if entry is not None and entry[0] == stamp:
+            _previews.move_to_end(name)
+            return entry[1]
+
+    rows = _sample(table)
+    with _lock:
+        _previews[name] = (stamp, rows)
+        _previews.move_to_end(name)
+        if len(_previews) > PREVIEW_CACHE_SIZE:
+            _previews.popitem(last=False)
+    return rows
+
+def _select_list(columns):
+    items = []
+    for column in columns:
+        identifier = sql.Identifier(column['column_name'])
+        # format_type keeps array brackets, which data_type reports as ARRAY
+        data_type = column.get('format_type') or column['data_type']
+        if data_type.startswith(WIDE_TYPE_PREFIXES) or data_type.endswith('[]') or data_type == 'ARRAY':
+            # Cut wide values in the database so they never cross the wire in full
+            items.append(sql.SQL("left({}::text, {}) AS {}").format(
+                identifier, sql.Literal(PREVIEW_MAX_VALUE_CHARS + 1), identifier
+            ))
+        else:
+            items.append(identifier)
+    return sql.SQL(', ').join(items)
+
+def _sample(table):
+    select_list = _select_list(table['columns'])
+    relation = sql.Identifier(table['name'])
+    rows = None
+    estimated_rows = table.get('estimatedRows') or 0
+    if estimated_rows > PREVIEW_FULL_SCAN_ROWS:
+        # SYSTEM samples whole pages, so it never reads most of a large table
+        percent = min(100.0, 100.0 * PREVIEW_SAMPLE_TARGET_ROWS / estimated_rows)
+        rows = query(
+            sql.SQL("SELECT {} FROM {} TABLESAMPLE SYSTEM (%s) LIMIT %s").format(select_list, relation),
+            (percent, PREVIEW_ROWS)
+        )
+    if not rows:
+        rows = query(sql.SQL("SELECT {} FROM {} LIMIT %s").format(select_list, relation), (PREVIEW_ROWS,))
+    return _fit_budget(rows or [])
+
+def _fit_budget(rows):
+    """Truncate long strings and drop rows that would exceed the byte budget"""
+    preview = []
+    used = 0
+    for row in rows:
+        row = {
+            key: value[:PREVIEW_MAX_VALUE_CHARS] + TRUNCATION_MARK
+            if isinstance(value, str) and len(value) > PREVIEW_MAX_VALUE_CHARS else value
+            for key, value in row.items()
+        }
+        size = len(json.dumps(row, default=str))
+        if preview and used + size > PREVIEW_MAX_BYTES:
+            break
+        preview.append(row)
+        used += size
+    return preview
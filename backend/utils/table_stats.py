@@ -0,0 +1,43 @@
+import os
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+from db.db import query
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+TABLE_STATS_INTERVAL = float(os.getenv("TABLE_STATS_INTERVAL", "10"))  # seconds between pg_stat_user_tables reads
+
+STATS_SQL = """
+    SELECT
+        relname,
+        n_mod_since_analyze,
+        greatest(last_analyze, last_autoanalyze) AS analyzed_at
+    FROM pg_stat_user_tables
+    WHERE schemaname = 'public'
+"""
+
+_lock = threading.Lock()
+_stats = {}
+_expires_at = 0.0
+
+def get_table_stats(name):
+    """Return {'n_mod_since_analyze', 'analyzed_at'} for a table, or None
+
+    Statistics for all tables are read in one query and reused for
+    TABLE_STATS_INTERVAL seconds.
+    """
+    global _stats, _expires_at
+    if time.monotonic() >= _expires_at and _lock.acquire(blocking=False):
+        try:
+            _stats = {row['relname']: row for row in query(STATS_SQL)}
+        except Exception as e:
+            logger.error(f"Could not read table statistics: {str(e)}")
+        finally:
+            _expires_at = time.monotonic() + TABLE_STATS_INTERVAL
+            _lock.release()
+    return _stats.get(name)
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from utils.redis_client import redis_client, REDIS_BREAKER_PROBE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+TIERED_CACHE_L1_TTL = float(os.getenv("TIERED_CACHE_L1_TTL", "30"))  # seconds an entry is served from worker memory
+TIERED_CACHE_L1_MAX_BYTES = int(os.getenv("TIERED_CACHE_L1_MAX_BYTES", str(64 * 1024 * 1024)))  # per cache, per worker
+TIERED_CACHE_L1_MAX_ENTRY_SHARE = 0.1  # larger entries skip L1 so one result cannot flush it
+
+KEY_PREFIX = "tcache:v1:"
+CHANNEL = "tcache:v1:invalidate"  # messages are '<origin>\x00<cache name>\x00<key>'; an empty key clears the cache
+ALL_KEYS = ''
+
+_caches = {}  # name -> TieredCache, for the invalidation listener and stats
+_listener_lock = threading.Lock()
+_listener_thread = None
+_listener_pid = None
+
+class TieredCache:
+    """In-process LRU (L1) in front of Redis (L2)
+
+    L1 is bounded by the encoded size of its entries. Writes and invalidations
+    are broadcast over Redis pub/sub so every worker drops its L1 copy;
+    TIERED_CACHE_L1_TTL bounds staleness if a message is missed. Values must
+    round-trip through dumps/loads (JSON by default). sizeof measures an
+    entry for the L1 budget and defaults to the encoded size.
+    """
+
+    def __init__(self, name, ttl, l1_ttl=TIERED_CACHE_L1_TTL, l1_max_bytes=TIERED_CACHE_L1_MAX_BYTES,
+                 dumps=None, loads=None, sizeof=None, redis_key=None):
+        self.name = name
+        self.ttl = ttl
+        self.l1_ttl = min(l1_ttl, ttl)
+        self.l1_max_bytes = l1_max_bytes
+        self.dumps = dumps or (lambda value: json.dumps(value, separators=(',', ':')).encode('utf-8'))
+        self.loads = loads or json.loads
+        self.sizeof = sizeof
+        self.redis_key = redis_key or (lambda key: f"{KEY_PREFIX}{name}:{key}")
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _caches[name] = self
+
+    def get(self, key):
+        """Return the cached value, or None on a miss in both tiers"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.l1_hits += 1
+                    return entry[1]
+                self._drop(key)
+
+        _ensure_listener()
+        payload = self._l2_get(key) if redis_client.available() else None
+        if payload is not None:
+            try:
+                value = self.loads(payload)
+            except Exception as e:
+                logger.error(f"Discarding corrupt {self.name} cache entry {key}: {str(e)}")
+                self._l2_delete(key)
+            else:
+                self.l2_hits += 1
+                self._remember(key, value, self.sizeof(value) if self.sizeof else len(payload))
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None, l2=True):
+        """Store a value in both tiers (only in this worker's L1 with l2=False)
+
+        Returns False when Redis did not take it.
+        """
+        payload = self.dumps(value) if l2 or not self.sizeof else None
+        self._remember(key, value, self.sizeof(value) if self.sizeof else len(payload), ttl)
+        stored = False
+        if l2 and redis_client.available():
+            stored = self._l2_set(key, payload, ttl or self.ttl)
+            # Other workers may hold an older value for this key
+            _publish(self.name, key)
+        return stored
+
+    def invalidate(self, key=ALL_KEYS, l2=True):
+        """Drop a key (or, without one, every key) from every worker's L1, and from Redis unless l2=False"""
+        self._forget(key)
+        if l2 and key != ALL_KEYS and redis_client.available():
+            self._l2_delete(key)
+        _publish(self.name, key)
+
+    def stats(self):
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'maxBytes': self.l1_max_bytes,
+            'l1Hits': self.l1_hits,
+            'l2Hits': self.l2_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'l1HitRatio': round(self.l1_hits / lookups, 4) if lookups else None,
+            # Share of the lookups that reached Redis and were answered there
+            'l2HitRatio': round(self.l2_hits / (self.l2_hits + self.misses), 4) if self.l2_hits + self.misses else None,
+            'hitRatio': round((self.l1_hits + self.l2_hits) / lookups, 4) if lookups else None,
+        }
+
+    # Redis tier; subclasses may store entries differently
+    def _l2_get(self, key):
+        return redis_client.get_bytes(self.redis_key(key))
+
+    def _l2_set(self, key, payload, ttl):
+        return redis_client.set_bytes(self.redis_key(key), payload, int(ttl))
+
+    def _l2_delete(self, key):
+        return redis_client.delete(self.redis_key(key))
+
+    def _remember(self, key, value, size, ttl=None):
+        if size > self.l1_max_bytes * TIERED_CACHE_L1_MAX_ENTRY_SHARE:
+            self._forget(key)
+            return
+        expires_at = time.monotonic() + min(self.l1_ttl, ttl or self.l1_ttl)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (expires_at, value, size)
+            self._bytes += size
+            while self._bytes > self.l1_max_bytes and len(self._entries) > 1:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _forget(self, key):
+        with self._lock:
+            if key == ALL_KEYS:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._drop(key)
+
+    def _drop(self, key):
+        # Caller holds self._lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+def stats():
+    """Per-cache tier hit ratios for this worker"""
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+def _origin():
+    # Identifies this worker, so it skips its own messages
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _publish(name, key):
+    if redis_client.available():
+        redis_client.publish(CHANNEL, f"{_origin()}\x00{name}\x00{key}")
+
+def _ensure_listener():
+    """Start the invalidation listener once per gunicorn worker"""
+    global _listener_thread, _listener_pid
+    if _listener_pid == os.getpid() and _listener_thread.is_alive():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid() and _listener_thread.is_alive():
+            return
+        _listener_thread = threading.Thread(target=_listen, name='tiered-cache-invalidation', daemon=True)
+        _listener_pid = os.getpid()
+        _listener_thread.start()
+
+def _listen():
+    while True:
+        pubsub = redis_client.pubsub() if redis_client.available() else None
+        if pubsub is None:
+            time.sleep(REDIS_BREAKER_PROBE_INTERVAL)
+            continue
+        try:
+            pubsub.subscribe(CHANNEL)
+            # Invalidations may have been missed while unsubscribed
+            for cache in list(_caches.values()):
+                cache._forget(ALL_KEYS)
+            origin = _origin()
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message is None or message.get('type') != 'message':
+                    continue
+                sender, name, key = message['data'].split('\x00', 2)
+                if sender == origin:
+                    continue
+                cache = _caches.get(name)
+                if cache is not None:
+                    cache._forget(key)
+        except Exception as e:
+            logger.warning(f"Cache invalidation listener lost its subscription: {str(e)}")
+            time.sleep(REDIS_BREAKER_PROBE_INTERVAL)
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
@@ -0,0 +1,152 @@
+import os
+import time
+import select
+import logging
+import threading
+from dotenv import load_dotenv
+from db.db import query, get_connection
+from utils.query_cache import get_redis_client
+from utils.tiered_cache import TieredCache
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "30"))  # seconds a version stamp or user is trusted locally
+AUTH_USER_REDIS_TTL = 3600  # seconds
+# Outlives every token (they expire after a day), so a lapsed stamp only costs a lookup
+AUTH_USER_VERSION_TTL = 2 * 24 * 3600  # seconds
+AUTH_USER_L1_MAX_BYTES = 4 * 1024 * 1024  # per cache, per worker
+
+VERSION_KEY = "auth:v1:user:{}:version"  # bumped whenever the user changes
+USER_KEY = "auth:v1:user:{}:{}"  # user id, version
+
+USER_SQL = "SELECT id, username, email, user_type FROM users WHERE id = %s"
+
+USER_CHANGED_CHANNEL = "user_changed"  # NOTIFY'd with the user id by the users_notify_changed trigger in db/init.sql
+USER_CHANGED_RETRY_DELAY = 5  # seconds before listening again after the connection drops
+
+# Claims a token must carry to stand in for the users row
+USER_CLAIMS = ('id', 'username', 'email', 'userType')
+
+# Version stamps are plain integers kept by INCR; users are JSON under their versioned key
+_versions = TieredCache(
+    'user-version', AUTH_USER_REDIS_TTL, l1_ttl=AUTH_USER_CACHE_TTL, l1_max_bytes=AUTH_USER_L1_MAX_BYTES,
+    loads=int, redis_key=VERSION_KEY.format
+)
+_users = TieredCache(
+    'user', AUTH_USER_REDIS_TTL, l1_ttl=AUTH_USER_CACHE_TTL, l1_max_bytes=AUTH_USER_L1_MAX_BYTES,
+    redis_key=lambda key: USER_KEY.format(*key.split(':'))
+)
+
+_listener_lock = threading.Lock()
+_listener_thread = None
+_listener_pid = None
+
+def get_version(user_id):
+    """Return the user's current version stamp; 0 until the user is first modified"""
+    _ensure_listener()
+    # Keys are strings so they match the ones in invalidation messages
+    version = _versions.get(str(user_id))
+    if version is None:
+        # Most users are never modified, so remember that too
+        version = 0
+        _versions.set(str(user_id), version, l2=False)
+    return version
+
+def bump_version(user_id):
+    """Invalidate every cached copy of a user; call after modifying the users row
+
+    Tokens issued before the bump stop being trusted for their claims and
+    fall back to a lookup under the new version. Other workers drop their
+    copy of the stamp through the tiered cache's invalidation messages.
+    """
+    client = get_redis_client()
+    version = client.incr(VERSION_KEY.format(user_id), AUTH_USER_VERSION_TTL) if client is not None else None
+    if version is None:
+        # Without Redis the bump can only reach this process
+        version = get_version(user_id) + 1
+    _versions.invalidate(str(user_id), l2=False)
+    _versions.set(str(user_id), version, l2=False)
+    return version
+
+def get_user(user_id, version=None):
+    """Return {'id', 'username', 'email', 'user_type'} for a user, or None if it does not exist"""
+    if version is None:
+        version = get_version(user_id)
+    key = f"{user_id}:{version}"
+    user = _users.get(key)
+    if user is not None:
+        return user
+
+    rows = query(USER_SQL, (user_id,))
+    if not rows:
+        return None
+    user = dict(rows[0])
+    _users.set(key, user)
+    return user
+
+def resolve(claims):
+    """Return the user behind a decoded token, preferring its claims
+
+    Claims are used as-is while their 'ver' matches the user's version stamp;
+    older or incomplete tokens are answered from the cache or the database.
+    """
+    version = get_version(claims['id'])
+    if claims.get('ver', 0) == version and all(claims.get(name) is not None for name in USER_CLAIMS):
+        return {
+            'id': claims['id'],
+            'username': claims['username'],
+            'email': claims['email'],
+            'user_type': claims['userType'],
+        }
+    return get_user(claims['id'], version)
+
+def _ensure_listener():
+    """Start the user change listener once per gunicorn worker"""
+    global _listener_thread, _listener_pid
+    if _listener_pid == os.getpid() and _listener_thread.is_alive():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid() and _listener_thread.is_alive():
+            return
+        _listener_thread = threading.Thread(target=_listen, name='user-change-listener', daemon=True)
+        _listener_pid = os.getpid()
+        _listener_thread.start()
+
+def _listen():
+    """Bump a user's version whenever the users trigger reports a change, however it was made
+
+    Every worker bumps, so a stamp may move by more than one per change; any
+    move is enough to stop trusting older tokens.
+    """
+    while True:
+        conn = None
+        try:
+            conn = get_connection()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {USER_CHANGED_CHANNEL}")
+            while True:
+                if not select.select([conn], [], [], 5.0)[0]:
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    payload = conn.notifies.pop(0).payload
+                    try:
+                        user_id = int(payload)
+                    except ValueError:
+                        # Anyone can NOTIFY this channel; only the trigger sends ids
+                        logger.debug(f"Ignoring {USER_CHANGED_CHANNEL} notification: {payload!r}")
+                        continue
+                    bump_version(user_id)
+        except Exception as e:
+            logger.warning(f"User change listener lost its connection: {str(e)}")
+            time.sleep(USER_CHANGED_RETRY_DELAY)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass